@@ -41,6 +41,11 @@ TEMP_RESULTS_DIR: Path = TEMP_DIR / "results"
 
 CLEAN_SPEC_REGION_NAME_PREFIX = "savgol_filter_raw_region_"
 
+# Cache dirs, relative to the destination dir
+CACHE_DIR_NAME = "cache"
+PROCESSED_SPECTRA_CACHE_DIR_NAME = "processed_spectra"
+FIT_RESULTS_CACHE_DIR_NAME = "fit_results"
+
 ERROR_MSG_TEMPLATE = "{sample_group} {sampleid}: {msg}"
 
 
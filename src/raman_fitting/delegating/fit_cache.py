@@ -0,0 +1,205 @@
+"""On-disk cache of the fit results, so that an unchanged dataset is not refitted"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import lmfit
+import numpy as np
+from lmfit.model import Model as LMFitModel, ModelResult
+from pydantic import BaseModel
+
+from loguru import logger
+
+from raman_fitting.models.fit_models import SpectrumFitModel
+from raman_fitting.processing.spectrum_cache import (
+    get_spectrum_content_hash,
+    hash_json,
+)
+
+# increase when the fitting changes in a way that is not part of the model definition
+FIT_CACHE_VERSION = 1
+FIT_CACHE_FILE_SUFFIX = ".json"
+DEFAULT_FIT_CACHE_MAX_SIZE = 256 * 2**20  # bytes
+# the hashes of the spectrum and of the definition after the model name in the key
+KEY_HASHES_PATTERN = "_[0-9a-f]{32}_[0-9a-f]{16}"
+
+
+def get_model_definition(model: LMFitModel) -> Dict[str, Any]:
+    """
+    The lineshape and prefix of each peak with the effective initial parameters,
+    which include the param hints of the peaks. The name of the model is left out.
+    """
+    return {
+        "components": [
+            {"lineshape": type(i).__name__, "prefix": i.prefix}
+            for i in model.components
+        ],
+        "params": {
+            name: {
+                "value": param.value,
+                "min": param.min,
+                "max": param.max,
+                "vary": param.vary,
+                "expr": param.expr,
+            }
+            for name, param in sorted(model.make_params().items())
+        },
+    }
+
+
+def get_key_model_name(model_name: str) -> str:
+    """the name of the model starts the key, for the invalidation per model"""
+    return re.sub(r"[^\w.-]", "_", model_name)
+
+
+def get_array_hash(array: np.ndarray | None) -> str | None:
+    """hash of the dtype, shape and bytes of the array, without copying it to text"""
+    if array is None:
+        return None
+    array = np.ascontiguousarray(array)
+    array_hash = hashlib.sha256()
+    array_hash.update(array.dtype.str.encode())
+    array_hash.update(str(array.shape).encode())
+    array_hash.update(array.tobytes())
+    return array_hash.hexdigest()
+
+
+def get_fit_definition(spec_fit: SpectrumFitModel) -> Dict[str, Any]:
+    """Everything besides the spectrum that changes the result of the fit"""
+    return {
+        "version": FIT_CACHE_VERSION,
+        "lmfit": lmfit.__version__,
+        "model": get_model_definition(spec_fit.model.lmfit_model),
+        "fit_kwargs": {"method": "leastsq", **spec_fit.fit_kwargs},
+        "weights": get_array_hash(spec_fit.weights),
+        "init_values": dict(sorted(spec_fit.init_values.items())),
+    }
+
+
+class FitResultCache(BaseModel):
+    """
+    Stores the lmfit ModelResult of each fit in a json file, keyed by the content hash
+    of the spectrum and the hash of the model definition and fit settings.
+    A hit restores the best values, uncertainties and statistics without a fit.
+    The least recently used files are evicted when the cache exceeds the max_size.
+    """
+
+    cache_dir: Path
+    max_size: int = DEFAULT_FIT_CACHE_MAX_SIZE
+
+    def make_key(self, spec_fit: SpectrumFitModel) -> str:
+        model_name = get_key_model_name(spec_fit.model.name)
+        spectrum_hash = get_spectrum_content_hash(spec_fit.spectrum)
+        definition_hash = hash_json(get_fit_definition(spec_fit))
+        return f"{model_name}_{spectrum_hash[:32]}_{definition_hash[:16]}"
+
+    def get_cache_file(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{FIT_CACHE_FILE_SUFFIX}"
+
+    def get_cache_files(self) -> List[Path]:
+        if not self.cache_dir.exists():
+            return []
+        return list(self.cache_dir.glob(f"*{FIT_CACHE_FILE_SUFFIX}"))
+
+    def load(self, key: str, model: LMFitModel) -> Dict[str, Any] | None:
+        """The fit result and the info of the fit, None when it is not cached."""
+        cache_file = self.get_cache_file(key)
+        if not cache_file.exists():
+            return None
+        try:
+            cached = json.loads(cache_file.read_text())
+            fit_result = ModelResult(model, model.make_params()).loads(
+                cached["model_result"]
+            )
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning(f"Could not read fit result cache {cache_file}.\n{exc}")
+            return None
+        # the model of the key instead of the one rebuilt from the json
+        fit_result.model = model
+        fit_result.components = model.components
+        for attr, value in cached["result_info"].items():
+            setattr(fit_result, attr, value)
+        # the last use decides the eviction
+        os.utime(cache_file)
+        return {"fit_result": fit_result, **cached["fit_info"]}
+
+    def restore(self, spec_fit: SpectrumFitModel) -> bool:
+        """Sets the cached result on the fit, returns whether it was cached."""
+        cached = self.load(self.make_key(spec_fit), spec_fit.model.lmfit_model)
+        if cached is None:
+            return False
+        spec_fit.fit_result = cached["fit_result"]
+        spec_fit.elapsed_time = cached["elapsed_time"]
+        spec_fit.post_process()
+        return True
+
+    def store(self, spec_fit: SpectrumFitModel) -> Path:
+        fit_result = spec_fit.fit_result
+        key = self.make_key(spec_fit)
+        cached = {
+            "model_result": fit_result.dumps(),
+            "result_info": {
+                attr: getattr(fit_result, attr)
+                for attr in ("jacobian_report", "compiled")
+                if hasattr(fit_result, attr)
+            },
+            "fit_info": {"elapsed_time": spec_fit.elapsed_time},
+        }
+        cache_text = json.dumps(cached)
+
+        cache_file = self.get_cache_file(key)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            prefix=f".{key}.", suffix=FIT_CACHE_FILE_SUFFIX, dir=self.cache_dir
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(cache_text)
+            os.replace(tmp_name, cache_file)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        logger.debug(f"Stored fit result in cache {cache_file}")
+        self.evict()
+        return cache_file
+
+    def evict(self) -> int:
+        """Removes the least recently used files above the max_size."""
+        cache_files = sorted(
+            ((i, i.stat()) for i in self.get_cache_files()),
+            key=lambda i: i[1].st_mtime,
+        )
+        total_size = sum(stat.st_size for _, stat in cache_files)
+        evicted = 0
+        for cache_file, stat in cache_files:
+            if total_size <= self.max_size:
+                break
+            cache_file.unlink(missing_ok=True)
+            total_size -= stat.st_size
+            evicted += 1
+        if evicted:
+            logger.debug(f"Evicted {evicted} fit results from cache {self.cache_dir}")
+        return evicted
+
+    def invalidate(self, model_names: Sequence[str] | None = None) -> int:
+        """
+        Removes the cached fits of the models, or all the cached fits,
+        returns the number of removed files.
+        """
+        cache_files = self.get_cache_files()
+        if model_names:
+            key_patterns = [
+                re.compile(re.escape(get_key_model_name(i)) + KEY_HASHES_PATTERN)
+                for i in model_names
+            ]
+            cache_files = [
+                i for i in cache_files if any(p.fullmatch(i.stem) for p in key_patterns)
+            ]
+        for cache_file in cache_files:
+            cache_file.unlink(missing_ok=True)
+        return len(cache_files)
@@ -0,0 +1,51 @@
+"""
+Order of the fits of a region, so that each model starts from the best values
+of the largest model with a subset of its peaks, e.g. 3peaks for 4peaks or
+2peaks for 2peaks with the substrate peak.
+"""
+
+from typing import FrozenSet, List, Sequence
+
+from raman_fitting.models.fit_models import SpectrumFitModel
+
+
+def get_peak_prefixes(spec_fit: SpectrumFitModel) -> FrozenSet[str]:
+    return frozenset(i.prefix for i in spec_fit.model.lmfit_model.components)
+
+
+def order_fits_by_inclusion(
+    spec_fits: Sequence[SpectrumFitModel],
+) -> List[SpectrumFitModel]:
+    """A model comes after all the models with a subset of its peaks."""
+    return sorted(spec_fits, key=lambda i: len(get_peak_prefixes(i)))
+
+
+def find_warm_start_fit(
+    spec_fit: SpectrumFitModel, fitted: Sequence[SpectrumFitModel]
+) -> SpectrumFitModel | None:
+    """The successful fit with the most peaks that are all in the model, the best fit on ties."""
+    peak_prefixes = get_peak_prefixes(spec_fit)
+    candidates = [
+        i
+        for i in fitted
+        if i is not spec_fit
+        and i.fit_result is not None
+        and i.fit_result.success
+        and get_peak_prefixes(i) <= peak_prefixes
+    ]
+    if not candidates:
+        return None
+    return max(
+        candidates, key=lambda i: (len(get_peak_prefixes(i)), -i.fit_result.redchi)
+    )
+
+
+def set_warm_start(
+    spec_fit: SpectrumFitModel, fitted: Sequence[SpectrumFitModel]
+) -> SpectrumFitModel | None:
+    warm_start_fit = find_warm_start_fit(spec_fit, fitted)
+    if warm_start_fit is None:
+        return None
+    spec_fit.init_values = dict(warm_start_fit.fit_result.best_values)
+    spec_fit.warm_start = warm_start_fit.model.name
+    return warm_start_fit
@@ -5,6 +5,9 @@ from typing import Dict, List, Sequence, Any
 from raman_fitting.config.path_settings import (
     RunModes,
     ERROR_MSG_TEMPLATE,
+    CACHE_DIR_NAME,
+    PROCESSED_SPECTRA_CACHE_DIR_NAME,
+    FIT_RESULTS_CACHE_DIR_NAME,
     initialize_run_mode_paths,
 )
 from raman_fitting.config import settings
@@ -13,7 +16,11 @@ from raman_fitting.imports.models import RamanFileInfo
 
 from raman_fitting.models.deconvolution.base_model import BaseLMFitModel
 from raman_fitting.models.splitter import RegionNames
-from raman_fitting.exports.exporter import ExportManager
+from raman_fitting.exports.exporter import (
+    ExportManager,
+    ExportPlots,
+    get_export_plots_region_names,
+)
 from raman_fitting.imports.files.file_indexer import (
     RamanFileIndex,
     groupby_sample_group,
@@ -30,6 +37,13 @@ from raman_fitting.delegating.pre_processing import (
 )
 from raman_fitting.types import LMFitModelCollection
 from raman_fitting.delegating.run_fit_spectrum import run_fit_over_selected_models
+from raman_fitting.delegating.fit_cache import FitResultCache
+from raman_fitting.processing.despike import (
+    CrossSpectrumDespiker,
+    get_default_cross_despiker,
+)
+from raman_fitting.processing.noise import NoiseSettings, get_default_noise_settings
+from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
 
 
 from loguru import logger
@@ -62,9 +76,32 @@ class MainDelegator:
 
     results: Dict[str, Any] | None = field(default=None, init=False)
     export: bool = True
+    export_plots: Sequence[ExportPlots] = tuple(ExportPlots)
+    use_processing_cache: bool = False
+    processing_cache: ProcessedSpectrumCache | None = None
+    use_fit_cache: bool = False
+    fit_cache: FitResultCache | None = None
+    # only keep what is needed for the fitting and the export in the results
+    lean_memory: bool = False
+    fit_weights: NoiseSettings = field(default_factory=get_default_noise_settings)
+    cross_despiker: CrossSpectrumDespiker = field(
+        default_factory=get_default_cross_despiker
+    )
 
     def __post_init__(self):
         run_mode_paths = initialize_run_mode_paths(self.run_mode)
+        if self.use_processing_cache and self.processing_cache is None:
+            self.processing_cache = ProcessedSpectrumCache(
+                cache_dir=settings.destination_dir
+                / CACHE_DIR_NAME
+                / PROCESSED_SPECTRA_CACHE_DIR_NAME
+            )
+        if self.use_fit_cache and self.fit_cache is None:
+            self.fit_cache = FitResultCache(
+                cache_dir=settings.destination_dir
+                / CACHE_DIR_NAME
+                / FIT_RESULTS_CACHE_DIR_NAME
+            )
         if self.index is None:
             raman_files = run_mode_paths.dataset_dir.glob("*.txt")
             index_file = run_mode_paths.index_file
@@ -95,7 +132,7 @@ class MainDelegator:
 
     def call_export_manager(self):
         # breakpoint()
-        export = ExportManager(self.run_mode, self.results)
+        export = ExportManager(self.run_mode, self.results, plots=self.export_plots)
         exports = export.export_files()
         return exports
 
@@ -127,6 +164,15 @@ class MainDelegator:
         except KeyError as exc:
             raise KeyError(f"Model {region_name} {model_name} not found.") from exc
 
+    def get_processing_region_names(self) -> List[str]:
+        """
+        The regions that the export plots draw, the regions of the models are added
+        per fit. None in the lean memory mode, which only keeps the regions of the models.
+        """
+        if not self.export or self.lean_memory:
+            return []
+        return get_export_plots_region_names(self.export_plots)
+
     def main_run(self):
         selection = self.select_samples_from_index()
         if not self.fit_model_region_names:
@@ -160,6 +206,12 @@ class MainDelegator:
                     sgrp,
                     self.selected_models,
                     use_multiprocessing=self.use_multiprocessing,
+                    processing_cache=self.processing_cache,
+                    lean_memory=self.lean_memory,
+                    noise_settings=self.fit_weights,
+                    region_names=self.get_processing_region_names(),
+                    fit_cache=self.fit_cache,
+                    cross_despiker=self.cross_despiker,
                 )
                 results[group_name][sample_id]["fit_results"] = model_result
         self.results = results
@@ -1,7 +1,8 @@
 # pylint: disable=W0614,W0401,W0611,W0622,C0103,E0401,E0402
-from typing import Dict, Sequence
+from typing import Any, Dict, Sequence
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import pydantic_numpy.typing as pnd
 
 from raman_fitting.imports.models import RamanFileInfo
 
@@ -14,13 +15,15 @@ from raman_fitting.processing.post_processing import SpectrumProcessor
 
 class PreparedSampleSpectrum(BaseModel):
     file_info: RamanFileInfo
-    read: SpectrumReader
+    read: SpectrumReader | None = None
     processed: SpectrumProcessor
 
 
 class AggregatedSampleSpectrum(BaseModel):
     sources: Sequence[PreparedSampleSpectrum]
     spectrum: SpectrumData
+    std_intensity: pnd.Np1DArrayFp32 | None = Field(None, repr=False)
+    despike_info: Dict[str, Any] = Field(default_factory=dict, repr=False)
 
 
 class AggregatedSampleSpectrumFitResult(BaseModel):
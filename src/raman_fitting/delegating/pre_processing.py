@@ -1,8 +1,24 @@
-from typing import List
+from typing import Any, Dict, List, Sequence, Tuple
 
+import numpy as np
+
+from raman_fitting.models.spectrum import SpectrumData
 from raman_fitting.models.splitter import RegionNames
 from raman_fitting.imports.spectrumdata_parser import SpectrumReader
-from raman_fitting.processing.post_processing import SpectrumProcessor
+from raman_fitting.processing.despike import (
+    CrossSpectrumDespiker,
+    get_default_cross_despiker,
+)
+from raman_fitting.processing.pipeline import (
+    ProcessingPipeline,
+    get_default_processing_pipeline,
+)
+from raman_fitting.processing.post_processing import (
+    SpectrumProcessor,
+    reduce_to_scalars,
+)
+from raman_fitting.processing.resampling import axes_are_equal
+from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
 from raman_fitting.imports.models import RamanFileInfo
 from .models import (
     AggregatedSampleSpectrum,
@@ -11,34 +27,146 @@ from .models import (
 
 from loguru import logger
 
-from raman_fitting.config.path_settings import CLEAN_SPEC_REGION_NAME_PREFIX
 from ..imports.spectrum.spectra_collection import SpectraDataCollection
 
 
 def prepare_aggregated_spectrum_from_files(
-    region_name: RegionNames, raman_files: List[RamanFileInfo]
+    region_name: RegionNames,
+    raman_files: List[RamanFileInfo],
+    processing_cache: ProcessedSpectrumCache | None = None,
+    cross_despiker: CrossSpectrumDespiker | None = None,
+    lean_memory: bool = False,
+    region_names: Sequence[str] | None = None,
+    pipeline: ProcessingPipeline | None = None,
 ) -> AggregatedSampleSpectrum | None:
-    select_region_key = f"{CLEAN_SPEC_REGION_NAME_PREFIX}{region_name}"
-    clean_data_for_region = []
-    data_sources = []
+    """
+    Only the aggregated region, the regions that the normalization depends on and
+    the extra region_names are processed for each file, e.g. the regions of the plots.
+    In the lean memory mode the readers are dropped, each processed spectrum
+    only keeps the clean region that is aggregated and the diagnostics are scalars.
+    """
+    sources = prepare_sample_spectra(
+        raman_files,
+        [region_name, *(region_names or [])],
+        processing_cache=processing_cache,
+        lean_memory=lean_memory,
+        pipeline=pipeline,
+    )
+    aggregated_spectrum = aggregate_region_of_sources(
+        region_name, sources, cross_despiker=cross_despiker, lean_memory=lean_memory
+    )
+    if lean_memory:
+        release_sources(sources, [region_name])
+    return aggregated_spectrum
+
+
+def prepare_sample_spectra(
+    raman_files: List[RamanFileInfo],
+    region_names: Sequence[str],
+    processing_cache: ProcessedSpectrumCache | None = None,
+    lean_memory: bool = False,
+    pipeline: ProcessingPipeline | None = None,
+) -> List[PreparedSampleSpectrum]:
+    """
+    Reads and processes each file once, for all the region_names of a sample.
+    In the lean memory mode the readers are dropped and the diagnostics are scalars.
+    """
+    if pipeline is None:
+        pipeline = get_default_processing_pipeline()
+    if lean_memory:
+        pipeline = pipeline.with_step_kwargs("despike", keep_diagnostics=False)
+    sources = []
     for i in raman_files:
         read = SpectrumReader(i.file)
-        processed = SpectrumProcessor(read.spectrum)
-        prepared_spec = PreparedSampleSpectrum(
-            file_info=i, read=read, processed=processed
+        processed = SpectrumProcessor(
+            read.spectrum,
+            cache=processing_cache,
+            pipeline=pipeline,
+            region_names=list(region_names),
         )
-        data_sources.append(prepared_spec)
-        selected_clean_data = processed.clean_spectrum.spec_regions[select_region_key]
-        clean_data_for_region.append(selected_clean_data)
-    if not clean_data_for_region:
+        if lean_memory:
+            read = None
+        sources.append(
+            PreparedSampleSpectrum(file_info=i, read=read, processed=processed)
+        )
+    return sources
+
+
+def aggregate_region_of_sources(
+    region_name: RegionNames,
+    sources: List[PreparedSampleSpectrum],
+    cross_despiker: CrossSpectrumDespiker | None = None,
+    lean_memory: bool = False,
+) -> AggregatedSampleSpectrum | None:
+    """The mean of the clean region of the processed sources of a sample."""
+    if not sources:
         logger.warning(
             f"prepare_mean_data_for_fitting received no files. {region_name}"
         )
         return
+    clean_data_for_region = [i.processed.get_region(region_name) for i in sources]
+    if cross_despiker is None:
+        cross_despiker = get_default_cross_despiker()
+    clean_data_for_region, despike_info = despike_spectra_across_positions(
+        clean_data_for_region, cross_despiker
+    )
+    if lean_memory:
+        despike_info = reduce_to_scalars(despike_info)
     spectra_collection = SpectraDataCollection(
         spectra=clean_data_for_region, region_name=region_name
     )
     aggregated_spectrum = AggregatedSampleSpectrum(
-        sources=data_sources, spectrum=spectra_collection.mean_spectrum
+        sources=sources,
+        spectrum=spectra_collection.mean_spectrum,
+        std_intensity=spectra_collection.std_intensity,
+        despike_info=despike_info,
     )
     return aggregated_spectrum
+
+
+def release_sources(
+    sources: List[PreparedSampleSpectrum], region_names: Sequence[str]
+) -> None:
+    """Lean memory mode, each processed spectrum only keeps the aggregated regions."""
+    for source in sources:
+        processed = source.processed
+        processed.release_memory(
+            keep_regions=[processed.get_region_key(i) for i in region_names]
+        )
+
+
+def despike_spectra_across_positions(
+    spectra: List[SpectrumData], cross_despiker: CrossSpectrumDespiker
+) -> Tuple[List[SpectrumData], Dict[str, Any]]:
+    """Replaces the cosmic rays that show up in only one of the positions of a sample."""
+    if not cross_despiker.enabled or len(spectra) < cross_despiker.min_spectra:
+        return spectra, {}
+    if not axes_are_equal([i.ramanshift for i in spectra]):
+        logger.debug(
+            "Skipped cross-position despiking, the spectra have different axes."
+        )
+        return spectra, {}
+    intensity = np.vstack([i.intensity for i in spectra])
+    despiked_intensity, result = cross_despiker.process_intensity_batch(intensity)
+    despiked_spectra = [
+        SpectrumData.construct_trusted(
+            ramanshift=spec.ramanshift,
+            intensity=row,
+            label=spec.label,
+            region_name=spec.region_name,
+            source=spec.source,
+        )
+        for spec, row in zip(spectra, despiked_intensity)
+    ]
+    replaced_points = {
+        str(spec.source): int(n) for spec, n in zip(spectra, result["replaced_points"])
+    }
+    if any(replaced_points.values()):
+        logger.info(
+            f"Replaced cosmic ray points across positions of {spectra[0].region_name}: {replaced_points}"
+        )
+    despike_info = {
+        "replaced_points": replaced_points,
+        "spike_mask": result["spike_mask"],
+    }
+    return despiked_spectra, despike_info
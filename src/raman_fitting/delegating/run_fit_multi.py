@@ -3,15 +3,17 @@ from typing import Dict, List
 from loguru import logger
 from mpire import WorkerPool
 
+from raman_fitting.delegating.fit_cache import FitResultCache
+from raman_fitting.models.deconvolution.compiled_model import fit_compiled_model
 from raman_fitting.models.fit_models import SpectrumFitModel
 
 
 def run_fit_multi(**kwargs) -> SpectrumFitModel:
-    #  include optional https://lmfit.github.io/lmfit-py/model.html#saving-and-loading-modelresults
     spectrum = kwargs.pop("spectrum")
     model = kwargs.pop("model")
     lmfit_model = model["lmfit_model"]
     region = kwargs.pop("region")
+    weights = kwargs.pop("weights", None)
     import time
 
     lmfit_kwargs = {}
@@ -21,7 +23,9 @@ def run_fit_multi(**kwargs) -> SpectrumFitModel:
     init_params = lmfit_model.make_params()
     start_time = time.time()
     x, y = spectrum["ramanshift"], spectrum["intensity"]
-    out = lmfit_model.fit(y, init_params, x=x, **lmfit_kwargs)  # 'leastsq'
+    out = fit_compiled_model(
+        lmfit_model, y, init_params, x=x, weights=weights, **lmfit_kwargs
+    )  # 'leastsq'
     end_time = time.time()
     elapsed_seconds = abs(start_time - end_time)
     elapsed_time = elapsed_seconds
@@ -33,7 +37,16 @@ def run_fit_multi(**kwargs) -> SpectrumFitModel:
 
 def run_fit_multiprocessing(
     spec_fits: List[SpectrumFitModel],
+    fit_cache: FitResultCache | None = None,
 ) -> Dict[str, SpectrumFitModel]:
+    fit_model_results = {}
+    if fit_cache is not None:
+        for spec_fit in spec_fits:
+            if fit_cache.restore(spec_fit):
+                fit_model_results[spec_fit.model.name] = spec_fit
+        spec_fits = [i for i in spec_fits if i.model.name not in fit_model_results]
+    if not spec_fits:
+        return fit_model_results
     spec_fits_dumps = [i.model_dump() for i in spec_fits]
 
     with WorkerPool(n_jobs=4, use_dill=True) as pool:
@@ -41,7 +54,6 @@ def run_fit_multiprocessing(
             run_fit_multi, spec_fits_dumps, progress_bar=True, progress_bar_style="rich"
         )
     #  patch spec_fits, setattr fit_result
-    fit_model_results = {}
     for result in results:
         _spec_fit_search = [
             i for i in spec_fits if i.model.lmfit_model.name == result.model.name
@@ -50,5 +62,8 @@ def run_fit_multiprocessing(
             continue
         _spec_fit = _spec_fit_search[0]
         _spec_fit.fit_result = result
+        _spec_fit.post_process()
+        if fit_cache is not None:
+            fit_cache.store(_spec_fit)
         fit_model_results[_spec_fit.model.name] = _spec_fit
     return fit_model_results
@@ -1,15 +1,30 @@
-from typing import List, Dict
+from typing import List, Dict, Sequence
+
+import numpy as np
 
 from raman_fitting.delegating.run_fit_multi import run_fit_multiprocessing
 from raman_fitting.models.spectrum import SpectrumData
 from raman_fitting.types import LMFitModelCollection
-from raman_fitting.delegating.models import AggregatedSampleSpectrumFitResult
+from raman_fitting.delegating.models import (
+    AggregatedSampleSpectrum,
+    AggregatedSampleSpectrumFitResult,
+)
 from raman_fitting.delegating.pre_processing import (
-    prepare_aggregated_spectrum_from_files,
+    aggregate_region_of_sources,
+    prepare_sample_spectra,
+    release_sources,
 )
 from raman_fitting.imports.models import RamanFileInfo
 from raman_fitting.models.deconvolution.spectrum_regions import RegionNames
+from raman_fitting.delegating.fit_cache import FitResultCache
+from raman_fitting.delegating.fit_scheduler import (
+    order_fits_by_inclusion,
+    set_warm_start,
+)
 from raman_fitting.models.fit_models import SpectrumFitModel
+from raman_fitting.processing.despike import CrossSpectrumDespiker
+from raman_fitting.processing.noise import NoiseSettings, estimate_fit_weights
+from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
 
 from loguru import logger
 
@@ -18,21 +33,53 @@ def run_fit_over_selected_models(
     raman_files: List[RamanFileInfo],
     models: LMFitModelCollection,
     use_multiprocessing: bool = False,
+    processing_cache: ProcessedSpectrumCache | None = None,
+    lean_memory: bool = False,
+    noise_settings: NoiseSettings | None = None,
+    region_names: Sequence[str] | None = None,
+    fit_cache: FitResultCache | None = None,
+    cross_despiker: CrossSpectrumDespiker | None = None,
 ) -> Dict[RegionNames, AggregatedSampleSpectrumFitResult]:
-    results = {}
-    for region_name, model_region_grp in models.items():
-        aggregated_spectrum = prepare_aggregated_spectrum_from_files(
-            region_name, raman_files
+    """
+    Each file is read and processed once for the regions of the models and the
+    region_names, the aggregated spectrum of each region is selected from it.
+    In the lean memory mode only the aggregated regions are kept before the fits.
+    """
+    sources = prepare_sample_spectra(
+        raman_files,
+        [*models, *(region_names or [])],
+        processing_cache=processing_cache,
+        lean_memory=lean_memory,
+    )
+    aggregated_spectra = {}
+    for region_name in models:
+        aggregated_spectrum = aggregate_region_of_sources(
+            region_name,
+            sources,
+            cross_despiker=cross_despiker,
+            lean_memory=lean_memory,
         )
         if aggregated_spectrum is None:
             continue
+        aggregated_spectra[region_name] = aggregated_spectrum
+    if lean_memory:
+        release_sources(sources, list(aggregated_spectra))
+
+    results = {}
+    for region_name, aggregated_spectrum in aggregated_spectra.items():
+        model_region_grp = models[region_name]
+        weights = None
+        if noise_settings is not None and noise_settings.enabled:
+            weights = get_aggregated_spectrum_fit_weights(
+                aggregated_spectrum, noise_settings
+            )
         spec_fits = prepare_spec_fit_regions(
-            aggregated_spectrum.spectrum, model_region_grp
+            aggregated_spectrum.spectrum, model_region_grp, weights=weights
         )
         if use_multiprocessing:
-            fit_model_results = run_fit_multiprocessing(spec_fits)
+            fit_model_results = run_fit_multiprocessing(spec_fits, fit_cache=fit_cache)
         else:
-            fit_model_results = run_fit_loop(spec_fits)
+            fit_model_results = run_fit_loop(spec_fits, fit_cache=fit_cache)
         fit_region_results = AggregatedSampleSpectrumFitResult(
             region_name=region_name,
             aggregated_spectrum=aggregated_spectrum,
@@ -42,24 +89,58 @@ def run_fit_over_selected_models(
     return results
 
 
+def get_aggregated_spectrum_fit_weights(
+    aggregated_spectrum: AggregatedSampleSpectrum, noise_settings: NoiseSettings
+) -> np.ndarray:
+    return estimate_fit_weights(
+        aggregated_spectrum.spectrum.intensity,
+        settings=noise_settings,
+        std_intensity=aggregated_spectrum.std_intensity,
+        n_spectra=len(aggregated_spectrum.sources),
+    )
+
+
 def prepare_spec_fit_regions(
-    spectrum: SpectrumData, model_region_grp
+    spectrum: SpectrumData, model_region_grp, weights: np.ndarray | None = None
 ) -> List[SpectrumFitModel]:
     spec_fits = []
     for model_name, model in model_region_grp.items():
         region = model.region_name.name
-        spec_fit = SpectrumFitModel(spectrum=spectrum, model=model, region=region)
+        spec_fit = SpectrumFitModel(
+            spectrum=spectrum, model=model, region=region, weights=weights
+        )
         spec_fits.append(spec_fit)
     return spec_fits
 
 
-def run_fit_loop(spec_fits: List[SpectrumFitModel]) -> Dict[str, SpectrumFitModel]:
-    fit_model_results = {}
-    for spec_fit in spec_fits:
-        #  include optional https://lmfit.github.io/lmfit-py/model.html#saving-and-loading-modelresults
-        spec_fit.run_fit()
-        logger.debug(
-            f"Fit with model {spec_fit.model.name} on {spec_fit.region} success: {spec_fit.fit_result.success} in {spec_fit.elapsed_time:.2f}s."
-        )
-        fit_model_results[spec_fit.model.name] = spec_fit
-    return fit_model_results
+def run_fit_loop(
+    spec_fits: List[SpectrumFitModel],
+    warm_start: bool = True,
+    fit_cache: FitResultCache | None = None,
+) -> Dict[str, SpectrumFitModel]:
+    """
+    With warm_start each model starts from the best values of its largest fitted
+    submodel. The results in the fit_cache are restored instead of fitted,
+    the new results are stored in it.
+    """
+    fitted = []
+    if warm_start:
+        spec_fits_order = order_fits_by_inclusion(spec_fits)
+    else:
+        spec_fits_order = spec_fits
+    for spec_fit in spec_fits_order:
+        if warm_start:
+            set_warm_start(spec_fit, fitted)
+        if fit_cache is not None and fit_cache.restore(spec_fit):
+            logger.debug(
+                f"Fit with model {spec_fit.model.name} on {spec_fit.region} restored from the cache."
+            )
+        else:
+            spec_fit.run_fit()
+            logger.debug(
+                f"Fit with model {spec_fit.model.name} on {spec_fit.region} success: {spec_fit.fit_result.success} in {spec_fit.elapsed_time:.2f}s, warm start from {spec_fit.warm_start}."
+            )
+            if fit_cache is not None:
+                fit_cache.store(spec_fit)
+        fitted.append(spec_fit)
+    return {spec_fit.model.name: spec_fit for spec_fit in spec_fits}
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Dict, Any
+from enum import StrEnum
+from typing import Dict, Any, List, Sequence, Tuple
 from raman_fitting.config.path_settings import (
     RunModes,
     initialize_run_mode_paths,
@@ -7,8 +8,10 @@ from raman_fitting.config.path_settings import (
 )
 from raman_fitting.config import settings
 
+from raman_fitting.exports.plot_formatting import PLOT_REGION_AXES
 from raman_fitting.exports.plotting_fit_results import fit_spectrum_plot
 from raman_fitting.exports.plotting_raw_data import raw_data_spectra_plot
+from raman_fitting.models.splitter import RegionNames
 
 
 from loguru import logger
@@ -18,10 +21,33 @@ class ExporterError(Exception):
     """Error occured during the exporting functions"""
 
 
+class ExportPlots(StrEnum):
+    RAW_DATA = "raw_data"
+    FIT_RESULTS = "fit_results"
+
+
+# the regions that each plot draws besides the fitted regions
+EXPORT_PLOT_REGION_NAMES: Dict[ExportPlots, Tuple[RegionNames, ...]] = {
+    ExportPlots.RAW_DATA: tuple(PLOT_REGION_AXES),
+    ExportPlots.FIT_RESULTS: (),
+}
+
+
+def get_export_plots_region_names(plots: Sequence[ExportPlots]) -> List[str]:
+    """The regions that the plots draw, without the fitted regions."""
+    region_names = []
+    for plot in plots:
+        for region_name in EXPORT_PLOT_REGION_NAMES[ExportPlots(plot)]:
+            if region_name not in region_names:
+                region_names.append(region_name)
+    return region_names
+
+
 @dataclass
 class ExportManager:
     run_mode: RunModes
     results: Dict[str, Any] | None = None
+    plots: Sequence[ExportPlots] = tuple(ExportPlots)
 
     def __post_init__(self):
         self.paths = initialize_run_mode_paths(
@@ -35,19 +61,21 @@ class ExportManager:
             for sample_id, sample_results in group_results.items():
                 export_dir = self.paths.results_dir / group_name / sample_id
                 export_paths = ExportPathSettings(results_dir=export_dir)
-                try:
-                    raw_data_spectra_plot(
-                        sample_results["fit_results"], export_paths=export_paths
-                    )
-                except Exception as exc:
-                    logger.error(f"Plotting error, raw_data_spectra_plot: {exc}")
-                try:
-                    fit_spectrum_plot(
-                        sample_results["fit_results"], export_paths=export_paths
-                    )
-                except Exception as exc:
-                    logger.error(f"plotting error fit_spectrum_plot: {exc}")
-                    raise exc from exc
+                if ExportPlots.RAW_DATA in self.plots:
+                    try:
+                        raw_data_spectra_plot(
+                            sample_results["fit_results"], export_paths=export_paths
+                        )
+                    except Exception as exc:
+                        logger.error(f"Plotting error, raw_data_spectra_plot: {exc}")
+                if ExportPlots.FIT_RESULTS in self.plots:
+                    try:
+                        fit_spectrum_plot(
+                            sample_results["fit_results"], export_paths=export_paths
+                        )
+                    except Exception as exc:
+                        logger.error(f"plotting error fit_spectrum_plot: {exc}")
+                        raise exc from exc
                 exports.append(
                     {
                         "sample": sample_results["fit_results"],
@@ -43,11 +43,22 @@ def raw_data_spectra_plot(
 
     _, ax = plt.subplots(2, 3, figsize=(18, 12))
 
-    for spec_source in sources:
+    # in the lean memory mode the sources of each region only keep that region
+    all_sources = [
+        i
+        for fit_result in aggregated_spectra.values()
+        for i in fit_result.aggregated_spectrum.sources
+    ]
+    plotted_source_regions = set()
+    for spec_source in all_sources:
         for (
             source_region_label,
             source_region,
         ) in spec_source.processed.clean_spectrum.spec_regions.items():
+            plotted_key = (spec_source.file_info.file, source_region_label)
+            if plotted_key in plotted_source_regions:
+                continue
+            plotted_source_regions.add(plotted_key)
             _source_region_name = source_region.region_name.split(
                 CLEAN_SPEC_REGION_NAME_PREFIX
             )[-1]
@@ -2,7 +2,7 @@
 
 from itertools import filterfalse, groupby
 from pathlib import Path
-from typing import List, Sequence, TypeAlias
+from typing import Any, Callable, List, Sequence, Set, TypeAlias
 
 from loguru import logger
 from pydantic import (
@@ -11,20 +11,26 @@ from pydantic import (
     Field,
     FilePath,
     NewPath,
+    PrivateAttr,
     model_validator,
 )
 from raman_fitting.config import settings
 from raman_fitting.imports.collector import collect_raman_file_infos
 from raman_fitting.imports.files.utils import (
     load_dataset_from_file,
-    write_dataset_to_file,
+    update_dataset_in_file,
 )
 from raman_fitting.imports.models import RamanFileInfo
+from raman_fitting.imports.spectrum.fingerprint import (
+    SpectrumFingerprint,
+    get_fingerprint_from_file,
+)
 from tablib import Dataset
 
 from raman_fitting.imports.spectrum import SPECTRUM_FILETYPE_PARSERS
 
 RamanFileInfoSet: TypeAlias = Sequence[RamanFileInfo]
+INDEX_KEY = "filename_id"
 
 
 class RamanFileIndex(BaseModel):
@@ -35,6 +41,12 @@ class RamanFileIndex(BaseModel):
     dataset: Dataset | None = Field(None)
     force_reindex: bool = Field(False, validate_default=False)
     persist_to_file: bool = Field(True, validate_default=False)
+    # the filename_ids changed since the last persist, None when not known
+    _dirty_keys: Set[str] | None = PrivateAttr(None)
+
+    @property
+    def dirty_keys(self) -> Set[str] | None:
+        return self._dirty_keys
 
     @model_validator(mode="after")
     def read_or_load_data(self) -> "RamanFileIndex":
@@ -44,10 +56,19 @@ class RamanFileIndex(BaseModel):
         reload_from_file = validate_reload_from_index_file(
             self.index_file, self.force_reindex
         )
-        if reload_from_file:
+        if reload_from_file and self.raman_files is None and self.dataset is None:
             self.dataset = load_dataset_from_file(self.index_file)
-            if not self.raman_files and self.dataset:
+            if self.dataset:
                 self.raman_files = parse_dataset_to_index(self.dataset)
+                fingerprinted = set_missing_fingerprints(self.raman_files)
+                if list(self.dataset.headers) == get_index_headers():
+                    # only the entries that got a fingerprint differ from the file
+                    update_dataset_rows(self.dataset, fingerprinted)
+                    self._dirty_keys = {i.filename_id for i in fingerprinted}
+                else:
+                    self.dataset = cast_raman_files_to_dataset(self.raman_files)
+                if self._dirty_keys != set() and self.persist_to_file:
+                    self.persist()
                 return self
 
         if self.raman_files is not None:
@@ -67,10 +88,33 @@ class RamanFileIndex(BaseModel):
             )
 
         if self.persist_to_file and self.index_file is not None:
-            write_dataset_to_file(self.index_file, self.dataset)
+            self.persist()
 
         return self
 
+    def persist(self) -> Set[str]:
+        """
+        Writes only the new or changed entries to the index file, returns their
+        filename_ids. Skips the file when no entries changed since the last persist.
+        """
+        if self.index_file is None:
+            raise ValueError("Index file is not set, can not persist the index.")
+        if not self.dataset or not self.dataset.headers:
+            logger.info("Index is empty, nothing to persist.")
+            return set()
+        if self._dirty_keys == set() and self.index_file.exists():
+            logger.debug(f"Index {self.index_file} is unchanged, skipped writing.")
+            return set()
+        written = update_dataset_in_file(
+            self.index_file,
+            self.dataset,
+            key=INDEX_KEY,
+            overwrite=self.force_reindex,
+            dirty_keys=self._dirty_keys,
+        )
+        self._dirty_keys = set()
+        return written
+
 
 def validate_reload_from_index_file(
     index_file: Path | None, force_reindex: bool
@@ -93,14 +137,49 @@ def validate_reload_from_index_file(
     return False
 
 
+def set_missing_fingerprints(raman_files: RamanFileInfoSet) -> List[RamanFileInfo]:
+    """Reads the files without a fingerprint, returns the files that got one."""
+    fingerprinted = []
+    for raman_file in raman_files:
+        if raman_file.fingerprint is not None:
+            continue
+        raman_file.fingerprint = get_fingerprint_from_file(raman_file.file)
+        if raman_file.fingerprint is not None:
+            fingerprinted.append(raman_file)
+    return fingerprinted
+
+
+def cast_raman_file_to_row(raman_file: RamanFileInfo) -> List[Any]:
+    row = raman_file.model_dump(mode="json")
+    if isinstance(raman_file.fingerprint, SpectrumFingerprint):
+        # json text, so that it reads back without the quotes of a python dict
+        row["fingerprint"] = raman_file.fingerprint.model_dump_json()
+    return list(row.values())
+
+
+def get_index_headers() -> List[str]:
+    return list(RamanFileInfo.model_fields.keys())
+
+
 def cast_raman_files_to_dataset(raman_files: RamanFileInfoSet) -> Dataset:
-    headers = list(RamanFileInfo.model_fields.keys())
-    data = Dataset(headers=headers)
+    data = Dataset(headers=get_index_headers())
     for file in raman_files:
-        data.append(file.model_dump(mode="json").values())
+        data.append(cast_raman_file_to_row(file))
     return data
 
 
+def update_dataset_rows(dataset: Dataset, raman_files: RamanFileInfoSet) -> None:
+    """Replaces the rows of the raman_files in the dataset, the other rows are kept."""
+    updated = {i.filename_id: i for i in raman_files}
+    if not updated:
+        return
+    key_idx = dataset.headers.index(INDEX_KEY)
+    for n, row in enumerate(dataset):
+        raman_file = updated.get(str(row[key_idx]))
+        if raman_file is not None:
+            dataset[n] = cast_raman_file_to_row(raman_file)
+
+
 def parse_dataset_to_index(dataset: Dataset) -> RamanFileInfoSet:
     raman_files = []
     for row in dataset:
@@ -169,6 +248,18 @@ def select_index_by_sample_ids(index: RamanFileInfoSet, sample_ids: List[str]):
     return filter(lambda x: x.sample.id in sample_ids, index)
 
 
+def select_index_by_fingerprint(
+    index: RamanFileInfoSet, condition: Callable[[SpectrumFingerprint], bool]
+):
+    """Selects the files of which the fingerprint in the index matches the condition,
+    files without a fingerprint are skipped."""
+    return filter(
+        lambda x: isinstance(x.fingerprint, SpectrumFingerprint)
+        and condition(x.fingerprint),
+        index,
+    )
+
+
 def select_index(
     index: RamanFileInfoSet, sample_groups: List[str], sample_ids: List[str]
 ):
@@ -192,6 +283,7 @@ def collect_raman_file_index_info(
         paths = [path for i in suffixes for path in d1.glob(f"*.{i}")]
         total_files += paths
     index, files = collect_raman_file_infos(total_files, **kwargs)
+    set_missing_fingerprints(index)
     logger.info(f"successfully made index {len(index)} from {len(files)} files")
     return index
 
@@ -1,18 +1,119 @@
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Set, Tuple
 
 import tablib.exceptions
 from tablib import Dataset
 
 from loguru import logger
 
+INDEX_LOCK_SUFFIX = ".lock"
+INDEX_LOCK_TIMEOUT = 60.0
+# much longer than any update of the index, so that a slow holder keeps its lock
+INDEX_LOCK_STALE_AGE = 3600.0
+INDEX_LOCK_POLL_INTERVAL = 0.05
+
+
+class IndexFileLockError(TimeoutError):
+    """The lock on the index file could not be acquired in time"""
+
+
+def get_lock_filepath(file: Path) -> Path:
+    return file.with_name(file.name + INDEX_LOCK_SUFFIX)
+
+
+def read_lock_owner(lock_file: Path) -> str | None:
+    """the owner token written in the lock file, None when there is no lock"""
+    try:
+        return lock_file.read_text()
+    except FileNotFoundError:
+        return None
+
+
+def remove_stale_lock(lock_file: Path, stale_age: float) -> bool:
+    """
+    Removes the lock file when it is older than the stale_age and still holds the
+    same owner token right before the removal, so that a lock that was just taken
+    over by another process is kept. Returns whether the lock was removed.
+    """
+    owner = read_lock_owner(lock_file)
+    try:
+        lock_age = time.time() - lock_file.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    if owner is None or lock_age <= stale_age:
+        return False
+    if read_lock_owner(lock_file) != owner:
+        return False
+    logger.warning(f"Removing stale lock file {lock_file} of owner {owner}")
+    lock_file.unlink(missing_ok=True)
+    return True
+
+
+@contextmanager
+def index_file_lock(
+    file: Path,
+    timeout: float = INDEX_LOCK_TIMEOUT,
+    poll_interval: float = INDEX_LOCK_POLL_INTERVAL,
+    stale_age: float = INDEX_LOCK_STALE_AGE,
+) -> Iterator[Path]:
+    """
+    Simple cross-process lock on a file, by exclusive creation of a lock file
+    next to it with a unique owner token. Lock files older than the stale_age are
+    considered stale and removed. The lock file is only removed on release while
+    it still holds the token of this owner.
+    """
+    lock_file = get_lock_filepath(file)
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    start_time = time.monotonic()
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if remove_stale_lock(lock_file, stale_age):
+                continue
+            if time.monotonic() - start_time > timeout:
+                raise IndexFileLockError(
+                    f"Could not acquire lock on {file} within {timeout}s."
+                )
+            time.sleep(poll_interval)
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(owner)
+        break
+    try:
+        yield lock_file
+    finally:
+        if read_lock_owner(lock_file) == owner:
+            lock_file.unlink(missing_ok=True)
+        else:
+            logger.warning(f"Lock file {lock_file} was taken over, not removed.")
+
 
 def write_dataset_to_file(file: Path, dataset: Dataset) -> None:
-    if file.suffix == ".csv":
-        with open(file, "w", newline="") as f:
-            f.write(dataset.export("csv"))
-    else:
-        with open(file, "wb", encoding="utf-8") as f:
-            f.write(dataset.export(file.suffix))
+    """Writes the dataset to a temporary file which then atomically replaces the file."""
+    file_format = file.suffix.lstrip(".") or "csv"
+    exported = dataset.export(file_format)
+    mode = "wb" if isinstance(exported, bytes) else "w"
+    newline = None if mode == "wb" else ""
+    file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{file.name}.", suffix=".tmp", dir=file.parent
+    )
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            f.write(exported)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
     logger.debug(f"Wrote dataset {len(dataset)} to {file}")
 
 
@@ -26,3 +127,76 @@ def load_dataset_from_file(file) -> Dataset:
 
     logger.debug(f"Read dataset {len(imported_data)} from {file}")
     return imported_data
+
+
+def row_to_text(row) -> Tuple[str, ...]:
+    """text representation of a row, as it would be read back from a text file"""
+    return tuple("" if i is None else str(i) for i in row)
+
+
+def get_dirty_row_keys(dataset: Dataset, stored: Dataset, key: str) -> Set[str]:
+    """Returns the keys of the rows in dataset that are new or differ from the stored rows."""
+    if not stored.headers or list(stored.headers) != list(dataset.headers):
+        return {str(i) for i in dataset[key]}
+    stored_rows = {str(row[stored.headers.index(key)]): row for row in stored}
+    key_idx = dataset.headers.index(key)
+    dirty = set()
+    for row in dataset:
+        row_key = str(row[key_idx])
+        stored_row = stored_rows.get(row_key)
+        if stored_row is None or row_to_text(stored_row) != row_to_text(row):
+            dirty.add(row_key)
+    return dirty
+
+
+def update_dataset_in_file(
+    file: Path,
+    dataset: Dataset,
+    key: str,
+    overwrite: bool = False,
+    dirty_keys: Set[str] | None = None,
+) -> Set[str]:
+    """
+    Persists only the changes of the dataset w.r.t. the rows already stored in the file.
+    Rows of the stored file that are not in the dataset are kept, unless overwrite is set,
+    so that several processes can share one file. The file is locked while updating
+    and is replaced atomically. The dirty_keys are the rows known to be changed,
+    without them the rows are compared with the stored rows.
+    Returns the keys of the rows that were written.
+    """
+    with index_file_lock(file):
+        stored = Dataset()
+        if file.exists():
+            stored = load_dataset_from_file(file)
+        same_headers = bool(stored.headers) and list(stored.headers) == list(
+            dataset.headers
+        )
+        if dirty_keys is None or not same_headers:
+            dirty = get_dirty_row_keys(dataset, stored, key)
+        else:
+            dirty = set(dirty_keys)
+        stored_keys = set()
+        if same_headers:
+            stored_keys = {str(i) for i in stored[key]}
+        removed = stored_keys - {str(i) for i in dataset[key]} if overwrite else set()
+        if not dirty and not removed and file.exists():
+            logger.debug(f"Dataset in {file} is unchanged, skipped writing.")
+            return dirty
+
+        key_idx = dataset.headers.index(key)
+        merged = Dataset(headers=dataset.headers)
+        if same_headers and not overwrite:
+            # update the dirty rows in place, keep the order and the rows of other writers
+            dirty_rows = {
+                str(row[key_idx]): row for row in dataset if str(row[key_idx]) in dirty
+            }
+            for row in stored:
+                merged.append(dirty_rows.pop(str(row[key_idx]), row))
+            for row in dirty_rows.values():
+                merged.append(row)
+        else:
+            for row in dataset:
+                merged.append(row)
+        write_dataset_to_file(file, merged)
+    logger.debug(f"Updated {len(dirty)} and removed {len(removed)} rows in {file}")
+    return dirty
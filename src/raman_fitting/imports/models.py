@@ -5,13 +5,16 @@ from pydantic import (
     model_validator,
     Field,
     ConfigDict,
+    ValidationError,
 )
+from loguru import logger
 
 from .samples.sample_id_helpers import extract_sample_metadata_from_filepath
 
 from .files.metadata import FileMetaData, get_file_metadata
 from .files.index_helpers import get_filename_id_from_path
 from .samples.models import SampleMetaData
+from .spectrum.fingerprint import SpectrumFingerprint
 
 
 class RamanFileInfo(BaseModel):
@@ -23,6 +26,9 @@ class RamanFileInfo(BaseModel):
     file_metadata: FileMetaData | str = Field(
         None, init_var=False, validate_default=False
     )
+    fingerprint: SpectrumFingerprint | str | None = Field(
+        None, init_var=False, validate_default=False
+    )
 
     @model_validator(mode="after")
     def set_filename_id(self) -> "RamanFileInfo":
@@ -57,3 +63,23 @@ class RamanFileInfo(BaseModel):
             self.file_metadata = SampleMetaData(**_file_metadata)
 
         return self
+
+    @model_validator(mode="after")
+    def parse_fingerprint(self) -> "RamanFileInfo":
+        """Only parses a stored fingerprint, the indexer computes the missing ones."""
+        if isinstance(self.fingerprint, dict):
+            self.fingerprint = SpectrumFingerprint(**self.fingerprint)
+        elif isinstance(self.fingerprint, str):
+            self.fingerprint = parse_fingerprint_text(self.fingerprint)
+        return self
+
+
+def parse_fingerprint_text(text: str) -> SpectrumFingerprint | None:
+    """None for an empty or unreadable text, the indexer computes it again"""
+    if not text:
+        return None
+    try:
+        return SpectrumFingerprint.from_text(text)
+    except ValidationError as exc:
+        logger.warning(f"Could not parse the fingerprint {text[:80]}.\n{exc}")
+        return None
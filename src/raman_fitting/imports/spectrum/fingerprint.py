@@ -0,0 +1,98 @@
+"""Compact fingerprints of the spectral data, stored alongside each file in the index"""
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from pydantic import BaseModel, Field
+from tablib.exceptions import TablibException
+
+from loguru import logger
+
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+
+PREVIEW_LENGTH = 64
+MAD_TO_STD = 1.4826
+
+
+class SpectrumFingerprint(BaseModel):
+    """
+    Small summary of a spectrum that can be stored in the index,
+    so that selections and QC can be made without re-reading the files.
+    """
+
+    ramanshift_min: float
+    ramanshift_max: float
+    length: int
+    intensity_max: float
+    snr: float
+    preview: List[float] = Field(default_factory=list, repr=False)
+
+    @property
+    def preview_ramanshift(self) -> np.ndarray:
+        return np.linspace(self.ramanshift_min, self.ramanshift_max, len(self.preview))
+
+    @classmethod
+    def from_text(cls, text: str) -> "SpectrumFingerprint":
+        """from the json text that is stored in the index"""
+        return cls.model_validate_json(text)
+
+
+def estimate_noise(intensity: np.ndarray) -> float:
+    """robust estimate of the noise level from the MAD of the first differences"""
+    if len(intensity) < 3:
+        return 0.0
+    diff = np.diff(intensity)
+    mad = np.median(np.abs(diff - np.median(diff)))
+    return float(MAD_TO_STD * mad / np.sqrt(2))
+
+
+def estimate_snr(intensity: np.ndarray) -> float:
+    noise = estimate_noise(intensity)
+    if not noise:
+        return 0.0
+    signal = np.max(intensity) - np.median(intensity)
+    return float(signal / noise)
+
+
+def make_preview(
+    ramanshift: np.ndarray, intensity: np.ndarray, length: int = PREVIEW_LENGTH
+) -> List[float]:
+    """
+    interpolates the intensity on an evenly spaced grid between the axis limits,
+    in ascending order like the preview_ramanshift of the fingerprint
+    """
+    if not len(ramanshift):
+        return []
+    order = np.argsort(ramanshift, kind="stable")
+    ramanshift, intensity = ramanshift[order], intensity[order]
+    preview_grid = np.linspace(ramanshift[0], ramanshift[-1], length)
+    preview = np.interp(preview_grid, ramanshift, intensity)
+    return np.round(preview, 3).tolist()
+
+
+def make_spectrum_fingerprint(spectrum: SpectrumData) -> SpectrumFingerprint:
+    ramanshift, intensity = spectrum.ramanshift, spectrum.intensity
+    if not len(spectrum):
+        raise ValueError("Can not make a fingerprint of an empty spectrum.")
+    return SpectrumFingerprint(
+        ramanshift_min=float(np.min(ramanshift)),
+        ramanshift_max=float(np.max(ramanshift)),
+        length=len(spectrum),
+        intensity_max=float(np.max(intensity)),
+        snr=round(estimate_snr(intensity), 3),
+        preview=make_preview(ramanshift, intensity),
+    )
+
+
+def get_fingerprint_from_file(filepath: Path) -> SpectrumFingerprint | None:
+    """reads the file, None when the file can not be read or parsed"""
+    try:
+        spectrum = SpectrumReader(filepath).spectrum
+        if spectrum is None:
+            raise ValueError("No spectrum parsed from the file.")
+        return make_spectrum_fingerprint(spectrum)
+    except (OSError, ValueError, KeyError, TablibException) as exc:
+        logger.warning(f"Could not make fingerprint of {filepath}.\n{exc}")
+        return None
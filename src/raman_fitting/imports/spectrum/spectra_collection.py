@@ -2,16 +2,31 @@ from typing import List
 
 import numpy as np
 
-from pydantic import BaseModel, ValidationError, model_validator
+from pydantic import BaseModel, Field, ValidationError, model_validator
+import pydantic_numpy.typing as pnd
 
 from raman_fitting.models.deconvolution.spectrum_regions import RegionNames
 from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.processing.aggregation import (
+    AggregationSettings,
+    aggregate_intensity,
+)
+from raman_fitting.processing.resampling import (
+    ResampleSettings,
+    axes_are_equal,
+    resample_spectra,
+    trim_uncovered_points,
+)
 
 
 class SpectraDataCollection(BaseModel):
     spectra: List[SpectrumData]
     region_name: RegionNames
+    resample: ResampleSettings = Field(default_factory=ResampleSettings)
+    resampled: bool = False
+    aggregation: AggregationSettings = Field(default_factory=AggregationSettings)
     mean_spectrum: SpectrumData | None = None
+    std_intensity: pnd.Np1DArrayFp32 | None = Field(None, repr=False)
 
     @model_validator(mode="after")
     def check_spectra_have_same_label(self) -> "SpectraDataCollection":
@@ -29,28 +44,23 @@ class SpectraDataCollection(BaseModel):
             raise ValidationError(f"Spectra have different region_names {region_names}")
         return self
 
-    @model_validator(mode="after")
-    def check_spectra_lengths(self) -> "SpectraDataCollection":
-        unique_lengths_rs = set(len(i.ramanshift) for i in self.spectra)
-        unique_lengths_int = set(len(i.intensity) for i in self.spectra)
-        if len(unique_lengths_rs) > 1:
-            raise ValidationError(
-                f"The spectra have different ramanshift lengths where they should be the same.\n\t{unique_lengths_rs}"
-            )
-        if len(unique_lengths_int) > 1:
-            raise ValidationError(
-                f"The spectra have different intensity lengths where they should be the same.\n\t{unique_lengths_int}"
-            )
-
-        return self
-
     @model_validator(mode="after")
     def set_mean_spectrum(self) -> "SpectraDataCollection":
         # wrap this in a ProcessedSpectraCollection model
-        mean_int = np.mean(np.vstack([i.intensity for i in self.spectra]), axis=0)
-        mean_ramanshift = np.mean(
-            np.vstack([i.ramanshift for i in self.spectra]), axis=0
-        )
+        axes = [i.ramanshift for i in self.spectra]
+        if axes_are_equal(axes):
+            mean_ramanshift = axes[0]
+            intensities = (i.intensity for i in self.spectra)
+        else:
+            # spectra from different gratings or calibrations have different axes
+            mean_ramanshift, intensities = trim_uncovered_points(
+                *resample_spectra(
+                    axes, [i.intensity for i in self.spectra], settings=self.resample
+                )
+            )
+            self.resampled = True
+        mean_int, std_int = aggregate_intensity(intensities, settings=self.aggregation)
+        self.std_intensity = std_int.astype(np.float32)
         source_files = list(set(i.source for i in self.spectra))
         _label = "".join(map(str, set(i.label for i in self.spectra)))
         mean_spec = SpectrumData(
@@ -61,3 +71,4 @@ class SpectraDataCollection(BaseModel):
             source=source_files,
         )
         self.mean_spectrum = mean_spec
+        return self
@@ -4,9 +4,20 @@ from typing_extensions import Annotated
 from pathlib import Path
 from enum import StrEnum, auto
 from loguru import logger
-from raman_fitting.config.path_settings import RunModes
+from raman_fitting.config import settings
+from raman_fitting.config.path_settings import (
+    CACHE_DIR_NAME,
+    FIT_RESULTS_CACHE_DIR_NAME,
+    PROCESSED_SPECTRA_CACHE_DIR_NAME,
+    RunModes,
+)
+from raman_fitting.delegating.fit_cache import FitResultCache
 from raman_fitting.delegating.main_delegator import MainDelegator
+from raman_fitting.exports.exporter import ExportPlots
 from raman_fitting.imports.files.file_indexer import initialize_index_from_source_files
+from raman_fitting.processing.despike import get_default_cross_despiker
+from raman_fitting.processing.noise import NoiseMethods, get_default_noise_settings
+from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
 from .utils import get_package_version
 
 import typer
@@ -18,6 +29,12 @@ class MakeTypes(StrEnum):
     EXAMPLE = auto()
 
 
+class CacheTypes(StrEnum):
+    FIT = auto()
+    PROCESSED = auto()
+    ALL = auto()
+
+
 __version__ = "0.1.0"
 
 
@@ -62,13 +79,66 @@ def run(
             help="Selection of names of the composite LMfit models to use for fitting.",
         ),
     ],
+    plots: Annotated[
+        List[ExportPlots],
+        typer.Option(
+            "--plot",
+            default_factory=list,
+            show_default=False,
+            help="Selection of the plots to export, all plots when none are given.",
+        ),
+    ],
     run_mode: Annotated[RunModes, typer.Argument()] = RunModes.NORMAL,
     multiprocessing: Annotated[bool, typer.Option("--multiprocessing")] = False,
+    cache: Annotated[
+        bool,
+        typer.Option("--cache", help="Reuse the processed spectra from the cache."),
+    ] = False,
+    fit_cache: Annotated[
+        bool,
+        typer.Option(
+            "--fit-cache", help="Reuse the fit results of unchanged spectra and models."
+        ),
+    ] = False,
+    lean: Annotated[
+        bool,
+        typer.Option(
+            "--lean", help="Release the intermediate data that is not exported."
+        ),
+    ] = False,
+    fit_weights: Annotated[
+        Optional[NoiseMethods],
+        typer.Option(help="Weigh the points of the fits by their estimated noise."),
+    ] = None,
+    cross_despike: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--cross-despike/--no-cross-despike",
+            help="Replace the cosmic rays that show up in one position of a sample only.",
+            show_default=False,
+        ),
+    ] = None,
 ):
     if run_mode is None:
         print("No make run mode passed")
         raise typer.Exit()
-    kwargs = {"run_mode": run_mode, "use_multiprocessing": multiprocessing}
+    kwargs = {
+        "run_mode": run_mode,
+        "use_multiprocessing": multiprocessing,
+        "use_processing_cache": cache,
+        "use_fit_cache": fit_cache,
+        "lean_memory": lean,
+    }
+    if fit_weights is not None:
+        kwargs["fit_weights"] = get_default_noise_settings().model_copy(
+            update={"enabled": True, "method": fit_weights}
+        )
+    if plots:
+        kwargs["export_plots"] = plots
+    if cross_despike is not None:
+        kwargs["cross_despiker"] = get_default_cross_despiker().model_copy(
+            update={"enabled": cross_despike}
+        )
     if run_mode == RunModes.EXAMPLES:
         kwargs.update(
             {
@@ -106,6 +176,41 @@ def make(
         pass  # make config
 
 
+@app.command()
+def clear_cache(
+    models: Annotated[
+        List[str],
+        typer.Option(
+            default_factory=list,
+            show_default=False,
+            help="Selection of names of the models to invalidate the fit results of.",
+        ),
+    ],
+    cache_type: Annotated[CacheTypes, typer.Argument()] = CacheTypes.ALL,
+):
+    """
+    Clears the cached fit results and processed spectra.
+    --models only selects fit results, the processed spectra are not per model.
+    """
+    if models and cache_type == CacheTypes.PROCESSED:
+        raise typer.BadParameter(
+            "The processed spectra can not be cleared per model.", param_hint="--models"
+        )
+    cache_dir = settings.destination_dir / CACHE_DIR_NAME
+    if cache_type in (CacheTypes.FIT, CacheTypes.ALL):
+        fit_cache = FitResultCache(cache_dir=cache_dir / FIT_RESULTS_CACHE_DIR_NAME)
+        removed = fit_cache.invalidate(model_names=models)
+        print(f"Removed {removed} fit results from {fit_cache.cache_dir}")
+    if cache_type == CacheTypes.ALL and models:
+        print("Kept the processed spectra, they are not cleared per model.")
+    elif cache_type in (CacheTypes.PROCESSED, CacheTypes.ALL):
+        processing_cache = ProcessedSpectrumCache(
+            cache_dir=cache_dir / PROCESSED_SPECTRA_CACHE_DIR_NAME
+        )
+        removed = processing_cache.clear()
+        print(f"Removed {removed} processed spectra from {processing_cache.cache_dir}")
+
+
 @app.callback()
 def main(
     verbose: bool = False,
@@ -0,0 +1,68 @@
+"""
+Interning of the ramanshift axes. Spectra from one instrument mostly share an
+identical axis, which is stored once as a read-only array and referred to by
+all the spectra. Caches that depend on the axis can key on its identity.
+"""
+
+import hashlib
+import weakref
+from typing import Dict, Tuple
+
+import numpy as np
+
+AxisKey = Tuple[str, int, bytes]
+
+_interned_axes: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_interned_axis_keys: Dict[int, Tuple[weakref.ref, AxisKey]] = {}
+
+
+def calculate_axis_key(ramanshift: np.ndarray) -> AxisKey:
+    axis = np.ascontiguousarray(ramanshift)
+    digest = hashlib.blake2b(axis.tobytes(), digest_size=16).digest()
+    return axis.dtype.str, len(axis), digest
+
+
+def get_interned_axis_key(ramanshift: np.ndarray) -> AxisKey | None:
+    entry = _interned_axis_keys.get(id(ramanshift))
+    if entry is not None and entry[0]() is ramanshift:
+        return entry[1]
+    return None
+
+
+def get_axis_key(ramanshift: np.ndarray) -> AxisKey:
+    """identity of an axis by its content, used as key for caches that depend on the axis"""
+    axis_key = get_interned_axis_key(ramanshift)
+    if axis_key is None:
+        axis_key = calculate_axis_key(ramanshift)
+    return axis_key
+
+
+def is_interned_axis(ramanshift: np.ndarray) -> bool:
+    return get_interned_axis_key(ramanshift) is not None
+
+
+def intern_axis(ramanshift: np.ndarray) -> np.ndarray:
+    """
+    Returns the shared read-only float32 array with the same values as the axis.
+    The first axis with new values is copied once and kept as long as it is in use.
+    """
+    if is_interned_axis(ramanshift):
+        return ramanshift
+    axis = np.ascontiguousarray(ramanshift, dtype=np.float32)
+    axis_key = calculate_axis_key(axis)
+    shared_axis = _interned_axes.get(axis_key)
+    if shared_axis is not None:
+        return shared_axis
+    shared_axis = axis.copy()
+    shared_axis.flags.writeable = False
+    _interned_axes[axis_key] = shared_axis
+    axis_id = id(shared_axis)
+    _interned_axis_keys[axis_id] = (
+        weakref.ref(shared_axis, lambda _: _interned_axis_keys.pop(axis_id, None)),
+        axis_key,
+    )
+    return shared_axis
+
+
+def get_number_of_interned_axes() -> int:
+    return len(_interned_axes)
@@ -0,0 +1,438 @@
+"""
+Batched Levenberg-Marquardt for fitting one composite peak model to many spectra
+with a shared axis, such as the positions of a sample or the pixels of a map.
+The free parameters of the N problems are held in one (N, P) array and the damped
+Gauss-Newton steps of all problems are taken in lockstep with array operations,
+instead of one lmfit fit with its Python overhead per spectrum.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+from lmfit import Parameters
+from lmfit.model import Model
+
+from raman_fitting.models.deconvolution.jacobian import (
+    PEAK_ARGUMENT_NAMES,
+    PEAK_DERIVATIVES,
+    get_additive_components,
+    get_parameter_source,
+)
+from raman_fitting.models.deconvolution.lineshapes import PEAK_KERNELS, TINY
+
+MIN_DAMPING = 1.0e-12
+# no step lowers the cost anymore at this damping, the fit stalled
+MAX_DAMPING = 1.0e12
+# the reasons that a problem stopped, like the messages of lmfit's leastsq
+MESSAGE_CONVERGED = (
+    "The relative reduction of the cost or the step is at most ftol or xtol."
+)
+MESSAGE_ORTHOGONAL = "The gradient is orthogonal to the residual within gtol."
+MESSAGE_STALLED = "No step reduces the cost any further, ftol or xtol may be too small."
+MESSAGE_MAX_ITERATIONS = "The number of iterations reached max_iterations."
+MESSAGE_NOT_FINITE = "The initial cost is not finite."
+
+
+@dataclass
+class BatchCompositeModel:
+    """
+    A sum of peaks with its arguments resolved to a column of the free parameters or
+    to a fixed value. Evaluates the model and its Jacobian for (N, P) parameters.
+    """
+
+    components: List[Model]
+    params: Parameters
+    var_names: List[str]
+    # per component, the argument name to a column of the free parameters or a value
+    arguments: List[Dict[str, int | float]]
+
+    @classmethod
+    def from_model(cls, model: Model, params: Parameters) -> "BatchCompositeModel":
+        components = get_additive_components(model)
+        if components is None:
+            raise ValueError(f"The batched solver can not fit the model {model.name}.")
+        var_names = [name for name, par in params.items() if par.vary]
+        var_index = {name: n for n, name in enumerate(var_names)}
+        arguments = []
+        for component in components:
+            component_arguments = {}
+            for root_name in PEAK_ARGUMENT_NAMES:
+                name = f"{component.prefix}{root_name}"
+                if name not in params:
+                    continue
+                source = get_parameter_source(params, name)
+                component_arguments[root_name] = (
+                    var_index[source] if source is not None else params[name].value
+                )
+            arguments.append(component_arguments)
+        return cls(
+            components=components,
+            params=params,
+            var_names=var_names,
+            arguments=arguments,
+        )
+
+    @property
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        lower = np.array([self.params[i].min for i in self.var_names], dtype=float)
+        upper = np.array([self.params[i].max for i in self.var_names], dtype=float)
+        return lower, upper
+
+    @property
+    def init_values(self) -> np.ndarray:
+        return np.array([self.params[i].value for i in self.var_names], dtype=float)
+
+    def get_arguments(self, n: int, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """The arguments of a component as (N, 1) columns, broadcasting over the axis."""
+        return {
+            root_name: values[:, [source]] if isinstance(source, int) else source
+            for root_name, source in self.arguments[n].items()
+        }
+
+    def evaluate(self, x: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """(N, M) model of the (N, P) free parameters on the axis of M points"""
+        result = np.zeros((len(values), len(x)))
+        peak = np.empty_like(result)
+        for n, component in enumerate(self.components):
+            arguments = self.get_arguments(n, values)
+            PEAK_KERNELS[type(component)](x, peak, **arguments)
+            result += peak
+        return result
+
+    def jacobian(self, x: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """(N, M, P) derivatives of the model to the free parameters"""
+        jacobian = np.zeros((len(values), len(x), len(self.var_names)))
+        for n, component in enumerate(self.components):
+            arguments = self.get_arguments(n, values)
+            derivatives = PEAK_DERIVATIVES[type(component)](x, **arguments)
+            for root_name, derivative in derivatives.items():
+                source = self.arguments[n].get(root_name)
+                if isinstance(source, int):
+                    jacobian[:, :, source] += derivative
+        return jacobian
+
+
+@dataclass
+class BatchFitResult:
+    """The fitted free parameters and statistics of each problem, by row."""
+
+    params: Parameters
+    var_names: List[str]
+    values: np.ndarray  # (N, P)
+    stderr: np.ndarray  # (N, P)
+    success: np.ndarray  # (N,)
+    message: np.ndarray  # (N,)
+    nfev: np.ndarray  # (N,)
+    niter: np.ndarray  # (N,)
+    chisqr: np.ndarray  # (N,)
+    ndata: int
+    residual: np.ndarray = field(repr=False)  # (N, M)
+
+    @property
+    def nvarys(self) -> int:
+        return len(self.var_names)
+
+    @property
+    def nfree(self) -> int:
+        return max(1, self.ndata - self.nvarys)
+
+    @property
+    def redchi(self) -> np.ndarray:
+        return self.chisqr / self.nfree
+
+    @property
+    def aic(self) -> np.ndarray:
+        return self.ndata * np.log(np.maximum(self.chisqr, TINY) / self.ndata) + (
+            2 * self.nvarys
+        )
+
+    @property
+    def bic(self) -> np.ndarray:
+        return self.ndata * np.log(np.maximum(self.chisqr, TINY) / self.ndata) + (
+            np.log(self.ndata) * self.nvarys
+        )
+
+    def get_params(self, index: int) -> Parameters:
+        """The parameters of one problem, with the constrained parameters updated."""
+        params = self.params.copy()
+        for n, name in enumerate(self.var_names):
+            params[name].value = self.values[index, n]
+            stderr = self.stderr[index, n]
+            params[name].stderr = float(stderr) if np.isfinite(stderr) else None
+        params.update_constraints()
+        return params
+
+    def get_values(self, index: int) -> Dict[str, float]:
+        return self.get_params(index).valuesdict()
+
+    def get_statistics(self, index: int) -> Dict[str, float | int | bool | str]:
+        return {
+            "success": bool(self.success[index]),
+            "message": str(self.message[index]),
+            "nfev": int(self.nfev[index]),
+            "niter": int(self.niter[index]),
+            "chisqr": float(self.chisqr[index]),
+            "redchi": float(self.redchi[index]),
+            "aic": float(self.aic[index]),
+            "bic": float(self.bic[index]),
+        }
+
+    def __len__(self):
+        return len(self.values)
+
+
+@dataclass
+class BoundsTransform:
+    """
+    The transformation of lmfit (from MINUIT) between the bounded parameters and
+    unbounded internal values, so that the steps are taken without bounds.
+    """
+
+    lower: np.ndarray
+    upper: np.ndarray
+
+    def __post_init__(self):
+        self.has_lower = np.isfinite(self.lower)
+        self.has_upper = np.isfinite(self.upper)
+        self.both = self.has_lower & self.has_upper
+        self.lower_only = self.has_lower & ~self.has_upper
+        self.upper_only = ~self.has_lower & self.has_upper
+
+    def to_internal(self, values: np.ndarray) -> np.ndarray:
+        values = np.clip(values, self.lower, self.upper)
+        internal = values.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            internal = np.where(
+                self.both,
+                np.arcsin(
+                    np.clip(
+                        2 * (values - self.lower) / (self.upper - self.lower) - 1, -1, 1
+                    )
+                ),
+                internal,
+            )
+            internal = np.where(
+                self.lower_only, np.sqrt((values - self.lower + 1) ** 2 - 1), internal
+            )
+            internal = np.where(
+                self.upper_only, np.sqrt((self.upper - values + 1) ** 2 - 1), internal
+            )
+        return internal
+
+    def from_internal(self, internal: np.ndarray) -> np.ndarray:
+        values = internal.copy()
+        with np.errstate(invalid="ignore"):
+            values = np.where(
+                self.both,
+                self.lower + (self.upper - self.lower) / 2 * (np.sin(internal) + 1),
+                values,
+            )
+            values = np.where(
+                self.lower_only, self.lower - 1 + np.sqrt(internal**2 + 1), values
+            )
+            values = np.where(
+                self.upper_only, self.upper + 1 - np.sqrt(internal**2 + 1), values
+            )
+        return values
+
+    def gradient(self, internal: np.ndarray) -> np.ndarray:
+        """the derivative of the parameters to the internal values"""
+        gradient = np.ones_like(internal)
+        with np.errstate(invalid="ignore"):
+            gradient = np.where(
+                self.both, (self.upper - self.lower) / 2 * np.cos(internal), gradient
+            )
+            gradient = np.where(
+                self.lower_only, internal / np.sqrt(internal**2 + 1), gradient
+            )
+            gradient = np.where(
+                self.upper_only, -internal / np.sqrt(internal**2 + 1), gradient
+            )
+        return gradient
+
+
+def solve_damped_steps(
+    jacobian: np.ndarray,
+    residual: np.ndarray,
+    damping: np.ndarray,
+    scale: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The Levenberg-Marquardt steps (JᵀJ + λ D) δ = -Jᵀr of a batch, and the gradient
+    Jᵀr. D is the largest diag(JᵀJ) so far, like the scaling of MINPACK, the scale
+    is updated in place.
+    """
+    normal = np.einsum("nmp,nmq->npq", jacobian, jacobian)
+    gradient = np.einsum("nmp,nm->np", jacobian, residual)
+    np.maximum(scale, np.diagonal(normal, axis1=1, axis2=2), out=scale)
+    # parameters without influence, like the center of a peak with zero amplitude
+    diagonal = np.maximum(scale, TINY * (1 + scale.max(axis=1, keepdims=True)))
+    damped = normal.copy()
+    rows, columns = np.diag_indices(normal.shape[1])
+    damped[:, rows, columns] += damping[:, np.newaxis] * diagonal
+    try:
+        steps = np.linalg.solve(damped, -gradient[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        steps = -np.einsum("npq,nq->np", np.linalg.pinv(damped), gradient)
+    return steps, gradient
+
+
+def get_gradient_norm(
+    jacobian: np.ndarray, residual: np.ndarray, gradient: np.ndarray
+) -> np.ndarray:
+    """the largest cosine between the residual and a column of the Jacobian"""
+    column_norms = np.linalg.norm(jacobian, axis=1)
+    residual_norms = np.linalg.norm(residual, axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosines = np.abs(gradient) / (column_norms * residual_norms)
+    return np.nan_to_num(cosines, nan=0.0, posinf=0.0).max(axis=1, initial=0.0)
+
+
+def get_standard_errors(
+    jacobian: np.ndarray, chisqr: np.ndarray, nfree: int
+) -> np.ndarray:
+    """from the covariance inv(JᵀJ) scaled by the reduced chi-square, like lmfit"""
+    normal = np.einsum("nmp,nmq->npq", jacobian, jacobian)
+    covariance = np.linalg.pinv(normal) * (chisqr / nfree)[:, np.newaxis, np.newaxis]
+    variance = np.diagonal(covariance, axis1=1, axis2=2)
+    return np.sqrt(np.where(variance >= 0, variance, np.nan))
+
+
+def fit_batch(
+    model: Model,
+    y: np.ndarray,
+    params: Parameters,
+    x: np.ndarray,
+    weights: np.ndarray | None = None,
+    init_values: np.ndarray | None = None,
+    max_iterations: int = 1000,
+    ftol: float = 1.5e-8,
+    xtol: float = 1.5e-8,
+    gtol: float = 0.0,
+    damping: float = 1.0e-3,
+) -> BatchFitResult:
+    """
+    Fits the model to each row of y, starting from the values of params or from the
+    (N, P) init_values. The weights multiply the residual like in lmfit, per point or
+    per problem and point. The steps are taken on the internal values of lmfit's
+    transformation of the bounds.
+    A problem converges when a step reduces the cost or moves the parameters by less
+    than the relative ftol or xtol, or the gradient is orthogonal within gtol.
+    Problems that do not converge within the max_iterations are not a success, nor
+    are the problems that stall, where no step reduces the cost before the damping
+    exceeds MAX_DAMPING, like the ier 6 to 8 of MINPACK. The message says why each
+    problem stopped.
+    """
+    batch_model = BatchCompositeModel.from_model(model, params)
+    x = np.asarray(x, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n_problems, n_points = y.shape
+    if n_points != len(x):
+        raise ValueError(f"Length of the axis {len(x)} does not match y {n_points}.")
+    if weights is not None:
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), y.shape)
+    transform = BoundsTransform(*batch_model.bounds)
+    if init_values is None:
+        values = np.tile(batch_model.init_values, (n_problems, 1))
+    else:
+        values = np.array(init_values, dtype=float).reshape(n_problems, -1)
+    internal = transform.to_internal(values)
+    values = transform.from_internal(internal)
+
+    def calculate_residual(index: np.ndarray, values: np.ndarray) -> np.ndarray:
+        residual = batch_model.evaluate(x, values) - y[index]
+        return residual * weights[index] if weights is not None else residual
+
+    def calculate_jacobian(index: np.ndarray, internal: np.ndarray) -> np.ndarray:
+        """to the internal values, with the chain rule of the bounds transformation"""
+        jacobian = batch_model.jacobian(x, transform.from_internal(internal))
+        jacobian *= transform.gradient(internal)[:, np.newaxis, :]
+        if weights is not None:
+            jacobian *= weights[index][..., np.newaxis]
+        return jacobian
+
+    all_index = np.arange(n_problems)
+    residual = calculate_residual(all_index, values)
+    jacobian = calculate_jacobian(all_index, internal)
+    cost = np.einsum("nm,nm->n", residual, residual)
+    damping = np.full(n_problems, damping)
+    scale = np.zeros((n_problems, len(batch_model.var_names)))
+    active = np.isfinite(cost)
+    success = np.zeros(n_problems, dtype=bool)
+    message = np.full(n_problems, MESSAGE_MAX_ITERATIONS, dtype=object)
+    message[~active] = MESSAGE_NOT_FINITE
+    nfev = np.ones(n_problems, dtype=int)
+    niter = np.zeros(n_problems, dtype=int)
+
+    for _ in range(max_iterations):
+        index = np.flatnonzero(active)
+        if not index.size:
+            break
+        niter[index] += 1
+        index_scale = scale[index]
+        steps, gradient = solve_damped_steps(
+            jacobian[index], residual[index], damping[index], index_scale
+        )
+        scale[index] = index_scale
+        if gtol > 0:
+            orthogonal = (
+                get_gradient_norm(jacobian[index], residual[index], gradient) <= gtol
+            )
+            success[index[orthogonal]] = True
+            message[index[orthogonal]] = MESSAGE_ORTHOGONAL
+            active[index[orthogonal]] = False
+            index, steps = index[~orthogonal], steps[~orthogonal]
+        trial_internal = internal[index] + steps
+        trial_values = transform.from_internal(trial_internal)
+        trial_residual = calculate_residual(index, trial_values)
+        trial_cost = np.einsum("nm,nm->n", trial_residual, trial_residual)
+        nfev[index] += 1
+
+        improved = np.isfinite(trial_cost) & (trial_cost < cost[index])
+        accepted = index[improved]
+        reduction = (cost[accepted] - trial_cost[improved]) / np.maximum(
+            cost[accepted], TINY
+        )
+        # the sizes in the scaled norm of MINPACK
+        scale_root = np.sqrt(scale[accepted])
+        step_size = np.linalg.norm(scale_root * steps[improved], axis=1)
+        internal_size = np.linalg.norm(scale_root * internal[accepted], axis=1)
+        internal[accepted] = trial_internal[improved]
+        values[accepted] = trial_values[improved]
+        residual[accepted] = trial_residual[improved]
+        cost[accepted] = trial_cost[improved]
+        jacobian[accepted] = calculate_jacobian(accepted, internal[accepted])
+        damping[accepted] = np.maximum(damping[accepted] / 10, MIN_DAMPING)
+        converged = accepted[
+            (reduction <= ftol) | (step_size <= xtol * (internal_size + xtol))
+        ]
+
+        success[converged] = True
+        message[converged] = MESSAGE_CONVERGED
+        active[converged] = False
+
+        rejected = index[~improved]
+        damping[rejected] *= 10
+        stalled = rejected[damping[rejected] > MAX_DAMPING]
+        message[stalled] = MESSAGE_STALLED
+        active[stalled] = False
+
+    # the errors of the parameters, from the Jacobian without the transformation
+    final_jacobian = batch_model.jacobian(x, values)
+    if weights is not None:
+        final_jacobian *= weights[..., np.newaxis]
+    nfree = max(1, n_points - len(batch_model.var_names))
+    return BatchFitResult(
+        params=params,
+        var_names=batch_model.var_names,
+        values=values,
+        stderr=get_standard_errors(final_jacobian, cost, nfree),
+        success=success,
+        message=message,
+        nfev=nfev,
+        niter=niter,
+        chisqr=cost,
+        ndata=n_points,
+        residual=residual,
+    )
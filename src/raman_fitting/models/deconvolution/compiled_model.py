@@ -0,0 +1,172 @@
+"""
+Compiles a sum of peaks into one flat function of the parameters. The peaks of each
+lineshape are evaluated together into the rows of a preallocated (P, M) buffer,
+which is summed in place. lmfit instead recurses through its tree of CompositeModels,
+with a dict of arguments and new arrays for each component on every evaluation.
+The lmfit model stays the reference, a compiled model is validated against it.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from loguru import logger
+from lmfit import Parameters
+from lmfit.model import Model, ModelResult
+
+from raman_fitting.models.deconvolution.jacobian import (
+    PEAK_ARGUMENT_NAMES,
+    fit_with_jacobian,
+    get_additive_components,
+)
+from raman_fitting.models.deconvolution.lineshapes import (
+    PEAK_KERNELS,
+    TINY,
+    voigt_into,
+)
+
+
+@dataclass
+class LineshapeGroup:
+    """The peaks of one lineshape, in a block of rows of the buffer."""
+
+    kernel: Callable[..., None]
+    rows: slice
+    # per argument of the lineshape, the names of the parameters of each peak
+    parameter_names: Dict[str, List[str]]
+    needs_work: bool = False
+
+    def get_arguments(self, params: Parameters) -> Dict[str, np.ndarray]:
+        return {
+            root_name: np.array([params[name].value for name in names])[:, np.newaxis]
+            for root_name, names in self.parameter_names.items()
+        }
+
+
+@dataclass
+class CompiledCompositeModel:
+    """
+    The flat function of a sum of peaks. The buffers are allocated for the length of
+    the axis on the first evaluation and reused while the length stays the same.
+    """
+
+    groups: List[LineshapeGroup]
+    n_peaks: int
+    _buffer: np.ndarray | None = field(default=None, init=False, repr=False)
+    _total: np.ndarray | None = field(default=None, init=False, repr=False)
+    _work: Dict[int, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+
+    @classmethod
+    def from_model(
+        cls, model: Model, params: Parameters
+    ) -> "CompiledCompositeModel | None":
+        """None for models that are not a sum of known peaks"""
+        components = get_additive_components(model)
+        if components is None:
+            return None
+        components_by_type: Dict[type, List[Model]] = {}
+        for component in components:
+            components_by_type.setdefault(type(component), []).append(component)
+        groups, start = [], 0
+        for component_type, type_components in components_by_type.items():
+            # the optional arguments, like the gamma of a Voigt, are also parameters
+            first = type_components[0]
+            root_names = [
+                i for i in PEAK_ARGUMENT_NAMES if f"{first.prefix}{i}" in params
+            ]
+            groups.append(
+                LineshapeGroup(
+                    kernel=PEAK_KERNELS[component_type],
+                    rows=slice(start, start + len(type_components)),
+                    parameter_names={
+                        root_name: [f"{i.prefix}{root_name}" for i in type_components]
+                        for root_name in root_names
+                    },
+                    needs_work=PEAK_KERNELS[component_type] is voigt_into,
+                )
+            )
+            start += len(type_components)
+        return cls(groups=groups, n_peaks=start)
+
+    def get_buffers(self, n_points: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._buffer is None or self._buffer.shape[1] != n_points:
+            self._buffer = np.empty((self.n_peaks, n_points))
+            self._total = np.empty(n_points)
+            self._work = {
+                n: np.empty(self._buffer[group.rows].shape, dtype=complex)
+                for n, group in enumerate(self.groups)
+                if group.needs_work
+            }
+        return self._buffer, self._total
+
+    def evaluate_into_buffer(self, params: Parameters, x: np.ndarray) -> np.ndarray:
+        """The sum of the peaks in the reused buffer, overwritten on the next call."""
+        buffer, total = self.get_buffers(len(x))
+        for n, group in enumerate(self.groups):
+            group.kernel(
+                x,
+                buffer[group.rows],
+                work=self._work.get(n),
+                **group.get_arguments(params),
+            )
+        return np.sum(buffer, axis=0, out=total)
+
+    def evaluate(self, params: Parameters, x: np.ndarray) -> np.ndarray:
+        return self.evaluate_into_buffer(params, np.asarray(x, dtype=float)).copy()
+
+    def residual(self, params: Parameters, data, weights, x=None, **kwargs):
+        """(model - data) * weights, in the signature of the residual of lmfit Models"""
+        diff = self.evaluate_into_buffer(params, x) - data
+        if weights is not None:
+            diff *= weights
+        return diff
+
+
+def validate_compiled_model(
+    compiled_model: CompiledCompositeModel,
+    model: Model,
+    params: Parameters,
+    x: np.ndarray,
+    rtol: float = 1e-8,
+) -> bool:
+    """Compares the compiled model with the evaluation of lmfit, the reference."""
+    x = np.asarray(x, dtype=float)
+    expected = model.eval(params, x=x)
+    atol = rtol * max(float(np.max(np.abs(expected), initial=0)), TINY)
+    return bool(
+        np.allclose(compiled_model.evaluate(params, x), expected, rtol=rtol, atol=atol)
+    )
+
+
+def compile_composite_model(
+    model: Model, params: Parameters, x: np.ndarray
+) -> CompiledCompositeModel | None:
+    """The compiled model when it is available and matches lmfit on the axis."""
+    compiled_model = CompiledCompositeModel.from_model(model, params)
+    if compiled_model is None:
+        return None
+    if not validate_compiled_model(compiled_model, model, params, x):
+        logger.warning(
+            f"The compiled model of {model.name} does not match lmfit, fit with lmfit."
+        )
+        return None
+    return compiled_model
+
+
+def fit_compiled_model(
+    model: Model,
+    y: np.ndarray,
+    params: Parameters,
+    x: np.ndarray,
+    compiled: bool = True,
+    **kwargs,
+) -> ModelResult:
+    """
+    Fits with the compiled model as the objective, and falls back to the evaluation
+    of lmfit for other models. Whether it was compiled is set on the result.
+    """
+    compiled_model = compile_composite_model(model, params, x) if compiled else None
+    objective = compiled_model.residual if compiled_model is not None else None
+    result = fit_with_jacobian(model, y, params, x, objective=objective, **kwargs)
+    result.compiled = compiled_model is not None
+    return result
@@ -0,0 +1,228 @@
+"""
+Analytic Jacobians of the composite peak models, for the leastsq solver.
+Without them the solver estimates the Jacobian by finite differences,
+which costs one extra model evaluation per free parameter.
+"""
+
+import operator
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+import numpy as np
+from lmfit import Parameters
+from lmfit.model import CompositeModel, Model, ModelResult
+from scipy.special import wofz
+
+from raman_fitting.models.deconvolution.lmfit_parameter import LMFIT_MODEL_MAPPER
+
+SQRT2 = np.sqrt(2)
+SQRT2PI = np.sqrt(2 * np.pi)
+SQRTPI = np.sqrt(np.pi)
+# the arguments of the peak functions, the other parameters of a peak are derived
+PEAK_ARGUMENT_NAMES = ("amplitude", "center", "sigma", "gamma")
+
+
+def lorentzian_derivatives(
+    x: np.ndarray, amplitude: float, center: float, sigma: float, **_
+) -> Dict[str, np.ndarray]:
+    u = (x - center) / sigma
+    denominator = 1 + u**2
+    shape = 1 / (np.pi * sigma * denominator)
+    value = amplitude * shape
+    return {
+        "amplitude": shape,
+        "center": value * 2 * u / (sigma * denominator),
+        "sigma": value / sigma * (2 * u**2 / denominator - 1),
+    }
+
+
+def gaussian_derivatives(
+    x: np.ndarray, amplitude: float, center: float, sigma: float, **_
+) -> Dict[str, np.ndarray]:
+    dx = x - center
+    shape = np.exp(-(dx**2) / (2 * sigma**2)) / (sigma * SQRT2PI)
+    value = amplitude * shape
+    return {
+        "amplitude": shape,
+        "center": value * dx / sigma**2,
+        "sigma": value * (dx**2 / sigma**3 - 1 / sigma),
+    }
+
+
+def voigt_derivatives(
+    x: np.ndarray,
+    amplitude: float,
+    center: float,
+    sigma: float,
+    gamma: float | None = None,
+    **_,
+) -> Dict[str, np.ndarray]:
+    """from the derivative of the Faddeeva function, w'(z) = -2 z w(z) + 2i / sqrt(pi)"""
+    gamma = sigma if gamma is None else gamma
+    z = (x - center + 1j * gamma) / (sigma * SQRT2)
+    w = wofz(z)
+    dw = -2 * z * w + 2j / SQRTPI
+    scale = amplitude / (sigma * SQRT2PI)
+    return {
+        "amplitude": w.real / (sigma * SQRT2PI),
+        "center": scale * (dw * -1 / (sigma * SQRT2)).real,
+        "sigma": -scale * w.real / sigma + scale * (dw * -z / sigma).real,
+        "gamma": scale * (dw * 1j / (sigma * SQRT2)).real,
+    }
+
+
+PEAK_DERIVATIVES: Dict[type, Callable[..., Dict[str, np.ndarray]]] = {
+    LMFIT_MODEL_MAPPER["Lorentzian"]: lorentzian_derivatives,
+    LMFIT_MODEL_MAPPER["Gaussian"]: gaussian_derivatives,
+    LMFIT_MODEL_MAPPER["Voigt"]: voigt_derivatives,
+}
+
+
+def get_additive_components(model: Model) -> List[Model] | None:
+    """The peaks of a sum of peaks, None for any other composition."""
+    if isinstance(model, CompositeModel):
+        if model.op is not operator.add:
+            return None
+        left = get_additive_components(model.left)
+        right = get_additive_components(model.right)
+        if left is None or right is None:
+            return None
+        return left + right
+    if type(model) not in PEAK_DERIVATIVES:
+        return None
+    return [model]
+
+
+def get_parameter_source(params: Parameters, name: str) -> str | None:
+    """
+    The free parameter that a parameter of a peak depends on, such as the sigma of a
+    Voigt gamma. None for fixed parameters, raises for other constraints.
+    """
+    param = params[name]
+    if param.vary:
+        return name
+    if not param.expr:
+        return None
+    expr = param.expr.strip()
+    if expr in params:
+        return get_parameter_source(params, expr)
+    raise ValueError(f"No analytic derivative for the constraint {name} = {expr}")
+
+
+@dataclass
+class CompositeJacobian:
+    """
+    Derivatives of the weighted residual to the free parameters, in the call signature
+    of the Dfun of lmfit's leastsq: (params, data, weights, x=x) -> (len(x), nvarys).
+    The number of calls is counted for the report of the saved model evaluations.
+    """
+
+    components: List[Model]
+    njev: int = field(default=0, init=False)
+
+    def __call__(self, params: Parameters, data, weights, x=None, **kwargs):
+        self.njev += 1
+        var_names = [name for name, par in params.items() if par.vary]
+        var_index = {name: n for n, name in enumerate(var_names)}
+        x = np.asarray(x, dtype=float)
+        jacobian = np.zeros((len(x), len(var_names)))
+        for component in self.components:
+            prefix = component.prefix
+            values = {
+                root_name: params[f"{prefix}{root_name}"].value
+                for root_name in PEAK_ARGUMENT_NAMES
+                if f"{prefix}{root_name}" in params
+            }
+            derivatives = PEAK_DERIVATIVES[type(component)](x, **values)
+            for root_name, derivative in derivatives.items():
+                name = f"{prefix}{root_name}"
+                if name not in params:
+                    continue
+                source = get_parameter_source(params, name)
+                if source in var_index:
+                    jacobian[:, var_index[source]] += derivative
+        if weights is not None:
+            jacobian *= np.asarray(weights, dtype=float)[:, np.newaxis]
+        return jacobian
+
+
+def make_composite_jacobian(
+    model: Model, params: Parameters
+) -> CompositeJacobian | None:
+    """The analytic Jacobian of a sum of known peaks, None when it is not available."""
+    components = get_additive_components(model)
+    if components is None:
+        return None
+    try:
+        for component in components:
+            for root_name in PEAK_ARGUMENT_NAMES:
+                name = f"{component.prefix}{root_name}"
+                if name in params:
+                    get_parameter_source(params, name)
+    except ValueError:
+        return None
+    return CompositeJacobian(components=components)
+
+
+def get_jacobian_report(result: ModelResult, jacobian: CompositeJacobian) -> Dict:
+    """
+    The finite differences would have taken one model evaluation per free parameter
+    for each Jacobian, these are the evaluations that the analytic Jacobian saved.
+    """
+    return {
+        "analytic": True,
+        "nfev": result.nfev,
+        "njev": jacobian.njev,
+        "saved_nfev": jacobian.njev * result.nvarys,
+    }
+
+
+def fit_with_jacobian(
+    model: Model,
+    y: np.ndarray,
+    params: Parameters,
+    x: np.ndarray,
+    method: str = "leastsq",
+    analytic_jacobian: bool = True,
+    fit_kws: Dict | None = None,
+    objective: Callable | None = None,
+    weights: np.ndarray | None = None,
+    **kwargs,
+) -> ModelResult:
+    """
+    Passes the analytic Jacobian as Dfun to leastsq when it is available for the
+    model. The report of the evaluations is set as jacobian_report on the result.
+    An objective in the signature of the residual of lmfit Models replaces the
+    evaluation of the model during the fit, the result is the same ModelResult.
+    """
+    fit_kws = dict(fit_kws or {})
+    jacobian = None
+    if analytic_jacobian and method == "leastsq" and "Dfun" not in fit_kws:
+        jacobian = make_composite_jacobian(model, params)
+    if jacobian is not None:
+        fit_kws["Dfun"] = jacobian
+    if objective is None:
+        result = model.fit(
+            y, params, x=x, method=method, weights=weights, fit_kws=fit_kws, **kwargs
+        )
+    else:
+        # as in Model.fit, with the objective instead of the residual of the model
+        result = ModelResult(
+            model,
+            deepcopy(params),
+            method=method,
+            fcn_kws={"x": np.asarray(x, dtype=float)},
+            nan_policy=model.nan_policy,
+            **kwargs,
+            **fit_kws,
+        )
+        result.userfcn = objective
+        result.fit(data=np.asarray(y, dtype=float), weights=weights)
+        result.components = model.components
+    result.jacobian_report = (
+        get_jacobian_report(result, jacobian)
+        if jacobian is not None
+        else {"analytic": False, "nfev": result.nfev}
+    )
+    return result
@@ -0,0 +1,81 @@
+"""
+The lineshapes of lmfit as kernels that write into a preallocated output array.
+The parameters broadcast against the axis, so a (P, 1) column evaluates a block of
+peaks and a (N, 1) column one peak for a batch of problems. The lineshapes of lmfit
+clip sigma with the builtin max, which does not broadcast over arrays of parameters.
+"""
+
+from typing import Callable, Dict
+
+import numpy as np
+from scipy.special import wofz
+
+from raman_fitting.models.deconvolution.jacobian import SQRT2, SQRT2PI
+from raman_fitting.models.deconvolution.lmfit_parameter import LMFIT_MODEL_MAPPER
+
+TINY = 1.0e-15
+
+
+def lorentzian_into(
+    x: np.ndarray,
+    out: np.ndarray,
+    amplitude: np.ndarray,
+    center: np.ndarray,
+    sigma: np.ndarray,
+    **_,
+) -> None:
+    sigma = np.maximum(sigma, TINY)
+    np.subtract(x, center, out=out)
+    out /= sigma
+    np.square(out, out=out)
+    out += 1
+    np.reciprocal(out, out=out)
+    out *= amplitude / (np.pi * sigma)
+
+
+def gaussian_into(
+    x: np.ndarray,
+    out: np.ndarray,
+    amplitude: np.ndarray,
+    center: np.ndarray,
+    sigma: np.ndarray,
+    **_,
+) -> None:
+    sigma = np.maximum(sigma, TINY)
+    np.subtract(x, center, out=out)
+    out /= sigma
+    np.square(out, out=out)
+    out *= -0.5
+    np.exp(out, out=out)
+    out *= amplitude / (SQRT2PI * sigma)
+
+
+def voigt_into(
+    x: np.ndarray,
+    out: np.ndarray,
+    amplitude: np.ndarray,
+    center: np.ndarray,
+    sigma: np.ndarray,
+    gamma: np.ndarray | None = None,
+    work: np.ndarray | None = None,
+    **_,
+) -> None:
+    """work is a complex buffer of the shape of out for the Faddeeva function"""
+    gamma = sigma if gamma is None else gamma
+    sigma = np.maximum(sigma, TINY)
+    if work is None:
+        work = np.empty(out.shape, dtype=complex)
+    np.subtract(x, center, out=work)
+    work += 1j * gamma
+    work /= sigma * SQRT2
+    wofz(work, out=work)
+    np.copyto(out, work.real)
+    out *= amplitude / (sigma * SQRT2PI)
+
+
+# the lineshapes of lmfit, written into out
+PEAK_KERNELS: Dict[type, Callable[..., None]] = {
+    LMFIT_MODEL_MAPPER["Lorentzian"]: lorentzian_into,
+    LMFIT_MODEL_MAPPER["Gaussian"]: gaussian_into,
+    LMFIT_MODEL_MAPPER["Voigt"]: voigt_into,
+}
@@ -22,3 +22,5 @@ class SpectrumRegionLimits(BaseModel):
     min: int
     max: int
     extra_margin: int = 20
+    # bin the region to this resolution in cm-1 before the fitting
+    resolution: float | None = None
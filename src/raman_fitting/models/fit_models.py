@@ -1,17 +1,22 @@
 from typing import Dict
 import time
 
+import numpy as np
+
 from pydantic import BaseModel, model_validator, Field, ConfigDict
-from lmfit import Model as LMFitModel
+import pydantic_numpy.typing as pnd
+from lmfit import Model as LMFitModel, Parameters
 from lmfit.model import ModelResult
 
 from raman_fitting.models.deconvolution.base_model import BaseLMFitModel
+from raman_fitting.models.deconvolution.batch_solver import BatchFitResult, fit_batch
+from raman_fitting.models.deconvolution.compiled_model import fit_compiled_model
 from raman_fitting.models.deconvolution.spectrum_regions import RegionNames
 from raman_fitting.models.post_deconvolution.calculate_params import (
     calculate_ratio_of_unique_vars_in_results,
 )
 
-from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
 
 
 class SpectrumFitModel(BaseModel):
@@ -21,6 +26,10 @@ class SpectrumFitModel(BaseModel):
     model: BaseLMFitModel
     region: RegionNames
     fit_kwargs: Dict = Field(default_factory=dict, repr=False)
+    weights: pnd.Np1DArrayFp64 | None = Field(None, repr=False)
+    # best values of an already fitted model that start this fit, by parameter name
+    init_values: Dict[str, float] = Field(default_factory=dict, repr=False)
+    warm_start: str | None = None
     fit_result: ModelResult = Field(None, init_var=False)
     param_results: Dict = Field(default_factory=dict)
     elapsed_time: float = Field(0, init_var=False, repr=False)
@@ -35,12 +44,26 @@ class SpectrumFitModel(BaseModel):
             )
         return self
 
+    @model_validator(mode="after")
+    def match_weights_length(self) -> "SpectrumFitModel":
+        if self.weights is not None and len(self.weights) != len(self.spectrum):
+            raise ValueError(
+                f"Length of weights {len(self.weights)} does not match the spectrum {len(self.spectrum)}"
+            )
+        return self
+
     def run_fit(self) -> None:
         if "method" not in self.fit_kwargs:
             self.fit_kwargs["method"] = "leastsq"
         lmfit_model = self.model.lmfit_model
         start_time = time.time()
-        fit_result = call_fit_on_model(lmfit_model, self.spectrum, **self.fit_kwargs)
+        fit_result = call_fit_on_model(
+            lmfit_model,
+            self.spectrum,
+            weights=self.weights,
+            init_values=self.init_values,
+            **self.fit_kwargs,
+        )
         end_time = time.time()
         elapsed_seconds = abs(start_time - end_time)
         self.elapsed_time = elapsed_seconds
@@ -55,13 +78,57 @@ class SpectrumFitModel(BaseModel):
             param_results, raise_exception=False
         )
         self.param_results["ratios"] = params_ratio_vars
+        self.param_results["warm_start"] = self.warm_start
+        if hasattr(self.fit_result, "jacobian_report"):
+            self.param_results["jacobian"] = self.fit_result.jacobian_report
+        self.param_results["compiled"] = getattr(self.fit_result, "compiled", False)
+        # step of the fitted axis, coarser than the measurement when the region is binned
+        self.param_results["resolution"] = float(
+            np.median(np.abs(np.diff(self.spectrum.ramanshift)))
+        )
 
 
 def call_fit_on_model(
-    model: LMFitModel, spectrum: SpectrumData, method="leastsq", **kwargs
+    model: LMFitModel,
+    spectrum: SpectrumData,
+    method="leastsq",
+    weights: np.ndarray | None = None,
+    init_values: Dict[str, float] | None = None,
+    **kwargs,
 ) -> ModelResult:
-    # ideas: improve fitting loop so that starting parameters from modelX and modelX+Si are shared, faster...
     init_params = model.make_params()
+    if init_values:
+        set_initial_values(init_params, init_values)
     x, y = spectrum.ramanshift, spectrum.intensity
-    out = model.fit(y, init_params, x=x, method=method, **kwargs)  # 'leastsq'
+    out = fit_compiled_model(
+        model, y, init_params, x=x, method=method, weights=weights, **kwargs
+    )  # 'leastsq'
     return out
+
+
+def call_fit_on_batch(
+    model: LMFitModel,
+    spectrum: SpectrumDataBatch,
+    weights: np.ndarray | None = None,
+    init_values: Dict[str, float] | None = None,
+    **kwargs,
+) -> BatchFitResult:
+    """
+    Fits the model to all spectra of the batch at once with the batched solver.
+    The public entry point for fitting each spectrum of a map or of the positions
+    of a sample, the runs of the delegator only fit the mean spectrum of a sample.
+    The result holds the best values and statistics of each spectrum by row.
+    """
+    init_params = model.make_params()
+    if init_values:
+        set_initial_values(init_params, init_values)
+    x, y = spectrum.ramanshift, spectrum.intensity
+    return fit_batch(model, y, init_params, x=x, weights=weights, **kwargs)
+
+
+def set_initial_values(params: Parameters, values: Dict[str, float]) -> None:
+    """Sets the free parameters that are in values, within their bounds."""
+    for name, value in values.items():
+        if name not in params or not params[name].vary or not np.isfinite(value):
+            continue
+        params[name].value = float(np.clip(value, params[name].min, params[name].max))
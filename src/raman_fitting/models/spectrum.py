@@ -10,6 +10,8 @@ from pydantic import (
 )
 import pydantic_numpy.typing as pnd
 
+from .axis import intern_axis
+
 
 class SpectrumData(BaseModel):
     ramanshift: pnd.Np1DArrayFp32 = Field(repr=False)
@@ -33,11 +35,126 @@ class SpectrumData(BaseModel):
             raise ValueError("Intensity contains NaN")
         return self
 
+    @model_validator(mode="after")
+    def intern_ramanshift(self):
+        """spectra with an identical axis share one read-only ramanshift array"""
+        self.ramanshift = intern_axis(self.ramanshift)
+        return self
+
+    @classmethod
+    def construct_trusted(
+        cls,
+        ramanshift: np.ndarray,
+        intensity: np.ndarray,
+        label: str,
+        region_name: str | None = None,
+        source=None,
+    ) -> "SpectrumData":
+        """
+        Internal constructor without validation, for arrays derived from an
+        already validated spectrum in the processing steps. Only casts to float32,
+        which does not copy arrays that are float32 already.
+        """
+        return cls.model_construct(
+            ramanshift=np.asarray(ramanshift, dtype=np.float32),
+            intensity=np.asarray(intensity, dtype=np.float32),
+            label=label,
+            region_name=region_name,
+            source=source,
+        )
+
     # length is derived property
     def __len__(self):
         return len(self.ramanshift)
 
 
+class SpectrumDataBatch(BaseModel):
+    """A block of spectra with a shared ramanshift axis, one spectrum per row of intensity."""
+
+    ramanshift: pnd.Np1DArrayFp32 = Field(repr=False)
+    intensity: pnd.Np2DArrayFp32 = Field(repr=False)
+    label: str
+    region_name: str | None = None
+    sources: Sequence[FilePath | str | None] | None = None
+
+    @model_validator(mode="after")
+    def validate_equal_length(self):
+        if self.intensity.shape[1] != len(self.ramanshift):
+            raise ValueError(
+                "Intensity rows and ramanshift of spectrum batch are not of equal length."
+            )
+        if self.sources is not None and len(self.sources) != len(self):
+            raise ValueError("Number of sources does not match the number of spectra.")
+        return self
+
+    @model_validator(mode="after")
+    def check_if_contains_nan(self):
+        if np.isnan(self.ramanshift).any():
+            raise ValueError("Ramanshift contains NaN")
+
+        if np.isnan(self.intensity).any():
+            raise ValueError("Intensity contains NaN")
+        return self
+
+    @model_validator(mode="after")
+    def intern_ramanshift(self):
+        """spectra with an identical axis share one read-only ramanshift array"""
+        self.ramanshift = intern_axis(self.ramanshift)
+        return self
+
+    @classmethod
+    def from_spectra(
+        cls, spectra: Sequence[SpectrumData], label: str | None = None
+    ) -> "SpectrumDataBatch":
+        if not spectra:
+            raise ValueError("No spectra given to make a batch from.")
+        ramanshift = spectra[0].ramanshift
+        for spec in spectra[1:]:
+            if not np.array_equal(spec.ramanshift, ramanshift):
+                raise ValueError("Spectra in a batch should share the same ramanshift.")
+        labels = set(i.label for i in spectra)
+        region_names = set(i.region_name for i in spectra)
+        return cls(
+            ramanshift=ramanshift,
+            intensity=np.vstack([i.intensity for i in spectra]),
+            label=label or "".join(map(str, labels)),
+            region_name=region_names.pop() if len(region_names) == 1 else None,
+            sources=[i.source for i in spectra],
+        )
+
+    @classmethod
+    def construct_trusted(
+        cls,
+        ramanshift: np.ndarray,
+        intensity: np.ndarray,
+        label: str,
+        region_name: str | None = None,
+        sources=None,
+    ) -> "SpectrumDataBatch":
+        """Internal constructor without validation, see SpectrumData.construct_trusted"""
+        return cls.model_construct(
+            ramanshift=np.asarray(ramanshift, dtype=np.float32),
+            intensity=np.asarray(intensity, dtype=np.float32),
+            label=label,
+            region_name=region_name,
+            sources=sources,
+        )
+
+    def get_spectrum(self, index: int) -> SpectrumData:
+        source = self.sources[index] if self.sources is not None else None
+        return SpectrumData.construct_trusted(
+            ramanshift=self.ramanshift,
+            intensity=self.intensity[index],
+            label=self.label,
+            region_name=self.region_name,
+            source=source,
+        )
+
+    # length is the number of spectra
+    def __len__(self):
+        return self.intensity.shape[0]
+
+
 class SpectrumMetaData(BaseModel):
     sample_id: str
     sample_group: str
@@ -1,8 +1,11 @@
+from collections import OrderedDict
 from typing import Dict, Any
+
 import numpy as np
 
 from pydantic import BaseModel, model_validator, Field
-from .spectrum import SpectrumData
+from .axis import get_axis_key
+from .spectrum import SpectrumData, SpectrumDataBatch
 from .deconvolution.spectrum_regions import (
     SpectrumRegionLimits,
     RegionNames,
@@ -30,6 +33,7 @@ class SplitSpectrum(BaseModel):
             spec_region_limits=self.region_limits,
             label=self.spectrum.label,
             source=self.spectrum.source,
+            validate=False,
         )
         self.spec_regions = spec_regions
         return self
@@ -45,6 +49,69 @@ class SplitSpectrum(BaseModel):
         return self.spec_regions[spec_region_key]
 
 
+class BatchSplitSpectrum(BaseModel):
+    """Batched version of SplitSpectrum, the regions are split for all rows at once."""
+
+    spectrum: SpectrumDataBatch
+    region_limits: Dict[str, SpectrumRegionLimits] = Field(None, init_var=None)
+    spec_regions: Dict[str, SpectrumDataBatch] = Field(None, init_var=None)
+    info: Dict[str, Any] = Field(default_factory=dict)
+
+    @model_validator(mode="after")
+    def process_spectrum(self) -> "BatchSplitSpectrum":
+        if self.region_limits is None:
+            region_limits = get_default_spectrum_region_limits()
+            self.region_limits = region_limits
+
+        if self.spec_regions is not None:
+            return self
+        spec_regions = split_spectrum_batch_in_regions(
+            self.spectrum,
+            spec_region_limits=self.region_limits,
+        )
+        self.spec_regions = spec_regions
+        return self
+
+    def get_region(self, region_name: RegionNames) -> SpectrumDataBatch:
+        region_name = RegionNames(region_name)
+        spec_region_keys = [
+            i for i in self.spec_regions.keys() if region_name.name in i
+        ]
+        if len(spec_region_keys) != 1:
+            raise ValueError(f"Key {region_name} not in {spec_region_keys}")
+        spec_region_key = spec_region_keys[0]
+        return self.spec_regions[spec_region_key]
+
+    def get_split_spectrum(self, index: int) -> SplitSpectrum:
+        """Returns the SplitSpectrum of a single row of the batch."""
+        spec_regions = {
+            k: val.get_spectrum(index) for k, val in self.spec_regions.items()
+        }
+        info = {
+            k: _select_info_for_index(val, index, len(self.spectrum))
+            for k, val in self.info.items()
+        }
+        return SplitSpectrum(
+            spectrum=self.spectrum.get_spectrum(index),
+            region_limits=self.region_limits,
+            spec_regions=spec_regions,
+            info=info,
+        )
+
+    def __len__(self):
+        return len(self.spectrum)
+
+
+def _select_info_for_index(info: Any, index: int, batch_size: int) -> Any:
+    if isinstance(info, dict):
+        return {
+            k: _select_info_for_index(v, index, batch_size) for k, v in info.items()
+        }
+    if isinstance(info, np.ndarray) and info.ndim and len(info) == batch_size:
+        return info[index]
+    return info
+
+
 def get_default_spectrum_region_limits(
     regions_mapping: Dict = None,
 ) -> Dict[str, SpectrumRegionLimits]:
@@ -62,22 +129,22 @@ def split_spectrum_data_in_regions(
     spec_region_limits=None,
     label=None,
     source=None,
+    validate: bool = True,
 ) -> Dict[str, SpectrumData]:
     """
     For splitting of spectra into the several SpectrumRegionLimits,
     the names of the regions are taken from SpectrumRegionLimits
     and set as attributes to the instance.
+    The regions of a sorted ramanshift are views on the input arrays.
+    Set validate to False when the arrays come from a validated SpectrumData.
     """
 
     if spec_region_limits is None:
         spec_region_limits = get_default_spectrum_region_limits()
     spec_regions = {}
-    for region_name, region in spec_region_limits.items():
-        # find indices of region in ramanshift array
-        ind = (ramanshift >= np.min(region.min)) & (ramanshift <= np.max(region.max))
-        region_lbl = f"region_{region_name}"
-        if label is not None and label not in region_lbl:
-            region_lbl = f"{label}_{region_lbl}"
+    region_bounds = get_region_bounds(ramanshift, spec_region_limits)
+    for region_name, ind in region_bounds.items():
+        region_lbl = make_region_label(region_name, label=label)
         _data = {
             "ramanshift": ramanshift[ind],
             "intensity": intensity[ind],
@@ -85,5 +152,84 @@ def split_spectrum_data_in_regions(
             "region_name": region_name,
             "source": source,
         }
-        spec_regions[region_lbl] = SpectrumData(**_data)
+        if validate:
+            spec_regions[region_lbl] = SpectrumData(**_data)
+        else:
+            spec_regions[region_lbl] = SpectrumData.construct_trusted(**_data)
+    return spec_regions
+
+
+def get_region_mask(ramanshift: np.ndarray, region: SpectrumRegionLimits) -> np.ndarray:
+    """find indices of region in ramanshift array"""
+    return (ramanshift >= np.min(region.min)) & (ramanshift <= np.max(region.max))
+
+
+REGION_BOUNDS_CACHE_SIZE = 128
+_region_bounds_cache: OrderedDict = OrderedDict()
+
+
+def calculate_region_bounds(
+    ramanshift: np.ndarray, spec_region_limits: Dict[str, SpectrumRegionLimits]
+) -> Dict[str, slice | np.ndarray]:
+    """
+    For a sorted ramanshift each region is a contiguous range, given by a slice
+    from searchsorted. The boolean masks are only used for unsorted axes.
+    """
+    is_sorted = bool(np.all(ramanshift[1:] >= ramanshift[:-1]))
+    bounds = {}
+    for region_name, region in spec_region_limits.items():
+        if not is_sorted:
+            bounds[region_name] = get_region_mask(ramanshift, region)
+            continue
+        start = int(np.searchsorted(ramanshift, region.min, side="left"))
+        stop = int(np.searchsorted(ramanshift, region.max, side="right"))
+        bounds[region_name] = slice(start, max(start, stop))
+    return bounds
+
+
+def get_region_bounds(
+    ramanshift: np.ndarray, spec_region_limits: Dict[str, SpectrumRegionLimits]
+) -> Dict[str, slice | np.ndarray]:
+    """Cached region bounds per distinct axis and region limits."""
+    limits_key = tuple(
+        (name, region.min, region.max) for name, region in spec_region_limits.items()
+    )
+    cache_key = (get_axis_key(ramanshift), limits_key)
+    if cache_key in _region_bounds_cache:
+        _region_bounds_cache.move_to_end(cache_key)
+        return _region_bounds_cache[cache_key]
+    bounds = calculate_region_bounds(ramanshift, spec_region_limits)
+    _region_bounds_cache[cache_key] = bounds
+    if len(_region_bounds_cache) > REGION_BOUNDS_CACHE_SIZE:
+        _region_bounds_cache.popitem(last=False)
+    return bounds
+
+
+def make_region_label(region_name: str, label: str | None = None) -> str:
+    region_lbl = f"region_{region_name}"
+    if label is not None and label not in region_lbl:
+        region_lbl = f"{label}_{region_lbl}"
+    return region_lbl
+
+
+def split_spectrum_batch_in_regions(
+    spectrum: SpectrumDataBatch, spec_region_limits=None
+) -> Dict[str, SpectrumDataBatch]:
+    """
+    Splits all the spectra of the batch in the regions at once,
+    the region indices are shared because of the common ramanshift axis.
+    """
+    if spec_region_limits is None:
+        spec_region_limits = get_default_spectrum_region_limits()
+    spec_regions = {}
+    region_bounds = get_region_bounds(spectrum.ramanshift, spec_region_limits)
+    for region_name, ind in region_bounds.items():
+        region_lbl = make_region_label(region_name, label=spectrum.label)
+        spec_regions[region_lbl] = SpectrumDataBatch.construct_trusted(
+            ramanshift=spectrum.ramanshift[ind],
+            intensity=spectrum.intensity[:, ind],
+            label=region_lbl,
+            region_name=region_name,
+            sources=spectrum.sources,
+        )
     return spec_regions
@@ -0,0 +1,140 @@
+"""Aggregation of the intensities of several spectra on a shared axis into one spectrum"""
+
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Iterable, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+MAD_TO_STD = 1.4826
+
+
+class AggregationMethods(StrEnum):
+    MEAN = "mean"
+    MEDIAN = "median"
+    TRIMMED_MEAN = "trimmed_mean"
+    SIGMA_CLIPPED_MEAN = "sigma_clipped_mean"
+
+
+class AggregationSettings(BaseModel):
+    """
+    The mean is streamed in constant memory, the robust methods need all the rows at once.
+    trim_fraction is cut from each end for the trimmed mean,
+    sigma and max_iter are used for the sigma-clipped mean.
+    """
+
+    method: AggregationMethods = AggregationMethods.MEAN
+    trim_fraction: float = Field(0.1, ge=0, lt=0.5)
+    sigma: float = Field(3.0, gt=0)
+    max_iter: int = Field(5, ge=1)
+
+
+@dataclass
+class StreamingAggregator:
+    """
+    Welford's online mean and variance per point, fed one spectrum at a time.
+    NaN points, from resampling onto a wider grid, are skipped per point.
+    """
+
+    count: np.ndarray | None = field(default=None, repr=False)
+    mean: np.ndarray | None = field(default=None, repr=False)
+    m2: np.ndarray | None = field(default=None, repr=False)
+
+    def add(self, intensity: np.ndarray) -> None:
+        intensity = np.asarray(intensity, dtype=float)
+        if self.mean is None:
+            self.count = np.zeros(intensity.shape, dtype=np.int64)
+            self.mean = np.zeros(intensity.shape)
+            self.m2 = np.zeros(intensity.shape)
+        if intensity.shape != self.mean.shape:
+            raise ValueError(
+                f"Can not add intensity of shape {intensity.shape} to {self.mean.shape}."
+            )
+        valid = ~np.isnan(intensity)
+        self.count += valid
+        delta = np.where(valid, intensity - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += delta * np.where(valid, intensity - self.mean, 0.0)
+
+    def add_many(self, intensities: Iterable[np.ndarray]) -> "StreamingAggregator":
+        for intensity in intensities:
+            self.add(intensity)
+        return self
+
+    @property
+    def variance(self) -> np.ndarray:
+        """sample variance, zero for points with less than two values"""
+        return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), 0.0)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+
+def nan_std(values: np.ndarray, keep: np.ndarray, center: np.ndarray) -> np.ndarray:
+    count = keep.sum(axis=0)
+    squares = np.where(keep, (values - center) ** 2, 0.0).sum(axis=0)
+    return np.sqrt(np.where(count > 1, squares / np.maximum(count - 1, 1), 0.0))
+
+
+def trimmed_mean(
+    intensity: np.ndarray, trim_fraction: float = 0.1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """mean and std per point of the values left after cutting the fraction from each end"""
+    sorted_intensity = np.sort(intensity, axis=0)  # NaN sorts to the end
+    count = np.sum(~np.isnan(intensity), axis=0)
+    cut = np.floor(count * trim_fraction).astype(int)
+    ranks = np.arange(len(intensity))[:, np.newaxis]
+    keep = (ranks >= cut) & (ranks < count - cut)
+    kept_sum = np.where(keep, sorted_intensity, 0.0).sum(axis=0)
+    mean = kept_sum / np.maximum(keep.sum(axis=0), 1)
+    return mean, nan_std(sorted_intensity, keep, mean)
+
+
+def sigma_clipped_mean(
+    intensity: np.ndarray, sigma: float = 3.0, max_iter: int = 5
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Iteratively drops the values further than sigma times the std from the center,
+    starting from the median. Returns the mean and std per point of the kept values.
+    """
+    keep = ~np.isnan(intensity)
+    center = np.nanmedian(intensity, axis=0)
+    std = nan_std(intensity, keep, center)
+    for _ in range(max_iter):
+        new_keep = keep & (np.abs(intensity - center) <= sigma * std)
+        # never drop all the values of a point
+        new_keep |= keep & ~new_keep.any(axis=0)
+        center = np.where(new_keep, intensity, 0.0).sum(axis=0) / np.maximum(
+            new_keep.sum(axis=0), 1
+        )
+        std = nan_std(intensity, new_keep, center)
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+    return center, std
+
+
+def aggregate_intensity(
+    intensity: np.ndarray | Iterable[np.ndarray],
+    settings: AggregationSettings | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregates the rows into one intensity, returns it with the std per point.
+    The mean accepts any iterable of rows and never stacks them.
+    """
+    settings = AggregationSettings() if settings is None else settings
+    if settings.method == AggregationMethods.MEAN:
+        aggregator = StreamingAggregator().add_many(intensity)
+        return aggregator.mean, aggregator.std
+    intensity = np.vstack(list(intensity)).astype(float)
+    if settings.method == AggregationMethods.MEDIAN:
+        median = np.nanmedian(intensity, axis=0)
+        mad = np.nanmedian(np.abs(intensity - median), axis=0)
+        return median, MAD_TO_STD * mad
+    if settings.method == AggregationMethods.TRIMMED_MEAN:
+        return trimmed_mean(intensity, trim_fraction=settings.trim_fraction)
+    return sigma_clipped_mean(
+        intensity, sigma=settings.sigma, max_iter=settings.max_iter
+    )
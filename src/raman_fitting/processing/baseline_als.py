@@ -0,0 +1,167 @@
+"""
+Whittaker smoother baselines of the asymmetric least squares family: ALS, arPLS and airPLS.
+
+Each iteration solves (W + lam * D'D) z = W y, with D the difference matrix.
+The system is symmetric and banded, so it is solved with a banded Cholesky in O(n).
+The banded penalty lam * D'D only depends on the length of the axis,
+so it is made once per axis and reused for all the spectra of a batch.
+
+References:
+    Eilers, P. H. C. & Boelens, H. F. M. (2005) Baseline Correction with Asymmetric Least Squares Smoothing.
+    Baek, S.-J. et al. (2015) https://doi.org/10.1039/C4AN01061B
+    Zhang, Z.-M. et al. (2010) https://doi.org/10.1039/B922045C
+"""
+
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.linalg import solveh_banded
+from scipy.special import comb
+
+DEFAULT_DIFF_ORDER = 2
+
+
+@lru_cache(maxsize=32)
+def get_penalty_bands(
+    size: int, lam: float, diff_order: int = DEFAULT_DIFF_ORDER
+) -> np.ndarray:
+    """
+    lam * D'D in the upper banded storage of solveh_banded, shape (diff_order + 1, size).
+    The returned array is read-only, since it is shared by all the callers.
+    """
+    if size <= diff_order:
+        raise ValueError(
+            f"Can not make a baseline of {size} points with difference order {diff_order}."
+        )
+    coefficients = [
+        (-1) ** (diff_order - k) * comb(diff_order, k, exact=True)
+        for k in range(diff_order + 1)
+    ]
+    diff_matrix = sparse.diags(
+        coefficients, range(diff_order + 1), shape=(size - diff_order, size)
+    )
+    penalty = lam * (diff_matrix.T @ diff_matrix).tocsr()
+    bands = np.zeros((diff_order + 1, size))
+    for offset in range(diff_order + 1):
+        bands[diff_order - offset, offset:] = penalty.diagonal(offset)
+    bands.flags.writeable = False
+    return bands
+
+
+def solve_whittaker(
+    intensity: np.ndarray, weights: np.ndarray, penalty_bands: np.ndarray
+) -> np.ndarray:
+    """Solves (W + P) z = W y for one spectrum, with P in banded storage."""
+    bands = penalty_bands.copy()
+    bands[-1] += weights
+    return solveh_banded(bands, weights * intensity, check_finite=False)
+
+
+def als_baseline(
+    intensity: np.ndarray,
+    lam: float = 1e5,
+    p: float = 0.01,
+    max_iter: int = 10,
+    diff_order: int = DEFAULT_DIFF_ORDER,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Asymmetric least squares, the points above the baseline get weight p,
+    the points below get weight 1 - p.
+    The intensity can be a single spectrum or a batch with the axis last.
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    batch = np.atleast_2d(intensity)
+    penalty_bands = get_penalty_bands(batch.shape[-1], float(lam), diff_order)
+    baseline = np.empty_like(batch)
+    iterations = np.zeros(len(batch), dtype=int)
+    for n, row in enumerate(batch):
+        weights = np.ones_like(row)
+        for iteration in range(1, max_iter + 1):
+            z = solve_whittaker(row, weights, penalty_bands)
+            new_weights = np.where(row > z, p, 1 - p)
+            iterations[n] = iteration
+            if np.array_equal(new_weights, weights):
+                break
+            weights = new_weights
+        baseline[n] = z
+    return baseline.reshape(intensity.shape), {"iterations": iterations}
+
+
+def arpls_baseline(
+    intensity: np.ndarray,
+    lam: float = 1e5,
+    ratio: float = 1e-3,
+    max_iter: int = 50,
+    diff_order: int = DEFAULT_DIFF_ORDER,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Asymmetrically reweighted penalized least squares,
+    the weights follow a logistic function of the residuals below the baseline.
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    batch = np.atleast_2d(intensity)
+    penalty_bands = get_penalty_bands(batch.shape[-1], float(lam), diff_order)
+    baseline = np.empty_like(batch)
+    iterations = np.zeros(len(batch), dtype=int)
+    for n, row in enumerate(batch):
+        weights = np.ones_like(row)
+        for iteration in range(1, max_iter + 1):
+            z = solve_whittaker(row, weights, penalty_bands)
+            iterations[n] = iteration
+            residual = row - z
+            negative_residual = residual[residual < 0]
+            if len(negative_residual) < 2:
+                break
+            mean, std = np.mean(negative_residual), np.std(negative_residual)
+            if not std:
+                break
+            exponent = np.clip(2 * (residual - (2 * std - mean)) / std, -500, 500)
+            new_weights = 1 / (1 + np.exp(exponent))
+            weight_change = np.linalg.norm(weights - new_weights) / np.linalg.norm(
+                weights
+            )
+            weights = new_weights
+            if weight_change < ratio:
+                break
+        baseline[n] = z
+    return baseline.reshape(intensity.shape), {"iterations": iterations}
+
+
+def airpls_baseline(
+    intensity: np.ndarray,
+    lam: float = 1e5,
+    max_iter: int = 15,
+    tolerance: float = 1e-3,
+    diff_order: int = DEFAULT_DIFF_ORDER,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Adaptive iteratively reweighted penalized least squares,
+    the points above the baseline get zero weight and the points below
+    get an exponentially increasing weight with each iteration.
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    batch = np.atleast_2d(intensity)
+    penalty_bands = get_penalty_bands(batch.shape[-1], float(lam), diff_order)
+    baseline = np.empty_like(batch)
+    iterations = np.zeros(len(batch), dtype=int)
+    for n, row in enumerate(batch):
+        weights = np.ones_like(row)
+        row_sum = np.abs(row).sum()
+        for iteration in range(1, max_iter + 1):
+            z = solve_whittaker(row, weights, penalty_bands)
+            iterations[n] = iteration
+            residual = row - z
+            negative = residual < 0
+            residual_sum = np.abs(residual[negative].sum())
+            if residual_sum < tolerance * row_sum or not negative.any():
+                break
+            exponent = np.minimum(iteration * np.abs(residual) / residual_sum, 500)
+            weights = np.where(negative, np.exp(exponent), 0.0)
+            edge_weight = np.exp(
+                min(iteration * np.abs(residual[negative]).max() / residual_sum, 500)
+            )
+            weights[[0, -1]] = edge_weight
+        baseline[n] = z
+    return baseline.reshape(intensity.shape), {"iterations": iterations}
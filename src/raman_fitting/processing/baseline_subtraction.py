@@ -1,23 +1,190 @@
 import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Tuple
 
 import numpy as np
-from scipy.stats import linregress
 
-from ..models.splitter import SplitSpectrum
+from ..models.splitter import SplitSpectrum, BatchSplitSpectrum
 from ..models.spectrum import SpectrumData
+from .baseline_als import als_baseline, arpls_baseline, airpls_baseline
 
 logger = logging.getLogger(__name__)
 
+LINEAR_BASELINE_METHOD = "linear"
 
-def subtract_baseline_per_region(spec: SpectrumData, split_spectrum: SplitSpectrum):
-    ramanshift = spec.ramanshift
-    intensity = spec.intensity
-    region_name = spec.region_name
-    label = spec.label
-    regions_data = split_spectrum.spec_regions
-    region_limits = split_spectrum.region_limits
-    selected_intensity = intensity
-    region_config = region_limits[region_name]
+
+@dataclass
+class BaselineMethod:
+    name: str
+    baseline_func: Callable
+    baseline_kwargs: Dict
+
+    def calculate_baseline(
+        self, intensity: np.ndarray, **kwargs
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        baseline_kwargs = {**self.baseline_kwargs, **kwargs}
+        baseline, info = self.baseline_func(intensity, **baseline_kwargs)
+        return baseline, {"method": self.name, **baseline_kwargs, **info}
+
+
+available_baseline_methods = {
+    "als": BaselineMethod("als", als_baseline, baseline_kwargs={}),
+    "arpls": BaselineMethod("arpls", arpls_baseline, baseline_kwargs={}),
+    "airpls": BaselineMethod("airpls", airpls_baseline, baseline_kwargs={}),
+}
+
+
+def get_baseline_method_for_region(
+    region_name: str, methods: Dict[str, str | Dict[str, Any]] | None = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    The methods map a region name to a method name, or to a dict with the method
+    and its keyword arguments, e.g. {"full": {"method": "arpls", "lam": 1e6}}.
+    Regions that are not in the methods get the linear baseline.
+    """
+    method = (methods or {}).get(region_name, LINEAR_BASELINE_METHOD)
+    method_kwargs = {}
+    if isinstance(method, dict):
+        method_kwargs = {k: v for k, v in method.items() if k != "method"}
+        method = method.get("method", LINEAR_BASELINE_METHOD)
+    if method != LINEAR_BASELINE_METHOD and method not in available_baseline_methods:
+        raise ValueError(f"Chosen baseline method {method} not available.")
+    return method, method_kwargs
+
+
+def calculate_linear_baselines(
+    spec_regions: Dict[str, SpectrumData | Any],
+    region_limits: dict,
+    region_keys: Iterable[str],
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Closed-form lines through the mean intensities at the edges of the regions,
+    for all the regions in one vectorized step. The edges of the selected
+    (first order) region are averaged once and reused by the full and norm regions.
+    Works on single spectra and on batches, the axis is last.
+    """
+    region_keys = list(region_keys)
+    if not region_keys:
+        return {}
+    edge_means = {}
+    edges_left, edges_right, shift_left, shift_right = [], [], [], []
+    for region_key in region_keys:
+        spec = spec_regions[region_key]
+        selected_key, region_config = get_baseline_selection_for_region(
+            spec.region_name, spec.label, spec_regions, region_limits
+        )
+        selected_key = region_key if selected_key is None else selected_key
+        margin = region_config.extra_margin
+        if (selected_key, margin) not in edge_means:
+            selected_intensity = spec_regions[selected_key].intensity
+            edge_means[(selected_key, margin)] = (
+                np.mean(selected_intensity[..., 0:margin], axis=-1, dtype=float),
+                np.mean(selected_intensity[..., -margin::], axis=-1, dtype=float),
+            )
+        edge_left, edge_right = edge_means[(selected_key, margin)]
+        edges_left.append(edge_left)
+        edges_right.append(edge_right)
+        shift_left.append(spec.ramanshift[0])
+        shift_right.append(spec.ramanshift[-1])
+    edges_left, edges_right = np.array(edges_left), np.array(edges_right)
+    # shape (regions,) for a spectrum, (regions, rows) for a batch
+    shift_shape = (-1,) + (1,) * (edges_left.ndim - 1)
+    shift_left = np.array(shift_left, dtype=float).reshape(shift_shape)
+    shift_right = np.array(shift_right, dtype=float).reshape(shift_shape)
+    slopes = (edges_right - edges_left) / (shift_right - shift_left)
+    intercepts = edges_left - slopes * shift_left
+    return {
+        region_key: {"slope": slopes[n], "intercept": intercepts[n]}
+        for n, region_key in enumerate(region_keys)
+    }
+
+
+def evaluate_linear_baseline(
+    ramanshift: np.ndarray, slope: np.ndarray, intercept: np.ndarray
+) -> np.ndarray:
+    slope, intercept = np.asarray(slope), np.asarray(intercept)
+    return slope[..., np.newaxis] * ramanshift + intercept[..., np.newaxis]
+
+
+def calculate_region_baselines(
+    spec_regions: Dict[str, SpectrumData | Any],
+    region_limits: dict,
+    methods: Dict[str, str | Dict[str, Any]] | None = None,
+    region_keys: Iterable[str] | None = None,
+) -> Dict[str, Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    The baseline and its info for each of the regions of a spectrum or a batch.
+    The linear baselines of all the regions are calculated together,
+    the other methods per region on all the rows at once.
+    """
+    region_keys = list(spec_regions) if region_keys is None else list(region_keys)
+    region_methods = {
+        region_key: get_baseline_method_for_region(
+            spec_regions[region_key].region_name, methods
+        )
+        for region_key in region_keys
+    }
+    linear_params = calculate_linear_baselines(
+        spec_regions,
+        region_limits,
+        [
+            k
+            for k, (method, _) in region_methods.items()
+            if method == LINEAR_BASELINE_METHOD
+        ],
+    )
+    baselines = {}
+    for region_key, (method, method_kwargs) in region_methods.items():
+        spec = spec_regions[region_key]
+        if method == LINEAR_BASELINE_METHOD:
+            params = linear_params[region_key]
+            baseline = evaluate_linear_baseline(spec.ramanshift, **params)
+            baselines[region_key] = (baseline.reshape(spec.intensity.shape), params)
+        else:
+            baselines[region_key] = available_baseline_methods[
+                method
+            ].calculate_baseline(spec.intensity, **method_kwargs)
+    return baselines
+
+
+def subtract_baseline_from_split_spectrum(
+    split_spectrum: SplitSpectrum = None,
+    label=None,
+    methods: Dict[str, str | Dict[str, Any]] | None = None,
+) -> SplitSpectrum:
+    _bl_spec_regions = {}
+    _info = {}
+    label = "blcorr" if label is None else label
+    baselines = calculate_region_baselines(
+        split_spectrum.spec_regions, split_spectrum.region_limits, methods=methods
+    )
+    for region_name, spec in split_spectrum.spec_regions.items():
+        baseline, baseline_info = baselines[region_name]
+        new_label = make_baseline_label(spec.label, label=label)
+        spec = SpectrumData.construct_trusted(
+            ramanshift=spec.ramanshift,
+            intensity=spec.intensity - baseline,
+            label=new_label,
+            region_name=region_name,
+            source=spec.source,
+        )
+        _bl_spec_regions.update(**{region_name: spec})
+        _info.update(**{region_name: baseline_info})
+    bl_corrected_spectra = split_spectrum.model_copy(
+        update={"spec_regions": _bl_spec_regions, "info": _info}
+    )
+    return bl_corrected_spectra
+
+
+def make_baseline_label(spec_label: str, label: str = "blcorr") -> str:
+    return f"{label}_{spec_label}" if label not in spec_label else spec_label
+
+
+def get_baseline_selection_for_region(
+    region_name: str, label: str, regions_data: dict, region_limits: dict
+) -> tuple:
+    """the full and normalization regions take the baseline edges from the first order region"""
+    selected_key, region_config = None, region_limits[region_name]
     region_name_first_order = list(
         filter(lambda x: "first_order" in x, regions_data.keys())
     )
@@ -25,40 +192,32 @@ def subtract_baseline_per_region(spec: SpectrumData, split_spectrum: SplitSpectr
         any((i in region_name or i in label) for i in ("full", "norm"))
         and region_name_first_order
     ):
-        selected_intensity = regions_data[region_name_first_order[0]].intensity
+        selected_key = region_name_first_order[0]
         region_config = region_limits["first_order"]
-
-    bl_linear = linregress(
-        ramanshift[[0, -1]],
-        [
-            np.mean(selected_intensity[0 : region_config.extra_margin]),
-            np.mean(selected_intensity[-region_config.extra_margin : :]),
-        ],
-    )
-    i_blcor = intensity - (bl_linear[0] * ramanshift + bl_linear[1])
-    return i_blcor, bl_linear
+    return selected_key, region_config
 
 
-def subtract_baseline_from_split_spectrum(
-    split_spectrum: SplitSpectrum = None, label=None
-) -> SplitSpectrum:
+def subtract_baseline_from_batch_split(
+    split_spectrum: BatchSplitSpectrum,
+    label=None,
+    methods: Dict[str, str | Dict[str, Any]] | None = None,
+) -> BatchSplitSpectrum:
+    """Same baselines as for a single spectrum, for all the rows of the batch at once."""
     _bl_spec_regions = {}
     _info = {}
     label = "blcorr" if label is None else label
-    for region_name, spec in split_spectrum.spec_regions.items():
-        blcorr_int, blcorr_lin = subtract_baseline_per_region(spec, split_spectrum)
-        new_label = f"{label}_{spec.label}" if label not in spec.label else spec.label
-        spec = SpectrumData(
-            **{
-                "ramanshift": spec.ramanshift,
-                "intensity": blcorr_int,
-                "label": new_label,
-                "region_name": region_name,
-                "source": spec.source,
+    baselines = calculate_region_baselines(
+        split_spectrum.spec_regions, split_spectrum.region_limits, methods=methods
+    )
+    for region_key, spec in split_spectrum.spec_regions.items():
+        baseline, _info[region_key] = baselines[region_key]
+        _bl_spec_regions[region_key] = spec.model_copy(
+            update={
+                "intensity": (spec.intensity - baseline).astype(np.float32),
+                "label": make_baseline_label(spec.label, label=label),
+                "region_name": region_key,
             }
         )
-        _bl_spec_regions.update(**{region_name: spec})
-        _info.update(**{region_name: blcorr_lin})
     bl_corrected_spectra = split_spectrum.model_copy(
         update={"spec_regions": _bl_spec_regions, "info": _info}
     )
@@ -0,0 +1,153 @@
+"""Area-preserving binning of the regions onto a coarser grid before the fitting"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import numpy as np
+
+from raman_fitting.models.axis import get_axis_key, intern_axis
+from raman_fitting.models.deconvolution.spectrum_regions import SpectrumRegionLimits
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.models.splitter import (
+    BatchSplitSpectrum,
+    SplitSpectrum,
+    make_region_label,
+)
+
+BINNING_WEIGHTS_CACHE_SIZE = 32
+_binning_weights_cache: OrderedDict = OrderedDict()
+
+
+@dataclass
+class BinningWeights:
+    """
+    Each point of the source axis covers a cell up to halfway its neighbours.
+    The binned intensity is the integral of the cells over a bin divided by its width,
+    from the cumulative area at the edges of the bins.
+    """
+
+    order: np.ndarray  # (M,) sorts the source axis
+    cell_widths: np.ndarray  # (M,)
+    edge_cells: np.ndarray  # (B + 1,) cell of each bin edge
+    edge_offsets: np.ndarray  # (B + 1,) position of each bin edge in its cell
+    bin_widths: np.ndarray  # (B,)
+    ramanshift: np.ndarray  # (B,) centers of the bins
+
+    @property
+    def resolution(self) -> float:
+        return float(self.bin_widths[0])
+
+    def apply(self, intensity: np.ndarray) -> np.ndarray:
+        """Bins a spectrum or all the rows of a batch with the axis last."""
+        intensity = np.asarray(intensity, dtype=float)[..., self.order]
+        cumulative_area = np.cumsum(intensity * self.cell_widths, axis=-1)
+        cell_start_area = cumulative_area - intensity * self.cell_widths
+        edge_area = (
+            cell_start_area[..., self.edge_cells]
+            + self.edge_offsets * intensity[..., self.edge_cells]
+        )
+        return np.diff(edge_area, axis=-1) / self.bin_widths
+
+
+def calculate_binning_weights(
+    ramanshift: np.ndarray, resolution: float
+) -> BinningWeights:
+    """Equal bins over the range of the axis, with the width closest to the resolution."""
+    ramanshift = np.asarray(ramanshift, dtype=float)
+    if len(ramanshift) < 2:
+        raise ValueError("Can not bin an axis with less than 2 points.")
+    if not resolution > 0:
+        raise ValueError(f"The resolution should be positive, not {resolution}.")
+    order = np.argsort(ramanshift, kind="stable")
+    sorted_axis = ramanshift[order]
+    midpoints = (sorted_axis[1:] + sorted_axis[:-1]) / 2
+    cell_edges = np.concatenate(
+        [
+            [sorted_axis[0] - (midpoints[0] - sorted_axis[0])],
+            midpoints,
+            [sorted_axis[-1] + (sorted_axis[-1] - midpoints[-1])],
+        ]
+    )
+    span = cell_edges[-1] - cell_edges[0]
+    n_bins = max(1, int(round(span / resolution)))
+    bin_edges = np.linspace(cell_edges[0], cell_edges[-1], n_bins + 1)
+    edge_cells = np.searchsorted(cell_edges, bin_edges, side="right") - 1
+    edge_cells = np.clip(edge_cells, 0, len(sorted_axis) - 1)
+    return BinningWeights(
+        order=order,
+        cell_widths=np.diff(cell_edges),
+        edge_cells=edge_cells,
+        edge_offsets=bin_edges - cell_edges[edge_cells],
+        bin_widths=np.diff(bin_edges),
+        ramanshift=intern_axis((bin_edges[1:] + bin_edges[:-1]) / 2),
+    )
+
+
+def get_binning_weights(ramanshift: np.ndarray, resolution: float) -> BinningWeights:
+    """Cached binning weights per distinct axis and resolution."""
+    cache_key = (get_axis_key(ramanshift), float(resolution))
+    if cache_key in _binning_weights_cache:
+        _binning_weights_cache.move_to_end(cache_key)
+        return _binning_weights_cache[cache_key]
+    weights = calculate_binning_weights(ramanshift, resolution)
+    _binning_weights_cache[cache_key] = weights
+    if len(_binning_weights_cache) > BINNING_WEIGHTS_CACHE_SIZE:
+        _binning_weights_cache.popitem(last=False)
+    return weights
+
+
+def get_axis_resolution(ramanshift: np.ndarray) -> float:
+    return float(np.median(np.abs(np.diff(ramanshift))))
+
+
+def bin_spectrum(
+    spectrum: SpectrumData | SpectrumDataBatch, resolution: float
+) -> SpectrumData | SpectrumDataBatch:
+    """Spectra that are already at or above the resolution are returned as is."""
+    if get_axis_resolution(spectrum.ramanshift) >= resolution:
+        return spectrum
+    weights = get_binning_weights(spectrum.ramanshift, resolution)
+    binned_intensity = weights.apply(spectrum.intensity)
+    if isinstance(spectrum, SpectrumDataBatch):
+        return spectrum.model_copy(
+            update={"ramanshift": weights.ramanshift, "intensity": binned_intensity}
+        )
+    return SpectrumData.construct_trusted(
+        ramanshift=weights.ramanshift,
+        intensity=binned_intensity,
+        label=spectrum.label,
+        region_name=spectrum.region_name,
+        source=spectrum.source,
+    )
+
+
+def get_region_resolution(
+    region_key: str, region_limits: Dict[str, SpectrumRegionLimits]
+) -> float | None:
+    """the keys of the regions end with the region label, after the processing steps"""
+    for region_name, limits in region_limits.items():
+        if region_key == region_name or region_key.endswith(
+            make_region_label(region_name)
+        ):
+            return limits.resolution
+    return None
+
+
+def bin_split_spectrum(
+    split_spectrum: SplitSpectrum | BatchSplitSpectrum,
+) -> SplitSpectrum | BatchSplitSpectrum:
+    """Bins the regions that have a resolution in their limits, the others are kept."""
+    binned_regions = {}
+    info: Dict[str, Any] = dict(split_spectrum.info)
+    for region_key, spec in split_spectrum.spec_regions.items():
+        resolution = get_region_resolution(region_key, split_spectrum.region_limits)
+        if resolution is not None and len(spec.ramanshift) > 1:
+            spec = bin_spectrum(spec, resolution)
+            region_info = dict(info.get(region_key, {}))
+            region_info["resolution"] = get_axis_resolution(spec.ramanshift)
+            info[region_key] = region_info
+        binned_regions[region_key] = spec
+    return split_spectrum.model_copy(
+        update={"spec_regions": binned_regions, "info": info}
+    )
@@ -4,24 +4,28 @@ Created on Mon May  3 11:10:59 2021
 @author: dw
 """
 
+from functools import lru_cache
 from typing import Dict, Tuple, Any, Optional
-import copy
 import logging
 
 import numpy as np
 
 from pydantic import BaseModel, Field, model_validator
 
+from raman_fitting.config.default_models import load_config_from_toml_files
 from raman_fitting.models.spectrum import SpectrumData
 
 logger = logging.getLogger(__name__)
 
+CROSS_DESPIKE_CONFIG_KEY = "cross_despike"
+
 
 class SpectrumDespiker(BaseModel):
     spectrum: Optional[SpectrumData] = None
     threshold_z_value: int = 4
     moving_region_size: int = 1
     ignore_lims: Tuple[int, int] = (20, 46)
+    keep_diagnostics: bool = True
     info: Dict = Field(default_factory=dict)
     processed_spectrum: SpectrumData = Field(None)
 
@@ -32,11 +36,16 @@ class SpectrumDespiker(BaseModel):
         despiked_intensity, result_info = self.call_despike_spectrum(
             self.spectrum.intensity
         )
-        despiked_spec = self.spectrum.model_copy(
-            update={"intensity": despiked_intensity}, deep=True
+        despiked_spec = SpectrumData.construct_trusted(
+            ramanshift=self.spectrum.ramanshift,
+            intensity=despiked_intensity,
+            label=self.spectrum.label,
+            region_name=self.spectrum.region_name,
+            source=self.spectrum.source,
         )
-        SpectrumData.model_validate(despiked_spec, from_attributes=True)
         self.processed_spectrum = despiked_spec
+        if not self.keep_diagnostics:
+            result_info = summarize_despike_info(result_info)
         self.info.update(**result_info)
         return self
 
@@ -44,6 +53,23 @@ class SpectrumDespiker(BaseModel):
         despiked_intensity, _ = self.call_despike_spectrum(intensity)
         return despiked_intensity
 
+    def process_intensity_batch(self, intensity: np.ndarray) -> np.ndarray:
+        despiked_intensity, _ = self.call_despike_spectra_batch(intensity)
+        return despiked_intensity
+
+    def call_despike_spectra_batch(
+        self, intensity: np.ndarray
+    ) -> Tuple[np.ndarray, Dict]:
+        despiked_intensity, result_info = despike_spectra_batch(
+            intensity,
+            self.threshold_z_value,
+            self.moving_region_size,
+            ignore_lims=self.ignore_lims,
+        )
+        if not self.keep_diagnostics:
+            result_info = summarize_despike_info(result_info)
+        return despiked_intensity, result_info
+
     def call_despike_spectrum(self, intensity: np.ndarray) -> Tuple[np.ndarray, Dict]:
         despiked_intensity, result_info = despike_spectrum(
             intensity,
@@ -54,6 +80,15 @@ class SpectrumDespiker(BaseModel):
         return despiked_intensity, result_info
 
 
+def summarize_despike_info(result_info: Dict[str, Any]) -> Dict[str, Any]:
+    """scalars instead of the z-value arrays, for the lean memory mode"""
+    filtered_z_intensity = result_info["filtered_z_intensity"]
+    return {
+        "number_of_spikes": int(np.isnan(filtered_z_intensity).sum()),
+        "max_abs_z_value": float(np.nanmax(np.abs(result_info["z_intensity"]))),
+    }
+
+
 def despike_spectrum(
     intensity: np.ndarray,
     threshold_z_value: int,
@@ -96,9 +131,15 @@ def despike_spectrum(
 
 
 def calc_z_value_intensity(intensity: np.ndarray) -> np.ndarray:
-    diff_intensity = np.append(np.diff(intensity), 0)  # dYt
-    median_diff_intensity = np.median(diff_intensity)  # dYt_Median
-    median_abs_deviation = np.median(abs(diff_intensity - median_diff_intensity))
+    """z-values of the differenced intensity, along the last axis for a batch of spectra"""
+    # appending the last value sets the last difference to 0
+    diff_intensity = np.diff(intensity, axis=-1, append=intensity[..., -1:])  # dYt
+    median_diff_intensity = np.median(
+        diff_intensity, axis=-1, keepdims=True
+    )  # dYt_Median
+    median_abs_deviation = np.median(
+        abs(diff_intensity - median_diff_intensity), axis=-1, keepdims=True
+    )
     intensity_values_z = (
         0.6745 * (diff_intensity - median_diff_intensity)
     ) / median_abs_deviation
@@ -106,9 +147,10 @@ def calc_z_value_intensity(intensity: np.ndarray) -> np.ndarray:
 
 
 def filter_z_intensity_values(z_intensity, z_intensityhreshold):
-    filtered_z_intensity = copy.deepcopy(z_intensity)
-    filtered_z_intensity[np.abs(z_intensity) > z_intensityhreshold] = np.nan
-    filtered_z_intensity[0] = filtered_z_intensity[-1] = 0
+    filtered_z_intensity = np.where(
+        np.abs(z_intensity) > z_intensityhreshold, np.nan, z_intensity
+    )
+    filtered_z_intensity[..., 0] = filtered_z_intensity[..., -1] = 0
     return filtered_z_intensity
 
 
@@ -118,17 +160,122 @@ def despike_filter(
     moving_region_size: int,
     ignore_lims=(20, 46),
 ):
-    n = len(intensity)
-    i_despiked = copy.deepcopy(intensity)
-    spikes = np.nonzero(np.isnan(filtered_z_intensity))
-    for i in list(spikes[0]):
-        if i < ignore_lims[0] or i > ignore_lims[1]:
-            w = np.arange(
-                max(0, i - moving_region_size), min(n, i + moving_region_size)
-            )
-            w = w[~np.isnan(filtered_z_intensity[w])]
-            if intensity[w].any():
-                i_despiked[i] = np.mean(intensity[w])
-            else:
-                i_despiked[i] = intensity[i]
+    """
+    Replaces each spike, a NaN in filtered_z_intensity, by the mean intensity of the
+    non-spike points in the window [i - moving_region_size, i + moving_region_size).
+    The window sums of all points are accumulated in one pass per window offset,
+    which works along the last axis of a 1D spectrum or an (N, M) batch.
+    The means are the same as np.mean over each window, up to the last bit for
+    windows of 8 or more points where np.mean uses pairwise summation.
+    """
+    n = intensity.shape[-1]
+    valid = ~np.isnan(filtered_z_intensity)
+    sum_dtype = intensity.dtype
+    if not np.issubdtype(sum_dtype, np.floating):
+        sum_dtype = np.float64
+    window_sum = np.zeros(intensity.shape, dtype=sum_dtype)
+    window_count = np.zeros(intensity.shape, dtype=np.int64)
+    window_nonzero = np.zeros(intensity.shape, dtype=bool)
+    for offset in range(-moving_region_size, moving_region_size):
+        start, stop = max(0, -offset), n - max(0, offset)
+        if stop <= start:
+            continue
+        target = (..., slice(start, stop))
+        source = (..., slice(start + offset, stop + offset))
+        in_window = valid[source]
+        window_sum[target] += np.where(in_window, intensity[source], 0)
+        window_count[target] += in_window
+        window_nonzero[target] |= in_window & (intensity[source] != 0)
+
+    positions = np.arange(n)
+    outside_ignore = (positions < ignore_lims[0]) | (positions > ignore_lims[1])
+    replace = ~valid & outside_ignore & window_nonzero
+    i_despiked = intensity.copy()
+    i_despiked[replace] = window_sum[replace].astype(np.float64) / window_count[replace]
     return i_despiked
+
+
+def despike_spectra_batch(
+    intensity: np.ndarray,
+    threshold_z_value: int,
+    moving_region_size: int,
+    ignore_lims=(20, 46),
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Same as despike_spectrum, for an (N, M) block of intensities with one spectrum per row."""
+    intensity = np.atleast_2d(intensity)
+    z_intensity = calc_z_value_intensity(intensity)
+    filtered_z_intensity = filter_z_intensity_values(z_intensity, threshold_z_value)
+    i_despiked = despike_filter(
+        intensity, filtered_z_intensity, moving_region_size, ignore_lims=ignore_lims
+    )
+    result = {"z_intensity": z_intensity, "filtered_z_intensity": filtered_z_intensity}
+    return i_despiked, result
+
+
+class CrossSpectrumDespiker(BaseModel):
+    """
+    Detects cosmic rays by comparing the spectra of several positions of one sample,
+    a spike shows up in one position only. Needs at least min_spectra on a shared axis.
+    """
+
+    enabled: bool = True
+    threshold_z_value: float = 6.0
+    min_spectra: int = Field(3, ge=3)
+    dilate: int = Field(1, ge=0)
+
+    def process_intensity_batch(
+        self, intensity: np.ndarray
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        return despike_across_spectra(
+            intensity,
+            self.threshold_z_value,
+            min_spectra=self.min_spectra,
+            dilate=self.dilate,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_default_cross_despiker() -> CrossSpectrumDespiker:
+    config = load_config_from_toml_files()
+    return CrossSpectrumDespiker(**config.get(CROSS_DESPIKE_CONFIG_KEY, {}))
+
+
+def despike_across_spectra(
+    intensity: np.ndarray,
+    threshold_z_value: float,
+    min_spectra: int = 3,
+    dilate: int = 1,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Flags the points of an (N, M) block that lie more than threshold_z_value robust
+    standard deviations above the median over the spectra, and replaces them by that median.
+    The robust std per point is the MAD over the spectra, with the median of the
+    MAD over the axis as lower bound, so quiet points do not make false spikes.
+    The flagged points are widened by dilate points on each side for the spike wings.
+    """
+    intensity = np.atleast_2d(intensity)
+    spike_mask = np.zeros(intensity.shape, dtype=bool)
+    if len(intensity) < min_spectra:
+        logger.debug(
+            f"Cross-spectrum despiking needs {min_spectra} spectra, got {len(intensity)}."
+        )
+        return intensity.copy(), {
+            "spike_mask": spike_mask,
+            "replaced_points": spike_mask.sum(axis=-1),
+        }
+    median = np.median(intensity, axis=0)
+    residual = intensity - median
+    scale = 1.4826 * np.median(np.abs(residual), axis=0)
+    scale = np.maximum(scale, max(np.median(scale), np.finfo(np.float32).tiny))
+    spikes = residual > threshold_z_value * scale
+    spike_mask[:] = spikes
+    for shift in range(1, dilate + 1):
+        spike_mask[..., shift:] |= spikes[..., :-shift]
+        spike_mask[..., :-shift] |= spikes[..., shift:]
+    i_despiked = np.where(spike_mask, median, intensity).astype(intensity.dtype)
+    result = {
+        "spike_mask": spike_mask,
+        "replaced_points": spike_mask.sum(axis=-1),
+        "z_intensity": residual / scale,
+    }
+    return i_despiked, result
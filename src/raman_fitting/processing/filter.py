@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Callable, Protocol, Tuple, Dict
 import numpy as np
-from scipy import signal
+from scipy import ndimage, signal
 
-from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
 
 
 class IntensityProcessor(Protocol):
@@ -29,10 +30,65 @@ class IntensityFilter:
         return filtered_intensity
 
 
+# direct convolution is faster for the short windows, FFT for the long ones
+FFT_CONVOLUTION_MIN_WINDOW = 65
+# edge modes of ndimage.convolve1d as modes of np.pad, for the FFT convolution
+PAD_MODES = {
+    "nearest": "edge",
+    "mirror": "reflect",
+    "wrap": "wrap",
+    "constant": "constant",
+}
+
+
+@lru_cache(maxsize=32)
+def get_savgol_kernel(
+    window_length: int, polyorder: int, deriv: int = 0, delta: float = 1.0
+) -> np.ndarray:
+    """Savitzky-Golay convolution coefficients, computed once per settings"""
+    if window_length % 2 == 0:
+        raise ValueError(f"The window length should be odd, not {window_length}.")
+    kernel = signal.savgol_coeffs(
+        window_length, polyorder, deriv=deriv, delta=delta, use="conv"
+    )
+    kernel.flags.writeable = False
+    return kernel
+
+
+def savgol_convolve(
+    intensity: np.ndarray,
+    window_length: int,
+    polyorder: int,
+    deriv: int = 0,
+    delta: float = 1.0,
+    mode: str = "nearest",
+) -> np.ndarray:
+    """
+    Same result as signal.savgol_filter along the last axis, for one spectrum or
+    all the rows of an (N, M) block in one convolution with the cached kernel.
+    """
+    if mode not in PAD_MODES:
+        return signal.savgol_filter(
+            intensity, window_length, polyorder, deriv=deriv, delta=delta, mode=mode
+        )
+    intensity = np.asarray(intensity)
+    if intensity.dtype not in (np.float32, np.float64):
+        intensity = intensity.astype(np.float64)
+    kernel = get_savgol_kernel(window_length, polyorder, deriv=deriv, delta=delta)
+    if window_length < FFT_CONVOLUTION_MIN_WINDOW:
+        return ndimage.convolve1d(intensity, kernel, axis=-1, mode=mode)
+    half_window = window_length // 2
+    pad_width = [(0, 0)] * (intensity.ndim - 1) + [(half_window, half_window)]
+    padded = np.pad(intensity, pad_width, mode=PAD_MODES[mode])
+    kernel = kernel.reshape((1,) * (intensity.ndim - 1) + (-1,))
+    smoothed = signal.fftconvolve(padded, kernel, mode="valid", axes=-1)
+    return smoothed.astype(intensity.dtype, copy=False)
+
+
 available_filters = {
     "savgol_filter": IntensityFilter(
         "savgol_filter",
-        signal.savgol_filter,
+        savgol_convolve,
         filter_args=(13, 3),
         filter_kwargs=dict(mode="nearest"),
     )
@@ -45,6 +101,26 @@ def filter_spectrum(
     if filter_name not in available_filters:
         raise ValueError(f"Chosen filter {filter_name} not available.")
 
+    filter_class = available_filters[filter_name]
+    filtered_intensity = filter_class.process_intensity(spectrum.intensity)
+    label = f"{filter_name}_{spectrum.label}"
+    filtered_spectrum = SpectrumData.construct_trusted(
+        ramanshift=spectrum.ramanshift,
+        intensity=filtered_intensity,
+        label=label,
+        region_name=spectrum.region_name,
+        source=spectrum.source,
+    )
+    return filtered_spectrum
+
+
+def filter_spectrum_batch(
+    spectrum: SpectrumDataBatch = None, filter_name="savgol_filter"
+) -> SpectrumDataBatch:
+    """Applies the filter along the last axis, on all the spectra of the batch in one call."""
+    if filter_name not in available_filters:
+        raise ValueError(f"Chosen filter {filter_name} not available.")
+
     filter_class = available_filters[filter_name]
     filtered_intensity = filter_class.process_intensity(spectrum.intensity)
     label = f"{filter_name}_{spectrum.label}"
@@ -54,6 +130,38 @@ def filter_spectrum(
     return filtered_spectrum
 
 
+def derivative_spectrum(
+    spectrum: SpectrumData | SpectrumDataBatch,
+    deriv: int = 1,
+    window_length: int = 13,
+    polyorder: int = 3,
+) -> SpectrumData | SpectrumDataBatch:
+    """
+    Smoothed derivative of the intensity to the ramanshift, for peak detection.
+    The step is the median step of the axis, so uneven axes are approximated.
+    """
+    if len(spectrum.ramanshift) < 2:
+        raise ValueError(
+            "Can not take the derivative of a spectrum with less than 2 points."
+        )
+    delta = float(np.median(np.diff(spectrum.ramanshift)))
+    derivative_intensity = savgol_convolve(
+        spectrum.intensity, window_length, polyorder, deriv=deriv, delta=delta
+    )
+    label = f"derivative{deriv}_{spectrum.label}"
+    if isinstance(spectrum, SpectrumDataBatch):
+        return spectrum.model_copy(
+            update={"intensity": derivative_intensity, "label": label}
+        )
+    return SpectrumData.construct_trusted(
+        ramanshift=spectrum.ramanshift,
+        intensity=derivative_intensity,
+        label=label,
+        region_name=spectrum.region_name,
+        source=spectrum.source,
+    )
+
+
 """
 Parameters
 ----------
@@ -0,0 +1,100 @@
+"""Per-point noise of spectra and the weights of the fit derived from it"""
+
+from enum import StrEnum
+from functools import lru_cache
+
+import numpy as np
+from pydantic import BaseModel, Field
+from scipy import ndimage
+
+from raman_fitting.config.default_models import load_config_from_toml_files
+from raman_fitting.processing.aggregation import MAD_TO_STD
+from raman_fitting.processing.filter import get_savgol_kernel, savgol_convolve
+
+FIT_WEIGHTS_CONFIG_KEY = "fit_weights"
+
+
+class NoiseMethods(StrEnum):
+    SMOOTHING_RESIDUAL = "smoothing_residual"
+    POSITION_SPREAD = "position_spread"
+
+
+class NoiseSettings(BaseModel):
+    """
+    smoothing_residual: local robust spread of the residual after smoothing,
+    position_spread: standard error of the aggregated mean from the spread across
+    the positions of a sample, this falls back to the residual for a single position.
+    The noise is floored at min_relative_noise times the median noise of the spectrum.
+    """
+
+    enabled: bool = False
+    method: NoiseMethods = NoiseMethods.SMOOTHING_RESIDUAL
+    window_length: int = 13
+    polyorder: int = 3
+    local_window: int = Field(31, ge=3)
+    min_relative_noise: float = Field(0.1, gt=0)
+
+
+def estimate_noise_from_residual(
+    intensity: np.ndarray,
+    window_length: int = 13,
+    polyorder: int = 3,
+    local_window: int = 31,
+) -> np.ndarray:
+    """
+    Noise per point of a spectrum or of all the rows of a batch, from the median
+    absolute residual after smoothing in a moving window along the last axis.
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    residual = intensity - savgol_convolve(intensity, window_length, polyorder)
+    size = (1,) * (intensity.ndim - 1) + (local_window,)
+    local_mad = ndimage.median_filter(np.abs(residual), size=size, mode="nearest")
+    # the smoothing fits part of the noise, which reduces the residual by sqrt(1 - h0)
+    center_coefficient = get_savgol_kernel(window_length, polyorder)[window_length // 2]
+    return MAD_TO_STD * local_mad / np.sqrt(1 - center_coefficient)
+
+
+def estimate_noise_from_spread(std_intensity: np.ndarray, n_spectra: int) -> np.ndarray:
+    """standard error of the mean of n_spectra positions with the std per point"""
+    return np.asarray(std_intensity, dtype=float) / np.sqrt(n_spectra)
+
+
+def noise_to_weights(noise: np.ndarray, min_relative_noise: float = 0.1) -> np.ndarray:
+    """
+    Weights as 1 / noise, which lmfit multiplies with the residual.
+    Rows without any noise get equal weights.
+    """
+    noise = np.asarray(noise, dtype=float)
+    noise_floor = min_relative_noise * np.median(noise, axis=-1, keepdims=True)
+    weights = 1 / np.maximum(noise, np.where(noise_floor > 0, noise_floor, 1.0))
+    return np.where(noise_floor > 0, weights, 1.0)
+
+
+def estimate_fit_weights(
+    intensity: np.ndarray,
+    settings: NoiseSettings | None = None,
+    std_intensity: np.ndarray | None = None,
+    n_spectra: int = 1,
+) -> np.ndarray:
+    """Fit weights per point, for a spectrum or a batch with the axis last."""
+    settings = NoiseSettings() if settings is None else settings
+    if (
+        settings.method == NoiseMethods.POSITION_SPREAD
+        and std_intensity is not None
+        and n_spectra > 1
+    ):
+        noise = estimate_noise_from_spread(std_intensity, n_spectra)
+    else:
+        noise = estimate_noise_from_residual(
+            intensity,
+            window_length=settings.window_length,
+            polyorder=settings.polyorder,
+            local_window=settings.local_window,
+        )
+    return noise_to_weights(noise, min_relative_noise=settings.min_relative_noise)
+
+
+@lru_cache(maxsize=1)
+def get_default_noise_settings() -> NoiseSettings:
+    config = load_config_from_toml_files()
+    return NoiseSettings(**config.get(FIT_WEIGHTS_CONFIG_KEY, {}))
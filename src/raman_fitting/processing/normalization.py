@@ -1,31 +1,166 @@
-from typing import Optional
+from enum import StrEnum
+from typing import Any, Mapping, Optional, Tuple
 
 import numpy as np
 
-from ..models.splitter import SplitSpectrum
+from ..models.splitter import SplitSpectrum, BatchSplitSpectrum
 from ..models.spectrum import SpectrumData
-from ..models.fit_models import SpectrumFitModel, LMFitModel
+from ..models.fit_models import SpectrumFitModel
+from ..models.deconvolution.base_model import (
+    BaseLMFitModel,
+    get_models_and_peaks_from_definitions,
+)
 
 from loguru import logger
 
+NORMALIZATION_REGION_NAME = "normalization"
+NORMALIZATION_MODEL_NAME = "norm"
+NORMALIZATION_PEAK_NAME = "norm_G"
+LORENTZIAN_HALF_WIDTH = 25.0
+
+
+class NormalizationMethods(StrEnum):
+    SIMPLE = "simple"
+    LORENTZIAN = "lorentzian"
+    FIT = "fit"
+
+
+def get_normalization_model_from_config(
+    normalization_config: Mapping[str, Any],
+) -> BaseLMFitModel:
+    """The norm model from the models and peaks of the normalization config"""
+    models = get_models_and_peaks_from_definitions(
+        {NORMALIZATION_REGION_NAME: normalization_config}
+    )
+    try:
+        return models[NORMALIZATION_REGION_NAME][NORMALIZATION_MODEL_NAME]
+    except KeyError as exc:
+        raise ValueError(
+            f"Normalization model {NORMALIZATION_MODEL_NAME} not in the normalization config."
+        ) from exc
+
+
+def check_normalization_model(
+    normalization_model: BaseLMFitModel | None, norm_method: NormalizationMethods
+) -> BaseLMFitModel:
+    if normalization_model is None:
+        raise ValueError(
+            f"Normalization method {norm_method} needs a normalization model."
+        )
+    return normalization_model
+
+
+def get_normalization_peak_center_limits(
+    normalization_model: BaseLMFitModel,
+) -> Tuple[float, float]:
+    """the limits of the center of the normalization peak, from the norm model"""
+    peak_prefix = f"{NORMALIZATION_PEAK_NAME}_"
+    for component in normalization_model.lmfit_model.components:
+        if component.prefix == peak_prefix:
+            center = component.param_hints.get("center", {})
+            return center.get("min", -np.inf), center.get("max", np.inf)
+    raise ValueError(
+        f"Normalization peak {NORMALIZATION_PEAK_NAME} not in {normalization_model.name}."
+    )
+
 
 def get_simple_normalization_intensity(split_spectrum: SplitSpectrum) -> float:
-    norm_spec = split_spectrum.get_region("normalization")
+    norm_spec = split_spectrum.get_region(NORMALIZATION_REGION_NAME)
     normalization_intensity = np.nanmax(norm_spec.intensity)
     return normalization_intensity
 
 
+def estimate_lorentzian_height(
+    ramanshift: np.ndarray,
+    intensity: np.ndarray,
+    center_limits: Tuple[float, float],
+    half_width: float = LORENTZIAN_HALF_WIDTH,
+) -> np.ndarray:
+    """
+    Closed-form height of a Lorentzian peak, for a spectrum or for each row of a batch.
+    The reciprocal of a Lorentzian is a parabola, h / y = 1 + (x - c)^2 / s^2,
+    so a weighted quadratic least squares of 1 / y around the maximum in the
+    center limits gives the height at the vertex. The weights y^2 turn the residuals
+    of 1 / y back into residuals of y. Rows where the fit fails are NaN.
+    """
+    intensity = np.atleast_2d(np.asarray(intensity, dtype=float))
+    heights = np.full(len(intensity), np.nan)
+    in_limits = np.flatnonzero(
+        (ramanshift >= center_limits[0]) & (ramanshift <= center_limits[1])
+    )
+    if len(in_limits) == 0 or len(ramanshift) < 3:
+        return heights
+    peak_idx = in_limits[np.nanargmax(intensity[:, in_limits], axis=1)]
+    step = np.median(np.abs(np.diff(ramanshift)))
+    n_side = max(1, int(round(half_width / step)))
+    idx = np.clip(peak_idx[:, np.newaxis] + np.arange(-n_side, n_side + 1), 0, None)
+    idx = np.minimum(idx, len(ramanshift) - 1)
+    peak_shift = ramanshift[peak_idx][:, np.newaxis]
+    x = ramanshift[idx] - peak_shift
+    y = np.take_along_axis(intensity, idx, axis=1)
+    valid = np.isfinite(y) & (y > 0)
+    weights = np.where(valid, y**2, 0.0)
+    reciprocal = np.where(valid, 1 / np.where(valid, y, 1.0), 0.0)
+    design = np.stack([x**2, x, np.ones_like(x)], axis=-1) * weights[..., np.newaxis]
+    normal_matrix = np.einsum("nki,nkj->nij", design, design)
+    rhs = np.einsum("nki,nk->ni", design, reciprocal * weights)
+    coefs = np.einsum("nij,nj->ni", np.linalg.pinv(normal_matrix), rhs)
+    a, b, c = coefs.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vertex = -b / (2 * a)
+        height = 1 / (c - b**2 / (4 * a))
+    center = peak_shift[:, 0] + vertex
+    fit_ok = (
+        (a > 0)
+        & np.isfinite(height)
+        & (height > 0)
+        & (center >= center_limits[0])
+        & (center <= center_limits[1])
+    )
+    heights[fit_ok] = height[fit_ok]
+    return heights
+
+
+def get_lorentzian_normalization_intensity(
+    spectrum: SpectrumData,
+    normalization_model: BaseLMFitModel,
+) -> np.ndarray:
+    """The height of the Lorentzian G peak, the maximum where the estimate fails."""
+    center_limits = get_normalization_peak_center_limits(normalization_model)
+    heights = estimate_lorentzian_height(
+        spectrum.ramanshift, spectrum.intensity, center_limits
+    )
+    simple = np.nanmax(np.atleast_2d(spectrum.intensity), axis=1)
+    if np.isnan(heights).any():
+        logger.debug(
+            f"Lorentzian normalization failed for {np.isnan(heights).sum()} spectra, used the maximum."
+        )
+    return np.where(np.isnan(heights), simple, heights)
+
+
 def get_normalization_factor(
     split_spectrum: SplitSpectrum,
     norm_method="simple",
-    normalization_model: LMFitModel = None,
+    normalization_model: BaseLMFitModel = None,
 ) -> float:
-    simple_norm = get_simple_normalization_intensity(split_spectrum)
-    normalization_intensity = simple_norm
+    norm_method = NormalizationMethods(norm_method)
+    normalization_intensity = get_simple_normalization_intensity(split_spectrum)
 
-    if "fit" in norm_method and normalization_model is not None:
+    if norm_method == NormalizationMethods.LORENTZIAN:
+        normalization_model = check_normalization_model(
+            normalization_model, norm_method
+        )
+        norm_spec = split_spectrum.get_region(NORMALIZATION_REGION_NAME)
+        normalization_intensity = get_lorentzian_normalization_intensity(
+            norm_spec, normalization_model=normalization_model
+        )[0]
+    elif norm_method == NormalizationMethods.FIT:
+        normalization_model = check_normalization_model(
+            normalization_model, norm_method
+        )
+        norm_spec = split_spectrum.get_region(NORMALIZATION_REGION_NAME)
         fit_norm = normalizer_fit_model(
-            split_spectrum, normalization_model=normalization_model
+            norm_spec, normalization_model=normalization_model
         )
         if fit_norm is not None:
             normalization_intensity = fit_norm
@@ -41,17 +176,13 @@ def normalize_regions_in_split_spectrum(
     norm_infos = {}
     label = split_spectrum.spectrum.label if label is None else label
     for region_name, spec in split_spectrum.spec_regions.items():
-        norm_label = f"{region_name}_{label}" if region_name not in label else label
-        norm_label = f"norm_{norm_label}" if "norm" not in norm_label else norm_label
-        # label looks like "norm_regionname_label"
-        _data = SpectrumData(
-            **{
-                "ramanshift": spec.ramanshift,
-                "intensity": spec.intensity * norm_factor,
-                "label": norm_label,
-                "region_name": region_name,
-                "source": spec.source,
-            }
+        norm_label = make_normalized_label(region_name, label)
+        _data = SpectrumData.construct_trusted(
+            ramanshift=spec.ramanshift,
+            intensity=spec.intensity * norm_factor,
+            label=norm_label,
+            region_name=region_name,
+            source=spec.source,
         )
         norm_spec_regions.update(**{region_name: _data})
         norm_infos.update(**{region_name: {"normalization_factor": norm_factor}})
@@ -61,25 +192,110 @@ def normalize_regions_in_split_spectrum(
     return norm_spectra
 
 
+def make_normalized_label(region_name: str, label: str) -> str:
+    norm_label = f"{region_name}_{label}" if region_name not in label else label
+    norm_label = f"norm_{norm_label}" if "norm" not in norm_label else norm_label
+    # label looks like "norm_regionname_label"
+    return norm_label
+
+
 def normalize_split_spectrum(
     split_spectrum: SplitSpectrum = None,
+    norm_method: str = "simple",
+    normalization_model: BaseLMFitModel | None = None,
 ) -> SplitSpectrum:
     "Normalize the spectrum intensity according to normalization method."
-    normalization_factor = get_normalization_factor(split_spectrum)
+    normalization_factor = get_normalization_factor(
+        split_spectrum,
+        norm_method=norm_method,
+        normalization_model=normalization_model,
+    )
     norm_data = normalize_regions_in_split_spectrum(
         split_spectrum, normalization_factor
     )
     return norm_data
 
 
+def get_simple_normalization_intensity_batch(
+    split_spectrum: BatchSplitSpectrum,
+) -> np.ndarray:
+    norm_spec = split_spectrum.get_region(NORMALIZATION_REGION_NAME)
+    return np.nanmax(norm_spec.intensity, axis=1)
+
+
+def get_normalization_intensity_batch(
+    split_spectrum: BatchSplitSpectrum,
+    norm_method: str = "simple",
+    normalization_model: BaseLMFitModel | None = None,
+) -> np.ndarray:
+    norm_method = NormalizationMethods(norm_method)
+    if norm_method == NormalizationMethods.SIMPLE:
+        return get_simple_normalization_intensity_batch(split_spectrum)
+    normalization_model = check_normalization_model(normalization_model, norm_method)
+    norm_spec = split_spectrum.get_region(NORMALIZATION_REGION_NAME)
+    if norm_method == NormalizationMethods.LORENTZIAN:
+        return get_lorentzian_normalization_intensity(
+            norm_spec, normalization_model=normalization_model
+        )
+    normalization_intensity = get_simple_normalization_intensity_batch(split_spectrum)
+    for n in range(len(norm_spec)):
+        fit_norm = normalizer_fit_model(
+            norm_spec.get_spectrum(n), normalization_model=normalization_model
+        )
+        if fit_norm is not None:
+            normalization_intensity[n] = fit_norm
+    return normalization_intensity
+
+
+def normalize_batch_split_spectrum(
+    split_spectrum: BatchSplitSpectrum,
+    label: Optional[str] = None,
+    norm_method: str = "simple",
+    normalization_model: BaseLMFitModel | None = None,
+) -> BatchSplitSpectrum:
+    "Normalize each row of the batch by its own normalization factor."
+    norm_factors = 1 / get_normalization_intensity_batch(
+        split_spectrum,
+        norm_method=norm_method,
+        normalization_model=normalization_model,
+    )
+    norm_spec_regions = {}
+    norm_infos = {}
+    label = split_spectrum.spectrum.label if label is None else label
+    for region_name, spec in split_spectrum.spec_regions.items():
+        norm_spec_regions[region_name] = spec.model_copy(
+            update={
+                "intensity": spec.intensity * norm_factors[:, np.newaxis],
+                "label": make_normalized_label(region_name, label),
+                "region_name": region_name,
+            }
+        )
+        norm_infos[region_name] = {"normalization_factor": norm_factors}
+    norm_spectra = split_spectrum.model_copy(
+        update={"spec_regions": norm_spec_regions, "info": norm_infos}
+    )
+    return norm_spectra
+
+
 def normalizer_fit_model(
-    specrum: SpectrumData, normalization_model: LMFitModel
+    spectrum: SpectrumData, normalization_model: BaseLMFitModel
 ) -> float | None:
-    spec_fit = SpectrumFitModel(spectrum=specrum, model=normalization_model)
+    """Fits the norm model on the normalization region, returns the height of the G peak."""
+    region_name = normalization_model.region_name
+    norm_spectrum = SpectrumData.construct_trusted(
+        ramanshift=spectrum.ramanshift,
+        intensity=spectrum.intensity,
+        label=spectrum.label,
+        region_name=region_name,
+        source=spectrum.source,
+    )
+    spec_fit = SpectrumFitModel(
+        spectrum=norm_spectrum, model=normalization_model, region=region_name
+    )
     spec_fit.run_fit()
     if not spec_fit.fit_result:
         return
     try:
-        return spec_fit.fit_result.params["G_height"].value
+        return spec_fit.fit_result.params[f"{NORMALIZATION_PEAK_NAME}_height"].value
     except KeyError as e:
         logger.error(e)
@@ -0,0 +1,438 @@
+"""Declarative pipeline of the processing steps, with timing and memory per step"""
+
+import json
+import time
+import tomllib
+import tracemalloc
+from dataclasses import dataclass, field
+from enum import StrEnum
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
+from loguru import logger
+
+from raman_fitting.config.default_models import load_config_from_toml_files
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.models.deconvolution.base_model import BaseLMFitModel
+from raman_fitting.models.deconvolution.spectrum_regions import SpectrumRegionLimits
+from raman_fitting.models.splitter import (
+    BatchSplitSpectrum,
+    RegionNames,
+    SplitSpectrum,
+    get_default_spectrum_region_limits,
+)
+
+from .baseline_subtraction import (
+    subtract_baseline_from_batch_split,
+    subtract_baseline_from_split_spectrum,
+)
+from .binning import bin_split_spectrum
+from .despike import SpectrumDespiker
+from .filter import filter_spectrum, filter_spectrum_batch
+from .normalization import (
+    NORMALIZATION_REGION_NAME,
+    get_normalization_model_from_config,
+    normalize_batch_split_spectrum,
+    normalize_split_spectrum,
+)
+
+PROCESSING_CONFIG_KEY = "processing"
+# the normalize step needs the normalization region, and the baseline of the
+# normalization and full regions takes its edges from the first order region
+REQUIRED_REGION_NAMES = (NORMALIZATION_REGION_NAME, RegionNames.first_order)
+
+
+class ProcessingStages(StrEnum):
+    """The input and output types of a step: spectrum -> spectrum, spectrum -> split
+    or split -> split. A pipeline has exactly one split step."""
+
+    SPECTRUM = "spectrum"
+    SPLIT = "split"
+    REGIONS = "regions"
+
+
+@dataclass
+class ProcessingStep:
+    """
+    The batch_step_func is the same step for a batch of spectra on a shared axis.
+    The pipeline_kwargs are the names of the settings of the pipeline, besides the
+    kwargs of the step, that the pipeline passes to the step.
+    Steps with returns_info return their result and a dict of diagnostics.
+    """
+
+    name: str
+    stage: ProcessingStages
+    step_func: Callable
+    batch_step_func: Callable | None = None
+    pipeline_kwargs: Tuple[str, ...] = ()
+    returns_info: bool = False
+
+    def process(self, data: Any, **kwargs) -> Any:
+        return self.step_func(data, **kwargs)
+
+    def process_batch(self, data: Any, **kwargs) -> Any:
+        if self.batch_step_func is None:
+            raise ValueError(f"Processing step {self.name} has no batch version.")
+        return self.batch_step_func(data, **kwargs)
+
+
+available_processing_steps: Dict[str, ProcessingStep] = {}
+
+
+def register_processing_step(
+    name: str,
+    stage: ProcessingStages,
+    pipeline_kwargs: Sequence[str] = (),
+    returns_info: bool = False,
+) -> Callable:
+    """Decorator that adds the function to the available processing steps"""
+
+    def decorator(step_func: Callable) -> Callable:
+        available_processing_steps[name] = ProcessingStep(
+            name,
+            ProcessingStages(stage),
+            step_func,
+            pipeline_kwargs=tuple(pipeline_kwargs),
+            returns_info=returns_info,
+        )
+        return step_func
+
+    return decorator
+
+
+def register_batch_processing_step(name: str) -> Callable:
+    """Decorator that adds the function as the batch version of a registered step"""
+
+    def decorator(batch_step_func: Callable) -> Callable:
+        available_processing_steps[name].batch_step_func = batch_step_func
+        return batch_step_func
+
+    return decorator
+
+
+@register_processing_step("filter", ProcessingStages.SPECTRUM)
+def filter_step(spectrum: SpectrumData, filter_name="savgol_filter") -> SpectrumData:
+    return filter_spectrum(spectrum=spectrum, filter_name=filter_name)
+
+
+@register_batch_processing_step("filter")
+def filter_batch_step(
+    spectrum: SpectrumDataBatch, filter_name="savgol_filter"
+) -> SpectrumDataBatch:
+    return filter_spectrum_batch(spectrum=spectrum, filter_name=filter_name)
+
+
+@register_processing_step("despike", ProcessingStages.SPECTRUM, returns_info=True)
+def despike_step(
+    spectrum: SpectrumData, **kwargs
+) -> Tuple[SpectrumData, Dict[str, Any]]:
+    """the diagnostics are the z-values, or only scalars without keep_diagnostics"""
+    despiker = SpectrumDespiker(spectrum=spectrum, **kwargs)
+    return despiker.processed_spectrum, despiker.info
+
+
+@register_batch_processing_step("despike")
+def despike_batch_step(
+    spectrum: SpectrumDataBatch, **kwargs
+) -> Tuple[SpectrumDataBatch, Dict[str, Any]]:
+    despiker = SpectrumDespiker.model_construct(**kwargs)
+    despiked_intensity, info = despiker.call_despike_spectra_batch(spectrum.intensity)
+    return spectrum.model_copy(update={"intensity": despiked_intensity}), info
+
+
+def select_region_limits(
+    region_names: Sequence[str],
+    region_limits: Dict[str, SpectrumRegionLimits] | None = None,
+) -> Dict[str, SpectrumRegionLimits]:
+    """The limits of the selected regions and of the regions the region steps depend on."""
+    if region_limits is None:
+        region_limits = get_default_spectrum_region_limits()
+    selected = set(map(str, [*region_names, *REQUIRED_REGION_NAMES]))
+    unknown = selected - set(region_limits)
+    if unknown:
+        raise ValueError(f"Regions {unknown} not in {list(region_limits)}")
+    return {k: v for k, v in region_limits.items() if k in selected}
+
+
+@register_processing_step("split", ProcessingStages.SPLIT)
+def split_step(
+    spectrum: SpectrumData, region_names: Sequence[str] | None = None, **kwargs
+) -> SplitSpectrum:
+    """Splits only the selected regions when region_names are given."""
+    if region_names is not None:
+        kwargs["region_limits"] = select_region_limits(
+            region_names, region_limits=kwargs.get("region_limits")
+        )
+    return SplitSpectrum(spectrum=spectrum, **kwargs)
+
+
+@register_batch_processing_step("split")
+def split_batch_step(
+    spectrum: SpectrumDataBatch, region_names: Sequence[str] | None = None, **kwargs
+) -> BatchSplitSpectrum:
+    if region_names is not None:
+        kwargs["region_limits"] = select_region_limits(
+            region_names, region_limits=kwargs.get("region_limits")
+        )
+    return BatchSplitSpectrum(spectrum=spectrum, **kwargs)
+
+
+@register_processing_step("baseline", ProcessingStages.REGIONS)
+def baseline_step(split_spectrum: SplitSpectrum, **kwargs) -> SplitSpectrum:
+    return subtract_baseline_from_split_spectrum(
+        split_spectrum=split_spectrum, **kwargs
+    )
+
+
+@register_batch_processing_step("baseline")
+def baseline_batch_step(
+    split_spectrum: BatchSplitSpectrum, **kwargs
+) -> BatchSplitSpectrum:
+    return subtract_baseline_from_batch_split(split_spectrum=split_spectrum, **kwargs)
+
+
+@register_processing_step(
+    "normalize", ProcessingStages.REGIONS, pipeline_kwargs=("normalization_model",)
+)
+def normalize_step(split_spectrum: SplitSpectrum, **kwargs) -> SplitSpectrum:
+    return normalize_split_spectrum(split_spectrum=split_spectrum, **kwargs)
+
+
+@register_batch_processing_step("normalize")
+def normalize_batch_step(
+    split_spectrum: BatchSplitSpectrum, **kwargs
+) -> BatchSplitSpectrum:
+    return normalize_batch_split_spectrum(split_spectrum=split_spectrum, **kwargs)
+
+
+@register_processing_step("bin", ProcessingStages.REGIONS)
+def bin_step(split_spectrum: SplitSpectrum) -> SplitSpectrum:
+    return bin_split_spectrum(split_spectrum)
+
+
+@register_batch_processing_step("bin")
+def bin_batch_step(split_spectrum: BatchSplitSpectrum) -> BatchSplitSpectrum:
+    return bin_split_spectrum(split_spectrum)
+
+
+class ProcessingStepConfig(BaseModel):
+    name: str
+    step: str = Field(None, validate_default=False)
+    enabled: bool = True
+    kwargs: Dict[str, Any] = Field(default_factory=dict)
+
+    @model_validator(mode="after")
+    def check_step_is_available(self) -> "ProcessingStepConfig":
+        if self.step is None:
+            self.step = self.name
+        if self.step not in available_processing_steps:
+            raise ValueError(
+                f"Processing step {self.step} not available, "
+                f"choose from {', '.join(available_processing_steps)}."
+            )
+        return self
+
+    @property
+    def processing_step(self) -> ProcessingStep:
+        return available_processing_steps[self.step]
+
+
+@dataclass
+class ProcessingStepRecord:
+    name: str
+    step: str
+    duration: float
+    output_nbytes: int
+    peak_memory: int | None = None
+    info: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+def get_output_nbytes(
+    data: SpectrumData | SpectrumDataBatch | SplitSpectrum | BatchSplitSpectrum,
+) -> int:
+    if isinstance(data, (SplitSpectrum, BatchSplitSpectrum)):
+        spectra = [data.spectrum, *data.spec_regions.values()]
+    else:
+        spectra = [data]
+    return sum(i.ramanshift.nbytes + i.intensity.nbytes for i in spectra)
+
+
+def get_default_normalization_config() -> Dict[str, Any]:
+    return dict(load_config_from_toml_files().get(NORMALIZATION_REGION_NAME, {}))
+
+
+class ProcessingPipeline(BaseModel):
+    """
+    Ordered processing steps, by name from the available processing steps.
+    The steps of the spectrum stage come before the split step, the region steps after it.
+    The normalization is the config of the models and peaks of the normalization
+    region, from which the normalize step gets its norm model.
+    """
+
+    steps: List[ProcessingStepConfig]
+    track_memory: bool = False
+    normalization: Dict[str, Any] = Field(
+        default_factory=get_default_normalization_config
+    )
+    # the norm model with the config it was made from, copies can change the config
+    _normalization_model: Tuple[str, BaseLMFitModel] | None = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def check_order_of_stages(self) -> "ProcessingPipeline":
+        stages = [i.processing_step.stage for i in self.enabled_steps]
+        if stages.count(ProcessingStages.SPLIT) != 1:
+            raise ValueError("The processing pipeline needs exactly one split step.")
+        split_idx = stages.index(ProcessingStages.SPLIT)
+        if any(i != ProcessingStages.SPECTRUM for i in stages[:split_idx]) or any(
+            i != ProcessingStages.REGIONS for i in stages[split_idx + 1 :]
+        ):
+            raise ValueError(
+                "The spectrum steps must come before and the region steps after the split step."
+            )
+        return self
+
+    @property
+    def enabled_steps(self) -> List[ProcessingStepConfig]:
+        return [i for i in self.steps if i.enabled]
+
+    @property
+    def region_steps(self) -> List[ProcessingStepConfig]:
+        """the split step and the steps after it"""
+        stages = [i.processing_step.stage for i in self.enabled_steps]
+        return self.enabled_steps[stages.index(ProcessingStages.SPLIT) :]
+
+    @property
+    def normalization_model(self) -> BaseLMFitModel:
+        config_text = json.dumps(self.normalization, sort_keys=True, default=str)
+        if self._normalization_model is None or (
+            self._normalization_model[0] != config_text
+        ):
+            self._normalization_model = (
+                config_text,
+                get_normalization_model_from_config(self.normalization),
+            )
+        return self._normalization_model[1]
+
+    def get_pipeline_kwargs(self, processing_step: ProcessingStep) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in processing_step.pipeline_kwargs}
+
+    def with_step_kwargs(self, step: str, **kwargs) -> "ProcessingPipeline":
+        """A copy of the pipeline with the kwargs updated for the configs of the step"""
+        steps = [
+            i.model_copy(update={"kwargs": {**i.kwargs, **kwargs}})
+            if i.step == step
+            else i
+            for i in self.steps
+        ]
+        return self.model_copy(update={"steps": steps})
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "ProcessingPipeline":
+        pipeline_config = dict(config.get(PROCESSING_CONFIG_KEY, config))
+        if NORMALIZATION_REGION_NAME in config:
+            pipeline_config.setdefault(
+                "normalization", dict(config[NORMALIZATION_REGION_NAME])
+            )
+        return cls(**pipeline_config)
+
+    @classmethod
+    def from_toml(cls, filepath: Path) -> "ProcessingPipeline":
+        return cls.from_config(tomllib.loads(Path(filepath).read_text()))
+
+    def run(
+        self, spectrum: SpectrumData, region_names: Sequence[str] | None = None
+    ) -> Tuple[SplitSpectrum, List[ProcessingStepRecord]]:
+        """Only the selected regions are split and processed, all of them by default."""
+        return self.run_steps(self.enabled_steps, spectrum, region_names=region_names)
+
+    def run_regions(
+        self, spectrum: SpectrumData, region_names: Sequence[str]
+    ) -> Tuple[SplitSpectrum, List[ProcessingStepRecord]]:
+        """The split and region steps, for a spectrum that went through the spectrum steps."""
+        return self.run_steps(self.region_steps, spectrum, region_names=region_names)
+
+    def run_batch(
+        self, spectrum: SpectrumDataBatch, region_names: Sequence[str] | None = None
+    ) -> Tuple[BatchSplitSpectrum, List[ProcessingStepRecord]]:
+        """The same steps on all the rows of a batch at once."""
+        return self.run_steps(
+            self.enabled_steps, spectrum, region_names=region_names, batch=True
+        )
+
+    def run_steps(
+        self,
+        steps: List[ProcessingStepConfig],
+        spectrum: SpectrumData | SpectrumDataBatch,
+        region_names: Sequence[str] | None = None,
+        batch: bool = False,
+    ) -> Tuple[SplitSpectrum | BatchSplitSpectrum, List[ProcessingStepRecord]]:
+        records = []
+        data = spectrum
+        for step_config in steps:
+            step_kwargs = {}
+            if (
+                region_names is not None
+                and step_config.processing_step.stage == ProcessingStages.SPLIT
+            ):
+                step_kwargs["region_names"] = region_names
+            data, record = self.run_step(step_config, data, batch=batch, **step_kwargs)
+            records.append(record)
+        logger.debug(
+            f"Processed {spectrum.label} in "
+            + ", ".join(f"{i.name}: {i.duration:.2e}s" for i in records)
+        )
+        return data, records
+
+    def run_step(
+        self,
+        step_config: ProcessingStepConfig,
+        data: Any,
+        batch: bool = False,
+        **step_kwargs,
+    ) -> Tuple[Any, ProcessingStepRecord]:
+        processing_step = step_config.processing_step
+        process = processing_step.process_batch if batch else processing_step.process
+        start_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            start_memory, _ = tracemalloc.get_traced_memory()
+        start_time = time.perf_counter()
+        info = {}
+        try:
+            result = process(
+                data,
+                **{
+                    **self.get_pipeline_kwargs(processing_step),
+                    **step_config.kwargs,
+                    **step_kwargs,
+                },
+            )
+            duration = time.perf_counter() - start_time
+            if processing_step.returns_info:
+                result, info = result
+            peak_memory = None
+            if self.track_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                peak_memory = peak - start_memory
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+        record = ProcessingStepRecord(
+            name=step_config.name,
+            step=step_config.step,
+            duration=duration,
+            output_nbytes=get_output_nbytes(result),
+            peak_memory=peak_memory,
+            info=info,
+        )
+        return result, record
+
+
+@lru_cache(maxsize=1)
+def get_default_processing_pipeline() -> ProcessingPipeline:
+    return ProcessingPipeline.from_config(load_config_from_toml_files())
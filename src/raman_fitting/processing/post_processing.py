@@ -1,13 +1,39 @@
-from dataclasses import dataclass
-from typing import Protocol
+from dataclasses import dataclass, field, replace
+from typing import Any, List, Protocol, Sequence
 
-from raman_fitting.models.spectrum import SpectrumData
+import numpy as np
 
-from .baseline_subtraction import subtract_baseline_from_split_spectrum
-from .filter import filter_spectrum
-from .despike import SpectrumDespiker
-from ..models.splitter import SplitSpectrum
-from .normalization import normalize_split_spectrum
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+
+from ..models.splitter import SplitSpectrum, BatchSplitSpectrum, make_region_label
+from .pipeline import (
+    ProcessingPipeline,
+    ProcessingStepRecord,
+    get_default_processing_pipeline,
+)
+from .spectrum_cache import ProcessedSpectrumCache
+
+
+def reduce_to_scalars(value: Any) -> Any:
+    """
+    The arrays in the (nested) info reduced to scalars, for the lean memory mode:
+    the value of a single element, the count of a mask, or the min, max and mean.
+    """
+    if isinstance(value, dict):
+        return {k: reduce_to_scalars(v) for k, v in value.items()}
+    if not isinstance(value, np.ndarray):
+        return value
+    if value.size == 1:
+        return value.item()
+    if value.dtype == bool:
+        return int(np.count_nonzero(value))
+    if not value.size or not np.issubdtype(value.dtype, np.number):
+        return {"size": int(value.size)}
+    return {
+        "min": float(np.nanmin(value)),
+        "max": float(np.nanmax(value)),
+        "mean": float(np.nanmean(value)),
+    }
 
 
 class PreProcessor(Protocol):
@@ -20,33 +46,131 @@ class PostProcessor(Protocol):
 
 @dataclass
 class SpectrumProcessor:
+    """
+    Processes the spectrum with the pipeline. When region_names are given only those
+    regions, and the regions that the normalization depends on, are processed.
+    Other regions are processed on their first access with get_region.
+    """
+
     spectrum: SpectrumData
     processed: bool = False
     clean_spectrum: SplitSpectrum | None = None
+    cache: ProcessedSpectrumCache | None = field(default=None, repr=False)
+    pipeline: ProcessingPipeline | None = field(default=None, repr=False)
+    step_records: List[ProcessingStepRecord] = field(default_factory=list, repr=False)
+    region_names: Sequence[str] | None = None
 
     def __post_init__(self):
+        if self.pipeline is None:
+            self.pipeline = get_default_processing_pipeline()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(
+                self.spectrum, pipeline=self.pipeline, region_names=self.region_names
+            )
+            cached_spectrum = self.cache.load(cache_key, source=self.spectrum.source)
+            if cached_spectrum is not None:
+                self.clean_spectrum = cached_spectrum
+                self.processed = True
+                return
         processed_spectrum = self.process_spectrum()
         self.clean_spectrum = processed_spectrum
         self.processed = True
+        if cache_key is not None:
+            self.cache.store(cache_key, processed_spectrum)
 
     def process_spectrum(self) -> SplitSpectrum:
-        pre_processed_spectrum = self.pre_process_intensity(spectrum=self.spectrum)
-        post_processed_spectra = self.post_process_spectrum(
-            spectrum=pre_processed_spectrum
+        processed_spectrum, self.step_records = self.pipeline.run(
+            self.spectrum, region_names=self.region_names
         )
-        return post_processed_spectra
+        return processed_spectrum
+
+    def get_region_key(self, region_name: str) -> str | None:
+        region_label = make_region_label(region_name)
+        for region_key in self.clean_spectrum.spec_regions:
+            if region_key.endswith(region_label):
+                return region_key
+        return None
 
-    def pre_process_intensity(self, spectrum: SpectrumData = None) -> SpectrumData:
-        filtered_spectrum = filter_spectrum(spectrum=spectrum)
-        despiker = SpectrumDespiker(spectrum=filtered_spectrum)
-        return despiker.processed_spectrum
+    def get_region(self, region_name: str) -> SpectrumData:
+        """The processed region, which is processed now when it was not selected before."""
+        self.ensure_regions([region_name])
+        return self.clean_spectrum.spec_regions[self.get_region_key(region_name)]
 
-    def post_process_spectrum(self, spectrum: SpectrumData = None) -> SplitSpectrum:
-        split_spectrum = SplitSpectrum(spectrum=spectrum)
-        baseline_subtracted = subtract_baseline_from_split_spectrum(
-            split_spectrum=split_spectrum
+    def ensure_regions(self, region_names: Sequence[str]) -> None:
+        missing = [i for i in region_names if self.get_region_key(i) is None]
+        if not missing:
+            return
+        clean_spectrum = self.clean_spectrum
+        if clean_spectrum.spectrum is None:
+            raise ValueError(
+                f"Can not process the regions {missing}, the spectrum was released."
+            )
+        extra_spectrum, extra_records = self.pipeline.run_regions(
+            clean_spectrum.spectrum, region_names=missing
         )
-        normalized_spectra = normalize_split_spectrum(
-            split_spectrum=baseline_subtracted
+        self.step_records.extend(extra_records)
+        self.clean_spectrum = clean_spectrum.model_copy(
+            update={
+                "region_limits": {
+                    **extra_spectrum.region_limits,
+                    **clean_spectrum.region_limits,
+                },
+                "spec_regions": {
+                    **extra_spectrum.spec_regions,
+                    **clean_spectrum.spec_regions,
+                },
+                "info": {**extra_spectrum.info, **clean_spectrum.info},
+            }
+        )
+
+    def release_memory(self, keep_regions: Sequence[str] | None = None) -> None:
+        """
+        Lean memory mode, drops the input spectrum, the processed spectrum before
+        the split and the regions of the clean spectrum that are not in keep_regions.
+        The arrays in the info of the steps are reduced to scalars.
+        Other regions can not be processed afterwards.
+        """
+        self.spectrum = None
+        clean_spectrum = self.clean_spectrum
+        spec_regions = clean_spectrum.spec_regions
+        if keep_regions is not None:
+            spec_regions = {k: v for k, v in spec_regions.items() if k in keep_regions}
+        self.clean_spectrum = clean_spectrum.model_copy(
+            update={
+                "spectrum": None,
+                "spec_regions": spec_regions,
+                "info": reduce_to_scalars(clean_spectrum.info),
+            }
+        )
+        self.step_records = [
+            replace(i, info=reduce_to_scalars(i.info)) for i in self.step_records
+        ]
+
+
+@dataclass
+class BatchSpectrumProcessor:
+    """
+    Same processing pipeline as the SpectrumProcessor, on a batch of spectra with a
+    shared axis. Each step is applied to the (N, M) intensity block at once.
+    """
+
+    spectrum: SpectrumDataBatch
+    processed: bool = False
+    clean_spectrum: BatchSplitSpectrum | None = None
+    pipeline: ProcessingPipeline | None = field(default=None, repr=False)
+    step_records: List[ProcessingStepRecord] = field(default_factory=list, repr=False)
+    region_names: Sequence[str] | None = None
+
+    def __post_init__(self):
+        if self.pipeline is None:
+            self.pipeline = get_default_processing_pipeline()
+        processed_spectrum = self.process_spectrum()
+        self.clean_spectrum = processed_spectrum
+        self.processed = True
+
+    def process_spectrum(self) -> BatchSplitSpectrum:
+        processed_spectrum, self.step_records = self.pipeline.run_batch(
+            self.spectrum, region_names=self.region_names
         )
-        return normalized_spectra
+        return processed_spectrum
@@ -0,0 +1,187 @@
+"""Resampling of spectra with different axes onto a common grid"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from raman_fitting.models.axis import get_axis_key
+
+INTERPOLATION_WEIGHTS_CACHE_SIZE = 64
+_interpolation_weights_cache: OrderedDict = OrderedDict()
+
+
+class InterpolationMethods(StrEnum):
+    LINEAR = "linear"
+    CUBIC = "cubic"
+
+
+class GridRules(StrEnum):
+    FIRST = "first"
+    INTERSECTION = "intersection"
+    UNION = "union"
+
+
+class ResampleSettings(BaseModel):
+    """
+    The rule sets the range of the common grid: the axis of the first spectrum,
+    the range covered by all spectra or the range covered by any spectrum.
+    The step defaults to the median step of the axes, except for the first rule.
+    Points of the grid outside of a source axis are NaN, the points outside of all the
+    source axes are trimmed from the grid, see trim_uncovered_points.
+    """
+
+    method: InterpolationMethods = InterpolationMethods.LINEAR
+    grid_rule: GridRules = GridRules.INTERSECTION
+    step: float | None = None
+
+
+@dataclass
+class InterpolationWeights:
+    """Interpolation of a source axis onto a target grid as a weighted sum of k neighbours."""
+
+    indices: np.ndarray  # (T, k) indices in the source axis
+    weights: np.ndarray  # (T, k)
+    outside: np.ndarray  # (T,) points of the target outside of the source axis
+
+    def apply(self, intensity: np.ndarray) -> np.ndarray:
+        """Resamples a spectrum or all the rows of a batch with the axis last."""
+        intensity = np.asarray(intensity, dtype=float)
+        resampled = np.einsum(
+            "...tk,tk->...t", intensity[..., self.indices], self.weights
+        )
+        resampled[..., self.outside] = np.nan
+        return resampled
+
+
+def get_axis_step(ramanshift: np.ndarray) -> float:
+    return float(np.median(np.abs(np.diff(ramanshift))))
+
+
+def make_common_grid(
+    axes: Sequence[np.ndarray],
+    grid_rule: GridRules = GridRules.INTERSECTION,
+    step: float | None = None,
+) -> np.ndarray:
+    grid_rule = GridRules(grid_rule)
+    if not axes:
+        raise ValueError("Can not make a common grid without axes.")
+    if grid_rule == GridRules.FIRST and step is None:
+        return np.asarray(axes[0])
+    if step is None:
+        step = float(np.median([get_axis_step(i) for i in axes]))
+    if not step > 0:
+        raise ValueError(f"The step of the common grid should be positive, not {step}.")
+    minima = [np.min(i) for i in axes]
+    maxima = [np.max(i) for i in axes]
+    if grid_rule == GridRules.FIRST:
+        start, stop = minima[0], maxima[0]
+    elif grid_rule == GridRules.INTERSECTION:
+        start, stop = max(minima), min(maxima)
+    else:
+        start, stop = min(minima), max(maxima)
+    if stop < start:
+        raise ValueError(f"The axes do not overlap, {start} > {stop}.")
+    num = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(num)
+
+
+def calculate_interpolation_weights(
+    source: np.ndarray,
+    target: np.ndarray,
+    method: InterpolationMethods = InterpolationMethods.LINEAR,
+) -> InterpolationWeights:
+    """
+    Linear interpolation uses the 2 neighbours, cubic the local Lagrange
+    polynomial through the 4 nearest points, so both work on uneven axes.
+    """
+    method = InterpolationMethods(method)
+    source, target = np.asarray(source, dtype=float), np.asarray(target, dtype=float)
+    if len(source) < 2:
+        raise ValueError("Can not interpolate on an axis with less than 2 points.")
+    order = np.argsort(source, kind="stable")
+    sorted_source = source[order]
+    position = np.searchsorted(sorted_source, target, side="right") - 1
+    if method == InterpolationMethods.CUBIC and len(source) >= 4:
+        start = np.clip(position - 1, 0, len(source) - 4)
+        indices = start[:, np.newaxis] + np.arange(4)
+        nodes = sorted_source[indices]
+        weights = np.ones_like(nodes)
+        for j in range(4):
+            for m in range(4):
+                if m != j:
+                    weights[:, j] *= (target - nodes[:, m]) / (
+                        nodes[:, j] - nodes[:, m]
+                    )
+    else:
+        start = np.clip(position, 0, len(source) - 2)
+        indices = start[:, np.newaxis] + np.arange(2)
+        left, right = sorted_source[indices].T
+        fraction = (target - left) / (right - left)
+        weights = np.stack([1 - fraction, fraction], axis=1)
+    outside = (target < sorted_source[0]) | (target > sorted_source[-1])
+    weights[outside] = 0.0
+    return InterpolationWeights(
+        indices=order[indices], weights=weights, outside=outside
+    )
+
+
+def get_interpolation_weights(
+    source: np.ndarray,
+    target: np.ndarray,
+    method: InterpolationMethods = InterpolationMethods.LINEAR,
+) -> InterpolationWeights:
+    """Cached interpolation weights per distinct source axis, target grid and method."""
+    cache_key = (get_axis_key(source), get_axis_key(target), str(method))
+    if cache_key in _interpolation_weights_cache:
+        _interpolation_weights_cache.move_to_end(cache_key)
+        return _interpolation_weights_cache[cache_key]
+    weights = calculate_interpolation_weights(source, target, method=method)
+    _interpolation_weights_cache[cache_key] = weights
+    if len(_interpolation_weights_cache) > INTERPOLATION_WEIGHTS_CACHE_SIZE:
+        _interpolation_weights_cache.popitem(last=False)
+    return weights
+
+
+def resample_spectra(
+    axes: Sequence[np.ndarray],
+    intensities: Sequence[np.ndarray],
+    settings: ResampleSettings | None = None,
+    grid: np.ndarray | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resamples the spectra onto a common grid, returns the grid and the (N, T) intensity.
+    The spectra that share an axis are resampled together in one call.
+    """
+    settings = ResampleSettings() if settings is None else settings
+    if grid is None:
+        grid = make_common_grid(axes, settings.grid_rule, step=settings.step)
+    resampled = np.empty((len(intensities), len(grid)))
+    groups: OrderedDict = OrderedDict()
+    for n, axis in enumerate(axes):
+        groups.setdefault(get_axis_key(axis), []).append(n)
+    for rows in groups.values():
+        weights = get_interpolation_weights(axes[rows[0]], grid, settings.method)
+        resampled[rows] = weights.apply(np.vstack([intensities[i] for i in rows]))
+    return grid, resampled
+
+
+def trim_uncovered_points(
+    grid: np.ndarray, intensity: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Drops the points of the grid that no spectrum covers, like the gap between axes
+    that do not overlap on a union grid, so that every aggregation sees the same points.
+    """
+    covered = ~np.isnan(intensity).all(axis=0)
+    if covered.all():
+        return grid, intensity
+    return grid[covered], intensity[:, covered]
+
+
+def axes_are_equal(axes: List[np.ndarray]) -> bool:
+    """interned axes are compared by identity first"""
+    return all(i is axes[0] or np.array_equal(axes[0], i) for i in axes[1:])
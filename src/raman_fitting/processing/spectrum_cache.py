@@ -0,0 +1,208 @@
+"""On-disk cache of the processed (clean) spectra"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Sequence
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from loguru import logger
+
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.models.splitter import (
+    SplitSpectrum,
+    get_default_spectrum_region_limits,
+)
+from raman_fitting.models.deconvolution.spectrum_regions import SpectrumRegionLimits
+
+from .despike import SpectrumDespiker
+from .filter import available_filters
+from .pipeline import ProcessingPipeline, get_default_processing_pipeline
+
+# increase when the processing steps change in a way that is not part of the config
+PROCESSING_CACHE_VERSION = 1
+CACHE_FILE_SUFFIX = ".npz"
+
+
+def _to_json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "_asdict"):
+        return obj._asdict()
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def hash_json(data: Any) -> str:
+    text = json.dumps(data, sort_keys=True, default=_to_json_default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_spectrum_content_hash(spectrum: SpectrumData) -> str:
+    """hash of the raw arrays and the label, the source is not part of the content"""
+    content_hash = hashlib.sha256()
+    for array in (spectrum.ramanshift, spectrum.intensity):
+        array = np.ascontiguousarray(array)
+        content_hash.update(array.dtype.str.encode())
+        content_hash.update(array.tobytes())
+    content_hash.update(str(spectrum.label).encode())
+    return content_hash.hexdigest()
+
+
+def get_processing_config(
+    region_limits: Dict[str, SpectrumRegionLimits] | None = None,
+    filter_name: str = "savgol_filter",
+    despiker: SpectrumDespiker | None = None,
+    norm_method: str = "simple",
+) -> Dict[str, Any]:
+    """The effective settings of all the steps of the SpectrumProcessor"""
+    if region_limits is None:
+        region_limits = get_default_spectrum_region_limits()
+    if despiker is None:
+        despiker = SpectrumDespiker.model_construct()
+    intensity_filter = available_filters[filter_name]
+    return {
+        "version": PROCESSING_CACHE_VERSION,
+        "filter": {
+            "name": intensity_filter.name,
+            "args": list(intensity_filter.filter_args),
+            "kwargs": intensity_filter.filter_kwargs,
+        },
+        "despike": {
+            "threshold_z_value": despiker.threshold_z_value,
+            "moving_region_size": despiker.moving_region_size,
+            "ignore_lims": list(despiker.ignore_lims),
+        },
+        "regions": {
+            name: region.model_dump(mode="json")
+            for name, region in region_limits.items()
+        },
+        "normalization": norm_method,
+    }
+
+
+class ProcessedSpectrumCache(BaseModel):
+    """
+    Stores the regions of the clean spectrum of the SpectrumProcessor in a npz file,
+    keyed by the hash of the raw spectrum and the hash of the processing config.
+    Changing the region limits or the filter settings changes the key,
+    so stale entries are never read.
+    """
+
+    cache_dir: Path
+    config_hash: str = Field(None, validate_default=False)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.config_hash is None:
+            self.config_hash = hash_json(get_processing_config())
+
+    def make_key(
+        self,
+        spectrum: SpectrumData,
+        pipeline: ProcessingPipeline | None = None,
+        region_names: Sequence[str] | None = None,
+    ) -> str:
+        if pipeline is None:
+            pipeline = get_default_processing_pipeline()
+        pipeline_config = pipeline.model_dump(mode="json", exclude={"track_memory"})
+        hash_parts = [self.config_hash, pipeline_config]
+        if region_names is not None:
+            hash_parts.append(sorted(set(map(str, region_names))))
+        config_hash = hash_json(hash_parts)
+        return f"{get_spectrum_content_hash(spectrum)[:32]}_{config_hash[:16]}"
+
+    def get_cache_file(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{CACHE_FILE_SUFFIX}"
+
+    def load(self, key: str, source=None) -> SplitSpectrum | None:
+        cache_file = self.get_cache_file(key)
+        if not cache_file.exists():
+            return None
+        try:
+            with np.load(cache_file, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                arrays = {k: data[k] for k in data.files if k != "meta"}
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(
+                f"Could not read processed spectrum cache {cache_file}.\n{exc}"
+            )
+            return None
+
+        def make_spectrum(name: str, spec_meta: Dict[str, Any]) -> SpectrumData:
+            return SpectrumData.construct_trusted(
+                ramanshift=arrays[f"{name}_ramanshift"],
+                intensity=arrays[f"{name}_intensity"],
+                label=spec_meta["label"],
+                region_name=spec_meta["region_name"],
+                source=source,
+            )
+
+        spec_regions = {
+            key: make_spectrum(f"region{n}", spec_meta)
+            for n, (key, spec_meta) in enumerate(meta["spec_regions"].items())
+        }
+        return SplitSpectrum.model_construct(
+            spectrum=make_spectrum("spectrum", meta["spectrum"]),
+            region_limits={
+                k: SpectrumRegionLimits(**v) for k, v in meta["region_limits"].items()
+            },
+            spec_regions=spec_regions,
+            info=meta["info"],
+        )
+
+    def store(self, key: str, split_spectrum: SplitSpectrum) -> Path:
+        arrays = {
+            "spectrum_ramanshift": split_spectrum.spectrum.ramanshift,
+            "spectrum_intensity": split_spectrum.spectrum.intensity,
+        }
+        meta = {
+            "spectrum": {
+                "label": split_spectrum.spectrum.label,
+                "region_name": split_spectrum.spectrum.region_name,
+            },
+            "region_limits": {
+                k: v.model_dump(mode="json")
+                for k, v in split_spectrum.region_limits.items()
+            },
+            "spec_regions": {},
+            "info": split_spectrum.info,
+        }
+        for n, (region_key, spec) in enumerate(split_spectrum.spec_regions.items()):
+            arrays[f"region{n}_ramanshift"] = spec.ramanshift
+            arrays[f"region{n}_intensity"] = spec.intensity
+            meta["spec_regions"][region_key] = {
+                "label": spec.label,
+                "region_name": spec.region_name,
+            }
+        meta_text = json.dumps(meta, default=_to_json_default)
+
+        cache_file = self.get_cache_file(key)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            prefix=f".{key}.", suffix=CACHE_FILE_SUFFIX, dir=self.cache_dir
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, meta=np.array(meta_text), **arrays)
+            os.replace(tmp_name, cache_file)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        logger.debug(f"Stored processed spectrum in cache {cache_file}")
+        return cache_file
+
+    def clear(self) -> int:
+        """Removes all the cached files, returns the number of removed files."""
+        if not self.cache_dir.exists():
+            return 0
+        cache_files = list(self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}"))
+        for cache_file in cache_files:
+            cache_file.unlink(missing_ok=True)
+        return len(cache_files)
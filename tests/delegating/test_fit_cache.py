@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pytest
+from typer.testing import CliRunner
+
+from raman_fitting.config import settings
+from raman_fitting.delegating.fit_cache import FitResultCache, get_array_hash
+from raman_fitting.delegating.run_fit_spectrum import (
+    prepare_spec_fit_regions,
+    run_fit_loop,
+)
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.interfaces.typer_cli import app
+from raman_fitting.models.fit_models import SpectrumFitModel
+from raman_fitting.processing.post_processing import SpectrumProcessor
+
+
+@pytest.fixture
+def first_order_spectrum(example_files):
+    file = [i for i in example_files if "_pos4" in i.stem][0]
+    spectrum = SpectrumProcessor(SpectrumReader(file).spectrum).get_region(
+        "first_order"
+    )
+    spectrum.region_name = "first_order"
+    return spectrum
+
+
+@pytest.fixture
+def models():
+    first_order_models = settings.default_models["first_order"]
+    return {name: first_order_models[name] for name in ("2peaks", "3peaks")}
+
+
+def test_fit_cache_restores_results(
+    tmp_path, monkeypatch, first_order_spectrum, models
+):
+    fit_cache = FitResultCache(cache_dir=tmp_path)
+    fitted = run_fit_loop(
+        prepare_spec_fit_regions(first_order_spectrum, models), fit_cache=fit_cache
+    )
+    assert len(fit_cache.get_cache_files()) == 2
+
+    def run_fit(self):
+        raise AssertionError("The cached fits should not run.")
+
+    monkeypatch.setattr(SpectrumFitModel, "run_fit", run_fit)
+    restored = run_fit_loop(
+        prepare_spec_fit_regions(first_order_spectrum, models), fit_cache=fit_cache
+    )
+    for name, spec_fit in fitted.items():
+        result, cached_result = spec_fit.fit_result, restored[name].fit_result
+        assert cached_result.best_values == result.best_values
+        assert cached_result.redchi == result.redchi
+        assert cached_result.nfev == result.nfev
+        for param_name, param in result.params.items():
+            assert cached_result.params[param_name].stderr == param.stderr
+        np.testing.assert_array_equal(cached_result.best_fit, result.best_fit)
+        assert cached_result.components == spec_fit.model.lmfit_model.components
+        assert restored[name].param_results == spec_fit.param_results
+    assert restored["3peaks"].warm_start == "2peaks"
+
+
+def test_fit_cache_keys(tmp_path, first_order_spectrum, models):
+    fit_cache = FitResultCache(cache_dir=tmp_path)
+    spec_fit = prepare_spec_fit_regions(first_order_spectrum, models)[0]
+    key = fit_cache.make_key(spec_fit)
+    assert key.startswith("2peaks_")
+    assert fit_cache.make_key(spec_fit.model_copy()) == key
+
+    weighted = spec_fit.model_copy(
+        update={"weights": np.ones(len(first_order_spectrum))}
+    )
+    assert fit_cache.make_key(weighted) != key
+    other_method = spec_fit.model_copy(update={"fit_kwargs": {"method": "nelder"}})
+    assert fit_cache.make_key(other_method) != key
+    other_spectrum = spec_fit.model_copy(
+        update={
+            "spectrum": first_order_spectrum.model_copy(
+                update={"intensity": first_order_spectrum.intensity * 2}
+            )
+        }
+    )
+    assert fit_cache.make_key(other_spectrum) != key
+    other_hints = spec_fit.model.model_copy(deep=True)
+    other_hints.lmfit_model.set_param_hint("G_center", value=1590)
+    assert fit_cache.make_key(spec_fit.model_copy(update={"model": other_hints})) != key
+
+
+def test_fit_cache_invalidate_and_evict(tmp_path, first_order_spectrum, models):
+    fit_cache = FitResultCache(cache_dir=tmp_path)
+    run_fit_loop(
+        prepare_spec_fit_regions(first_order_spectrum, models), fit_cache=fit_cache
+    )
+    assert fit_cache.invalidate(model_names=["2"]) == 0
+    assert fit_cache.invalidate(model_names=["2peaks"]) == 1
+    assert [i.name.split("_")[0] for i in fit_cache.get_cache_files()] == ["3peaks"]
+    assert fit_cache.invalidate() == 1
+
+    spec_fits = run_fit_loop(prepare_spec_fit_regions(first_order_spectrum, models))
+    for n, spec_fit in enumerate(spec_fits.values()):
+        cache_file = fit_cache.store(spec_fit)
+        os.utime(cache_file, (n, n))
+    fit_cache.max_size = (
+        fit_cache.get_cache_file(fit_cache.make_key(spec_fits["3peaks"])).stat().st_size
+    )
+    # the least recently used is evicted first
+    assert fit_cache.evict() == 1
+    assert [i.name.split("_")[0] for i in fit_cache.get_cache_files()] == ["3peaks"]
+
+
+def test_get_array_hash():
+    array = np.linspace(0, 1, 10)
+    assert get_array_hash(None) is None
+    assert get_array_hash(array) == get_array_hash(array.copy())
+    assert get_array_hash(array[::2]) == get_array_hash(array[::2].copy())
+    assert get_array_hash(array) != get_array_hash(array.astype(np.float32))
+    assert get_array_hash(array) != get_array_hash(array.reshape(2, 5))
+
+
+def test_clear_cache_rejects_models_for_processed():
+    result = CliRunner().invoke(app, ["clear-cache", "processed", "--models", "2peaks"])
+    assert result.exit_code != 0
+    assert "Invalid value for --models" in result.output
@@ -0,0 +1,66 @@
+import pytest
+
+from raman_fitting.config import settings
+from raman_fitting.delegating.fit_scheduler import (
+    find_warm_start_fit,
+    order_fits_by_inclusion,
+)
+from raman_fitting.delegating.run_fit_spectrum import (
+    prepare_spec_fit_regions,
+    run_fit_loop,
+)
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.models.deconvolution.base_model import BaseLMFitModel
+from raman_fitting.processing.post_processing import SpectrumProcessor
+
+
+@pytest.fixture
+def first_order_spectrum(example_files):
+    file = [i for i in example_files if "_pos4" in i.stem][0]
+    spectrum = SpectrumProcessor(SpectrumReader(file).spectrum).get_region(
+        "first_order"
+    )
+    spectrum.region_name = "first_order"
+    return spectrum
+
+
+@pytest.fixture
+def models():
+    first_order_models = settings.default_models["first_order"]
+    substrate_model = BaseLMFitModel(
+        name="2peaks_substrate", peaks="G+D", region_name="first_order"
+    )
+    substrate_model.add_substrate()
+    return {
+        "3peaks": first_order_models["3peaks"],
+        substrate_model.name: substrate_model,
+        "2peaks": first_order_models["2peaks"],
+    }
+
+
+def test_warm_start_fits(first_order_spectrum, models):
+    spec_fits = prepare_spec_fit_regions(first_order_spectrum, models)
+    assert [i.model.name for i in order_fits_by_inclusion(spec_fits)] == [
+        "2peaks",
+        "3peaks",
+        "2peaks_substrate",
+    ]
+    results = run_fit_loop(spec_fits)
+    assert list(results) == ["3peaks", "2peaks_substrate", "2peaks"]
+    assert results["2peaks"].warm_start is None
+    assert results["3peaks"].warm_start == "2peaks"
+    assert results["2peaks_substrate"].warm_start == "2peaks"
+    assert results["3peaks"].param_results["warm_start"] == "2peaks"
+    assert all(i.fit_result.success for i in results.values())
+    assert (
+        find_warm_start_fit(results["3peaks"], list(results.values()))
+        is (results["2peaks"])
+    )
+
+    cold_fits = prepare_spec_fit_regions(first_order_spectrum, models)
+    cold_results = run_fit_loop(cold_fits, warm_start=False)
+    for name, spec_fit in cold_results.items():
+        assert spec_fit.warm_start is None
+        assert results[name].fit_result.redchi == pytest.approx(
+            spec_fit.fit_result.redchi, rel=1e-3
+        )
@@ -1,7 +1,11 @@
+import copy
+
 import pytest
 
 from raman_fitting.config.path_settings import RunModes
 from raman_fitting.delegating.main_delegator import MainDelegator
+from raman_fitting.exports.exporter import ExportPlots
+from raman_fitting.exports.plot_formatting import PLOT_REGION_AXES
 
 
 @pytest.fixture(scope="module")
@@ -25,3 +29,14 @@ def test_delegator_index(delegator):
 
 def test_main_run(delegator):
     assert delegator.results
+
+
+def test_processing_region_names(delegator):
+    fit_plots_only = copy.copy(delegator)
+    fit_plots_only.export_plots = [ExportPlots.FIT_RESULTS]
+    # the fit plots only draw the fitted regions, which are added per fit
+    assert fit_plots_only.get_processing_region_names() == []
+    assert set(delegator.get_processing_region_names()) == set(PLOT_REGION_AXES)
+    lean = copy.copy(delegator)
+    lean.lean_memory = True
+    assert lean.get_processing_region_names() == []
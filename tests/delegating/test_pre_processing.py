@@ -0,0 +1,128 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from raman_fitting.config import settings  # noqa: F401
+from raman_fitting.delegating.pre_processing import (
+    prepare_aggregated_spectrum_from_files,
+)
+from raman_fitting.delegating.run_fit_spectrum import run_fit_over_selected_models
+from raman_fitting.imports.models import RamanFileInfo
+from raman_fitting.models.splitter import RegionNames
+from raman_fitting.processing.despike import (
+    CrossSpectrumDespiker,
+    SpectrumDespiker,
+)
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.processing.post_processing import SpectrumProcessor
+
+
+def iter_arrays(obj, seen=None):
+    """all the numpy arrays that can be reached from the object"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (str, bytes, int, float, Path)):
+        return
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            yield from iter_arrays(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            yield from iter_arrays(value, seen)
+    elif hasattr(obj, "__dict__"):
+        for value in vars(obj).values():
+            yield from iter_arrays(value, seen)
+
+
+@pytest.fixture
+def raman_files(example_files):
+    files = sorted(i for i in example_files if i.stem.startswith("testDW38C"))
+    return [RamanFileInfo(file=i) for i in files]
+
+
+def test_prepare_aggregated_spectrum_lean_memory(raman_files):
+    cross_despiker = CrossSpectrumDespiker(enabled=True)
+    aggregated = prepare_aggregated_spectrum_from_files(
+        RegionNames.first_order, raman_files, cross_despiker=cross_despiker
+    )
+    lean = prepare_aggregated_spectrum_from_files(
+        RegionNames.first_order,
+        raman_files,
+        cross_despiker=cross_despiker,
+        lean_memory=True,
+    )
+    assert lean.spectrum.intensity.tolist() == aggregated.spectrum.intensity.tolist()
+    assert isinstance(lean.despike_info["spike_mask"], int)
+    for source in lean.sources:
+        assert source.read is None
+        assert source.processed.spectrum is None
+        assert source.processed.clean_spectrum.spectrum is None
+        spec_regions = source.processed.clean_spectrum.spec_regions
+        assert len(spec_regions) == 1
+        assert list(spec_regions)[0].endswith(RegionNames.first_order)
+        region_length = len(list(spec_regions.values())[0])
+        # only the arrays of the kept region survive
+        arrays = list(iter_arrays(source))
+        assert arrays
+        assert max(i.size for i in arrays) <= region_length
+        despike_record = source.processed.step_records[1]
+        assert set(despike_record.info) == {"number_of_spikes", "max_abs_z_value"}
+        with pytest.raises(ValueError):
+            source.processed.get_region(RegionNames.second_order)
+    assert all(
+        len(i.processed.clean_spectrum.spec_regions) > 1 for i in aggregated.sources
+    )
+
+
+def test_despiker_without_diagnostics(raman_files):
+    spectrum = SpectrumReader(raman_files[0].file).spectrum
+    despiker = SpectrumDespiker(spectrum=spectrum, keep_diagnostics=False)
+    assert set(despiker.info) == {"number_of_spikes", "max_abs_z_value"}
+    assert isinstance(despiker.info["max_abs_z_value"], float)
+
+
+def test_prepare_aggregated_spectrum_cross_despiker(raman_files):
+    disabled = prepare_aggregated_spectrum_from_files(
+        RegionNames.first_order,
+        raman_files,
+        cross_despiker=CrossSpectrumDespiker(enabled=False),
+    )
+    assert disabled.despike_info == {}
+    strict = prepare_aggregated_spectrum_from_files(
+        RegionNames.first_order,
+        raman_files,
+        cross_despiker=CrossSpectrumDespiker(threshold_z_value=3.0),
+    )
+    assert set(strict.despike_info["replaced_points"]) == {
+        str(i.file) for i in raman_files
+    }
+
+
+def test_run_fit_processes_each_file_once(
+    raman_files, monkeypatch, default_models_first_order, default_models_second_order
+):
+    processed_spectra = []
+    original_init = SpectrumProcessor.__init__
+
+    def counting_init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        processed_spectra.append(self)
+
+    monkeypatch.setattr(SpectrumProcessor, "__init__", counting_init)
+    models = {
+        RegionNames.first_order: {"2peaks": default_models_first_order["2peaks"]},
+        RegionNames.second_order: {
+            "2nd_4peaks": default_models_second_order["2nd_4peaks"]
+        },
+    }
+    results = run_fit_over_selected_models(raman_files, models, lean_memory=True)
+    assert set(results) == set(models)
+    assert len(processed_spectra) == len(raman_files)
+    for processed in processed_spectra:
+        assert processed.clean_spectrum.spectrum is None
+        assert {
+            processed.get_region_key(i) for i in models
+        } == processed.clean_spectrum.spec_regions.keys()
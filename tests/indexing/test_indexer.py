@@ -1,3 +1,7 @@
+import os
+import time
+
+import numpy as np
 import pytest
 
 from raman_fitting.config.path_settings import (
@@ -7,8 +11,22 @@ from raman_fitting.config.path_settings import (
 from raman_fitting.imports.files.file_indexer import (
     RamanFileIndex,
     initialize_index_from_source_files,
+    select_index_by_fingerprint,
+    set_missing_fingerprints,
+)
+from raman_fitting.imports.files.utils import (
+    IndexFileLockError,
+    get_lock_filepath,
+    index_file_lock,
+    load_dataset_from_file,
+    write_dataset_to_file,
 )
 from raman_fitting.imports.models import RamanFileInfo
+from raman_fitting.imports.spectrum.fingerprint import (
+    SpectrumFingerprint,
+    get_fingerprint_from_file,
+    make_preview,
+)
 
 run_mode = RunModes.PYTEST
 run_paths = get_run_mode_paths(run_mode)
@@ -37,3 +55,112 @@ def test_load_index(index):
     index.index_file.exists()
     new_index = RamanFileIndex(index_file=index.index_file, force_reindex=False)
     assert isinstance(new_index, RamanFileIndex)
+
+
+def test_index_fingerprints(index):
+    fingerprint = index.raman_files[0].fingerprint
+    assert isinstance(fingerprint, SpectrumFingerprint)
+    assert fingerprint.length == 1600
+    assert fingerprint.ramanshift_min < fingerprint.ramanshift_max
+    assert len(fingerprint.preview) == 64
+    assert fingerprint.snr > 0
+
+    # stored as json text in the index file
+    stored = index.dataset.dict[0]["fingerprint"]
+    assert SpectrumFingerprint.from_text(stored) == fingerprint
+    new_index = RamanFileIndex(index_file=index.index_file, force_reindex=False)
+    assert new_index.raman_files[0].fingerprint == fingerprint
+
+    selection = list(
+        select_index_by_fingerprint(index.raman_files, lambda x: x.length > 1e4)
+    )
+    assert not selection
+
+
+def test_make_preview_descending_axis():
+    ramanshift = np.linspace(1000, 2000, 101)
+    intensity = np.exp(-(((ramanshift - 1300) / 50) ** 2))
+    preview = make_preview(ramanshift, intensity, length=11)
+    assert make_preview(ramanshift[::-1], intensity[::-1], length=11) == preview
+    assert np.argmax(preview) == 3
+
+
+def test_set_missing_fingerprints(example_files, tmp_path):
+    raman_files = [RamanFileInfo(file=i) for i in example_files[:2]]
+    assert all(i.fingerprint is None for i in raman_files)
+    assert len(set_missing_fingerprints(raman_files)) == 2
+    assert all(isinstance(i.fingerprint, SpectrumFingerprint) for i in raman_files)
+    assert not set_missing_fingerprints(raman_files)
+
+    unparsable_file = tmp_path / "unparsable.txt"
+    unparsable_file.write_text("no spectrum")
+    assert get_fingerprint_from_file(unparsable_file) is None
+
+
+def test_index_persist_only_changes(index):
+    assert not index.persist()
+    assert not get_lock_filepath(index.index_file).exists()
+
+    shared_index = RamanFileIndex(
+        index_file=index.index_file,
+        raman_files=index.raman_files[:1],
+        force_reindex=False,
+    )
+    assert not shared_index.persist()
+    reloaded_index = RamanFileIndex(index_file=index.index_file)
+    assert len(reloaded_index.raman_files) == len(index.raman_files)
+
+    overwritten_index = RamanFileIndex(
+        index_file=index.index_file,
+        raman_files=index.raman_files[:1],
+        force_reindex=True,
+    )
+    assert len(RamanFileIndex(index_file=index.index_file).raman_files) == 1
+    assert not overwritten_index.persist()
+
+
+def test_index_reload_tracks_dirty_entries(index):
+    stored = load_dataset_from_file(index.index_file)
+    key = stored["filename_id"][0]
+    fingerprint_idx = stored.headers.index("fingerprint")
+    row = list(stored[0])
+    row[fingerprint_idx] = ""
+    stored[0] = row
+    write_dataset_to_file(index.index_file, stored)
+
+    reloaded_index = RamanFileIndex(index_file=index.index_file, persist_to_file=False)
+    assert reloaded_index.dirty_keys == {key}
+    assert reloaded_index.dataset.dict[0] == index.dataset.dict[0]
+    assert reloaded_index.persist() == {key}
+    assert reloaded_index.dirty_keys == set()
+
+    # an unchanged index is not written again
+    mtime = index.index_file.stat().st_mtime_ns
+    unchanged_index = RamanFileIndex(index_file=index.index_file)
+    assert unchanged_index.dirty_keys == set()
+    assert not unchanged_index.persist()
+    assert index.index_file.stat().st_mtime_ns == mtime
+
+
+def test_index_file_lock(tmp_path):
+    index_file = tmp_path / "index.csv"
+    lock_file = get_lock_filepath(index_file)
+    lock_file.write_text("other")
+    with pytest.raises(IndexFileLockError):
+        with index_file_lock(index_file, timeout=0.1, stale_age=60):
+            pass
+    assert lock_file.read_text() == "other"
+
+    old_time = time.time() - 120
+    os.utime(lock_file, (old_time, old_time))
+    with index_file_lock(index_file, timeout=0.1, stale_age=60):
+        owner = lock_file.read_text()
+        assert owner != "other"
+        # a lock that was taken over is not removed on release
+        lock_file.write_text("new owner")
+    assert lock_file.read_text() == "new owner"
+
+    lock_file.unlink()
+    with index_file_lock(index_file):
+        assert lock_file.exists()
+    assert not lock_file.exists()
@@ -0,0 +1,55 @@
+import gc
+
+import numpy as np
+import pytest
+
+from raman_fitting.models.axis import (
+    calculate_axis_key,
+    get_axis_key,
+    get_number_of_interned_axes,
+    intern_axis,
+    is_interned_axis,
+)
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.models.splitter import SplitSpectrum
+
+
+def make_spectra(ramanshift, n=10):
+    return [
+        SpectrumData(
+            ramanshift=ramanshift.copy(),
+            intensity=np.random.default_rng(i).normal(size=len(ramanshift)),
+            label="test",
+            region_name="full",
+        )
+        for i in range(n)
+    ]
+
+
+def test_spectra_share_interned_axis():
+    ramanshift = np.linspace(150.5, 3500.5, 1200)
+    spectra = make_spectra(ramanshift)
+    shared_axis = spectra[0].ramanshift
+    assert all(i.ramanshift is shared_axis for i in spectra)
+    assert is_interned_axis(shared_axis)
+    assert not shared_axis.flags.writeable
+    with pytest.raises(ValueError):
+        shared_axis[0] = 0
+    assert get_axis_key(shared_axis) == calculate_axis_key(shared_axis)
+    assert intern_axis(ramanshift) is shared_axis
+
+    split_spectrum = SplitSpectrum(spectrum=spectra[1])
+    for spec in split_spectrum.spec_regions.values():
+        assert np.shares_memory(spec.ramanshift, shared_axis)
+
+    other = make_spectra(ramanshift + 1, n=1)[0]
+    assert other.ramanshift is not shared_axis
+
+
+def test_interned_axis_is_released():
+    number_of_axes = get_number_of_interned_axes()
+    spectra = make_spectra(np.linspace(101.25, 2001.25, 333), n=3)
+    assert get_number_of_interned_axes() == number_of_axes + 1
+    del spectra
+    gc.collect()
+    assert get_number_of_interned_axes() == number_of_axes
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from lmfit.models import GaussianModel, LorentzianModel
+
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.models.deconvolution.batch_solver import (
+    MESSAGE_CONVERGED,
+    MESSAGE_STALLED,
+    BatchCompositeModel,
+    BoundsTransform,
+    fit_batch,
+)
+from raman_fitting.models.deconvolution.jacobian import fit_with_jacobian
+from raman_fitting.models.fit_models import call_fit_on_batch
+from raman_fitting.models.spectrum import SpectrumDataBatch
+from raman_fitting.processing.post_processing import BatchSpectrumProcessor
+
+
+@pytest.fixture
+def model():
+    model = LorentzianModel(prefix="D_") + GaussianModel(prefix="G_")
+    model.set_param_hint("D_sigma", min=1, max=100)
+    model.set_param_hint("G_center", min=1500, max=1700)
+    return model
+
+
+@pytest.fixture
+def x():
+    return np.linspace(1000, 2000, 400)
+
+
+def test_batch_model_matches_lmfit(model, x):
+    params = model.make_params(
+        D_amplitude=800, D_center=1350, D_sigma=40, G_amplitude=500, G_sigma=25
+    )
+    params["G_center"].value = 1590
+    batch_model = BatchCompositeModel.from_model(model, params)
+    values = batch_model.init_values[np.newaxis, :] * np.array([[1.0], [1.02]])
+    evaluated = batch_model.evaluate(x, values)
+    for row, row_values in zip(evaluated, values):
+        row_params = params.copy()
+        for name, value in zip(batch_model.var_names, row_values):
+            row_params[name].value = value
+        np.testing.assert_allclose(row, model.eval(row_params, x=x), rtol=1e-10)
+    assert batch_model.jacobian(x, values).shape == (2, len(x), 6)
+
+
+def test_bounds_transform():
+    transform = BoundsTransform(
+        lower=np.array([0.0, 1.0, -np.inf, -np.inf]),
+        upper=np.array([10.0, np.inf, 5.0, np.inf]),
+    )
+    values = np.array([[2.5, 4.0, -3.0, 7.0], [10.0, 1.0, 5.0, 0.0]])
+    internal = transform.to_internal(values)
+    np.testing.assert_allclose(transform.from_internal(internal), values, atol=1e-12)
+    step = 1e-6
+    numeric = (
+        transform.from_internal(internal + step)
+        - transform.from_internal(internal - step)
+    ) / (2 * step)
+    np.testing.assert_allclose(transform.gradient(internal), numeric, atol=1e-6)
+
+
+def test_fit_batch_matches_lmfit(model, x):
+    rng = np.random.default_rng(3)
+    true_params = model.make_params(
+        D_amplitude=800, D_center=1350, D_sigma=40, G_amplitude=500, G_sigma=25
+    )
+    true_params["G_center"].value = 1590
+    y = np.vstack(
+        [
+            model.eval(true_params, x=x) * scale + rng.normal(scale=0.01, size=len(x))
+            for scale in np.linspace(0.5, 2, 20)
+        ]
+    )
+    params = model.make_params(
+        D_amplitude=500, D_center=1340, D_sigma=30, G_amplitude=300, G_sigma=30
+    )
+    params["G_center"].value = 1580
+    weights = np.linspace(0.5, 2, len(x))
+    result = fit_batch(model, y, params, x, weights=weights)
+    assert len(result) == len(y)
+    assert result.success.all()
+    for n, row in enumerate(y):
+        expected = fit_with_jacobian(model, row, params, x=x, weights=weights)
+        values = result.get_values(n)
+        for name, value in expected.best_values.items():
+            assert values[name] == pytest.approx(value, rel=1e-6)
+        # the parameters derived with constraints are included
+        assert values["D_fwhm"] == pytest.approx(expected.params["D_fwhm"].value)
+        assert result.get_statistics(n)["redchi"] == pytest.approx(expected.redchi)
+        assert result.get_params(n)["D_center"].stderr == pytest.approx(
+            expected.params["D_center"].stderr, rel=1e-3
+        )
+
+    with pytest.raises(ValueError):
+        product = LorentzianModel(prefix="a_") * GaussianModel(prefix="b_")
+        fit_batch(product, y, product.make_params(), x)
+
+
+def test_call_fit_on_batch(example_files, default_models_first_order):
+    files = sorted(i for i in example_files if i.stem.startswith("testDW38C"))
+    batch = SpectrumDataBatch.from_spectra([SpectrumReader(i).spectrum for i in files])
+    first_order = BatchSpectrumProcessor(batch).clean_spectrum.get_region("first_order")
+    lmfit_model = default_models_first_order["2peaks"].lmfit_model
+    result = call_fit_on_batch(lmfit_model, first_order)
+    assert result.success.all()
+    params = lmfit_model.make_params()
+    for n in range(len(first_order)):
+        expected = fit_with_jacobian(
+            lmfit_model,
+            first_order.intensity[n],
+            params,
+            x=first_order.ramanshift,
+        )
+        assert result.redchi[n] == pytest.approx(expected.redchi, rel=1e-6)
+        assert result.get_values(n)["G_center"] == pytest.approx(
+            expected.best_values["G_center"], rel=1e-6
+        )
+
+
+def test_fit_batch_stalled_is_not_success(model, x):
+    params = model.make_params(
+        D_amplitude=800, D_center=1350, D_sigma=40, G_amplitude=500, G_sigma=25
+    )
+    params["G_center"].value = 1590
+    y = model.eval(params, x=x)[np.newaxis, :] * np.array([[1.0], [1.5]])
+    params = model.make_params(
+        D_amplitude=500, D_center=1340, D_sigma=30, G_amplitude=300, G_sigma=30
+    )
+    params["G_center"].value = 1580
+    # without tolerances no step converges, the damping grows until the fit stalls
+    result = fit_batch(model, y, params, x, ftol=0, xtol=0)
+    assert not result.success.any()
+    assert set(result.message) == {MESSAGE_STALLED}
+    assert result.get_statistics(0)["message"] == MESSAGE_STALLED
+    assert (result.niter < 1000).all()
+    converged = fit_batch(model, y, params, x)
+    assert converged.success.all()
+    assert set(converged.message) == {MESSAGE_CONVERGED}
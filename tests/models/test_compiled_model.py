@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from lmfit.models import GaussianModel, LorentzianModel, VoigtModel
+
+from raman_fitting.models.deconvolution.compiled_model import (
+    CompiledCompositeModel,
+    compile_composite_model,
+    fit_compiled_model,
+)
+
+
+@pytest.fixture
+def x():
+    return np.linspace(1000, 2000, 500)
+
+
+@pytest.fixture
+def composite_model():
+    return (
+        LorentzianModel(prefix="D_")
+        + GaussianModel(prefix="D3_")
+        + LorentzianModel(prefix="G_")
+        + VoigtModel(prefix="V_")
+    )
+
+
+@pytest.fixture
+def params(composite_model):
+    return composite_model.make_params(
+        D_amplitude=800,
+        D_center=1350,
+        D_sigma=40,
+        D3_amplitude=100,
+        D3_center=1500,
+        D3_sigma=30,
+        G_amplitude=500,
+        G_center=1590,
+        G_sigma=25,
+        V_amplitude=50,
+        V_center=1200,
+        V_sigma=20,
+    )
+
+
+def test_compiled_model_matches_lmfit(composite_model, params, x):
+    compiled_model = compile_composite_model(composite_model, params, x)
+    assert compiled_model is not None
+    assert compiled_model.n_peaks == 4
+    # the lorentzians are evaluated together
+    assert [i.rows for i in compiled_model.groups] == [
+        slice(0, 2),
+        slice(2, 3),
+        slice(3, 4),
+    ]
+    params["V_gamma"].set(expr="", value=5, vary=True)
+    np.testing.assert_allclose(
+        compiled_model.evaluate(params, x),
+        composite_model.eval(params, x=x),
+        rtol=1e-12,
+    )
+    buffer = compiled_model.evaluate_into_buffer(params, x)
+    assert compiled_model.evaluate_into_buffer(params, x) is buffer
+    weights = np.linspace(0.5, 2, len(x))
+    data = composite_model.eval(params, x=x) * 0.9
+    np.testing.assert_allclose(
+        compiled_model.residual(params, data, weights, x=x),
+        composite_model._residual(params, data, weights, x=x),
+        rtol=1e-12,
+    )
+
+
+def test_no_compiled_model_for_other_models(x):
+    product = LorentzianModel(prefix="a_") * GaussianModel(prefix="b_")
+    assert CompiledCompositeModel.from_model(product, product.make_params()) is None
+    assert compile_composite_model(product, product.make_params(), x) is None
+
+
+def test_fit_compiled_model(default_models_first_order, x):
+    model = default_models_first_order["4peaks"].lmfit_model
+    params = model.make_params()
+    y = model.eval(params, x=x) * 1.2 + np.random.default_rng(2).normal(
+        scale=0.01, size=len(x)
+    )
+    reference = fit_compiled_model(model, y, params, x, compiled=False)
+    compiled = fit_compiled_model(model, y, params, x)
+    assert compiled.compiled and not reference.compiled
+    assert compiled.nfev == reference.nfev
+    assert compiled.redchi == pytest.approx(reference.redchi, rel=1e-10)
+    for name, value in reference.best_values.items():
+        assert compiled.best_values[name] == pytest.approx(value, rel=1e-8)
+    np.testing.assert_allclose(compiled.best_fit, reference.best_fit, rtol=1e-8)
+    assert compiled.components == model.components
@@ -1,5 +1,9 @@
+import numpy as np
+import pytest
+
 from raman_fitting.imports.spectrumdata_parser import SpectrumReader
 from raman_fitting.models.fit_models import SpectrumFitModel
+from raman_fitting.processing.noise import estimate_fit_weights
 from raman_fitting.processing.post_processing import SpectrumProcessor
 
 
@@ -32,3 +36,31 @@ def test_fit_model(example_files, default_models_first_order):
         spec_fit.param_results["ratios"]["amplitude"]["ratio_d_to_g"]["ratio"]
         == dg_ratio
     )
+
+
+def test_fit_model_with_weights(example_files, default_models_first_order):
+    file = [i for i in example_files if "_pos4" in i.stem][0]
+    spectrum_processor = SpectrumProcessor(SpectrumReader(file).spectrum)
+    clean_spec_1st_order = spectrum_processor.clean_spectrum.spec_regions[
+        "savgol_filter_raw_region_first_order"
+    ]
+    clean_spec_1st_order.region_name = "first_order"
+    weights = estimate_fit_weights(clean_spec_1st_order.intensity)
+
+    spec_fit = SpectrumFitModel(
+        spectrum=clean_spec_1st_order,
+        model=default_models_first_order["2peaks"],
+        region=clean_spec_1st_order.region_name,
+        weights=weights,
+    )
+    spec_fit.run_fit()
+    assert spec_fit.fit_result.success
+    np.testing.assert_array_equal(spec_fit.fit_result.weights, weights)
+
+    with pytest.raises(ValueError):
+        SpectrumFitModel(
+            spectrum=clean_spec_1st_order,
+            model=default_models_first_order["2peaks"],
+            region=clean_spec_1st_order.region_name,
+            weights=weights[:-1],
+        )
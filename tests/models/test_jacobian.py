@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from lmfit.models import GaussianModel, LorentzianModel, VoigtModel
+
+from raman_fitting.models.deconvolution.jacobian import (
+    fit_with_jacobian,
+    make_composite_jacobian,
+)
+
+
+@pytest.fixture
+def composite_model():
+    return (
+        LorentzianModel(prefix="L_")
+        + GaussianModel(prefix="G_")
+        + VoigtModel(prefix="V_")
+    )
+
+
+@pytest.fixture
+def x():
+    return np.linspace(1000, 2000, 500)
+
+
+def finite_difference_jacobian(model, params, x, step=1e-6):
+    columns = []
+    for name in [i for i, par in params.items() if par.vary]:
+        h = step * max(1, abs(params[name].value))
+        upper, lower = params.copy(), params.copy()
+        upper[name].value += h
+        lower[name].value -= h
+        upper.update_constraints()
+        lower.update_constraints()
+        columns.append((model.eval(upper, x=x) - model.eval(lower, x=x)) / (2 * h))
+    return np.stack(columns, axis=1)
+
+
+def test_composite_jacobian_matches_finite_differences(composite_model, x):
+    params = composite_model.make_params(
+        L_amplitude=10,
+        L_center=1350,
+        L_sigma=30,
+        G_amplitude=5,
+        G_center=1500,
+        G_sigma=20,
+        V_amplitude=8,
+        V_center=1600,
+        V_sigma=15,
+    )
+    jacobian = make_composite_jacobian(composite_model, params)
+    weights = np.linspace(0.5, 2, len(x))
+    analytic = jacobian(params, None, weights, x=x)
+    expected = finite_difference_jacobian(composite_model, params, x)
+    np.testing.assert_allclose(
+        analytic, expected * weights[:, np.newaxis], rtol=1e-5, atol=1e-9
+    )
+    assert jacobian.njev == 1
+
+
+def test_no_jacobian_for_other_models(x):
+    product = LorentzianModel(prefix="a_") * GaussianModel(prefix="b_")
+    assert make_composite_jacobian(product, product.make_params()) is None
+    model = LorentzianModel(prefix="a_") + LorentzianModel(prefix="b_")
+    params = model.make_params(a_amplitude=1, a_center=1, a_sigma=1, b_amplitude=1)
+    params["b_center"].set(expr="a_center + 10")
+    assert make_composite_jacobian(model, params) is None
+
+
+def test_fit_with_jacobian(x):
+    model = LorentzianModel(prefix="D_") + LorentzianModel(prefix="G_")
+    y = model.eval(
+        model.make_params(
+            D_amplitude=800,
+            D_center=1350,
+            D_sigma=40,
+            G_amplitude=500,
+            G_center=1590,
+            G_sigma=25,
+        ),
+        x=x,
+    )
+    y = y + np.random.default_rng(5).normal(scale=0.01, size=len(x))
+    params = model.make_params(
+        D_amplitude=500,
+        D_center=1340,
+        D_sigma=30,
+        G_amplitude=300,
+        G_center=1580,
+        G_sigma=30,
+    )
+    numeric = fit_with_jacobian(model, y, params, x=x, analytic_jacobian=False)
+    analytic = fit_with_jacobian(model, y, params, x=x)
+    assert analytic.jacobian_report["analytic"]
+    assert not numeric.jacobian_report["analytic"]
+    assert analytic.nfev < numeric.nfev
+    assert analytic.jacobian_report["saved_nfev"] > 0
+    for name, value in numeric.best_values.items():
+        assert analytic.best_values[name] == pytest.approx(value, rel=1e-4)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from raman_fitting.models.splitter import (
+    _region_bounds_cache,
+    get_default_spectrum_region_limits,
+    get_region_bounds,
+    get_region_mask,
+    split_spectrum_data_in_regions,
+)
+
+
+def test_split_spectrum_regions_are_views():
+    ramanshift = np.linspace(100, 3700, 1600, dtype=np.float32)
+    intensity = np.random.default_rng(0).random(1600, dtype=np.float32)
+    region_limits = get_default_spectrum_region_limits()
+    spec_regions = split_spectrum_data_in_regions(
+        ramanshift, intensity, spec_region_limits=region_limits, label="test"
+    )
+    assert len(spec_regions) == len(region_limits)
+    for spec in spec_regions.values():
+        mask = get_region_mask(ramanshift, region_limits[spec.region_name])
+        np.testing.assert_array_equal(spec.ramanshift, ramanshift[mask])
+        np.testing.assert_array_equal(spec.intensity, intensity[mask])
+        assert np.shares_memory(spec.intensity, intensity)
+
+
+def test_region_bounds_cached_per_axis():
+    ramanshift = np.linspace(100, 3700, 1000)
+    region_limits = get_default_spectrum_region_limits()
+    bounds = get_region_bounds(ramanshift, region_limits)
+    assert get_region_bounds(ramanshift.copy(), region_limits) is bounds
+    assert get_region_bounds(ramanshift + 1, region_limits) is not bounds
+    assert len(_region_bounds_cache) >= 2
+
+    unsorted_bounds = get_region_bounds(ramanshift[::-1], region_limits)
+    for region_name, ind in unsorted_bounds.items():
+        assert ind.dtype == bool
+        assert ind.sum() == len(ramanshift[bounds[region_name]])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from raman_fitting.imports.spectrum.spectra_collection import SpectraDataCollection
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.processing.aggregation import (
+    AggregationSettings,
+    StreamingAggregator,
+    aggregate_intensity,
+)
+
+
+@pytest.fixture
+def intensity():
+    rng = np.random.default_rng(4)
+    signal = 100 * np.exp(-(((np.arange(300) - 150) / 10) ** 2))
+    return signal + rng.normal(0, 1, (20, 300))
+
+
+def test_streaming_aggregator(intensity):
+    aggregator = StreamingAggregator().add_many(iter(intensity))
+    np.testing.assert_allclose(aggregator.mean, intensity.mean(axis=0))
+    np.testing.assert_allclose(aggregator.std, intensity.std(axis=0, ddof=1))
+
+    with_nan = intensity.copy()
+    with_nan[:5, :10] = np.nan
+    aggregator = StreamingAggregator().add_many(with_nan)
+    np.testing.assert_allclose(aggregator.mean, np.nanmean(with_nan, axis=0))
+    np.testing.assert_allclose(aggregator.std, np.nanstd(with_nan, axis=0, ddof=1))
+    assert (aggregator.count[:10] == 15).all()
+    with pytest.raises(ValueError):
+        aggregator.add(np.zeros(10))
+
+
+@pytest.mark.parametrize("method", ["median", "trimmed_mean", "sigma_clipped_mean"])
+def test_robust_aggregation(intensity, method):
+    expected = intensity.mean(axis=0)
+    bad_position = intensity.copy()
+    bad_position[3] += 500
+    settings = AggregationSettings(method=method)
+    mean, _ = aggregate_intensity(bad_position, settings=settings)
+    plain_mean, _ = aggregate_intensity(bad_position)
+    assert np.abs(plain_mean - expected).max() > 20
+    assert np.abs(mean - expected).max() < 2
+
+
+def test_collection_std_intensity(intensity):
+    ramanshift = np.linspace(1000, 2000, intensity.shape[1])
+    spectra = [
+        SpectrumData(
+            ramanshift=ramanshift,
+            intensity=row,
+            label="test",
+            region_name="first_order",
+            source=f"pos{n}",
+        )
+        for n, row in enumerate(intensity)
+    ]
+    collection = SpectraDataCollection(spectra=spectra, region_name="first_order")
+    np.testing.assert_allclose(
+        collection.mean_spectrum.intensity,
+        intensity.astype(np.float32).mean(axis=0),
+        rtol=1e-5,
+        atol=1e-5,
+    )
+    assert collection.std_intensity.shape == ramanshift.shape
+    assert 0.5 < np.median(collection.std_intensity) < 1.5
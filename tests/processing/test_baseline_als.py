@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.models.splitter import BatchSplitSpectrum, SplitSpectrum
+from raman_fitting.processing.baseline_als import get_penalty_bands
+from raman_fitting.processing.baseline_subtraction import (
+    available_baseline_methods,
+    subtract_baseline_from_batch_split,
+    subtract_baseline_from_split_spectrum,
+)
+
+
+@pytest.fixture
+def ramanshift():
+    return np.linspace(200, 3600, 1600)
+
+
+def make_fluorescent_intensity(ramanshift, scale=1.0):
+    background = 1e-4 * (ramanshift - 200) ** 1.5 + 50
+    peaks = 300 * np.exp(-(((ramanshift - 1580) / 15) ** 2)) + 200 * np.exp(
+        -(((ramanshift - 1350) / 20) ** 2)
+    )
+    noise = np.random.default_rng(1).normal(0, 1, len(ramanshift))
+    return scale * (background + peaks + noise), scale * background
+
+
+def test_penalty_bands():
+    size = 30
+    diff_matrix = np.diff(np.eye(size), n=2, axis=0)
+    penalty = 10 * diff_matrix.T @ diff_matrix
+    bands = get_penalty_bands(size, 10.0)
+    assert bands is get_penalty_bands(size, 10.0)
+    for offset in range(3):
+        np.testing.assert_allclose(bands[2 - offset, offset:], np.diag(penalty, offset))
+    with pytest.raises(ValueError):
+        get_penalty_bands(2, 10.0)
+
+
+@pytest.mark.parametrize("method", list(available_baseline_methods))
+def test_baseline_methods_batch(ramanshift, method):
+    rows = [make_fluorescent_intensity(ramanshift, scale=i) for i in (1, 2, 5)]
+    intensity = np.stack([i[0] for i in rows])
+    background = np.stack([i[1] for i in rows])
+    baseline, info = available_baseline_methods[method].calculate_baseline(intensity)
+    assert baseline.shape == intensity.shape
+    assert info["method"] == method
+    assert len(info["iterations"]) == len(intensity)
+    relative_error = np.abs(baseline - background).max(axis=1) / background.max(axis=1)
+    assert (relative_error < 0.1).all()
+    single_baseline, _ = available_baseline_methods[method].calculate_baseline(
+        intensity[1]
+    )
+    np.testing.assert_allclose(single_baseline, baseline[1])
+
+
+def test_baseline_method_per_region(ramanshift):
+    intensity, _ = make_fluorescent_intensity(ramanshift)
+    spectrum = SpectrumData(
+        ramanshift=ramanshift, intensity=intensity, label="test", region_name="full"
+    )
+    split_spectrum = SplitSpectrum(spectrum=spectrum)
+    methods = {"full": {"method": "arpls", "lam": 1e6}, "first_order": "als"}
+    blcorr = subtract_baseline_from_split_spectrum(split_spectrum, methods=methods)
+    linear = subtract_baseline_from_split_spectrum(split_spectrum)
+    full_key = "test_region_full"
+    assert blcorr.info[full_key]["method"] == "arpls"
+    assert blcorr.info[full_key]["lam"] == 1e6
+    assert blcorr.info["test_region_first_order"]["method"] == "als"
+    np.testing.assert_array_equal(
+        blcorr.spec_regions["test_region_low"].intensity,
+        linear.spec_regions["test_region_low"].intensity,
+    )
+    # the fluorescence background is removed, the linear baseline leaves a curve
+    full_intensity = blcorr.spec_regions[full_key].intensity
+    linear_full_intensity = linear.spec_regions[full_key].intensity
+    assert np.abs(np.median(full_intensity)) < 2
+    assert np.median(np.abs(full_intensity)) < np.median(np.abs(linear_full_intensity))
+
+    batch = SpectrumDataBatch.from_spectra([spectrum, spectrum])
+    batch_blcorr = subtract_baseline_from_batch_split(
+        BatchSplitSpectrum(spectrum=batch), methods=methods
+    )
+    np.testing.assert_allclose(
+        batch_blcorr.spec_regions[full_key].intensity[1], full_intensity, rtol=1e-5
+    )
+    with pytest.raises(ValueError):
+        subtract_baseline_from_split_spectrum(
+            split_spectrum, methods={"full": "spline"}
+        )
+
+
+def test_linear_baselines_match_linregress(ramanshift):
+    from scipy.stats import linregress
+
+    from raman_fitting.processing.baseline_subtraction import (
+        calculate_linear_baselines,
+        get_baseline_selection_for_region,
+    )
+
+    intensity, _ = make_fluorescent_intensity(ramanshift)
+    spectrum = SpectrumData(
+        ramanshift=ramanshift, intensity=intensity, label="test", region_name="full"
+    )
+    split_spectrum = SplitSpectrum(spectrum=spectrum)
+    spec_regions = split_spectrum.spec_regions
+    linear_params = calculate_linear_baselines(
+        spec_regions, split_spectrum.region_limits, spec_regions
+    )
+    for region_key, spec in spec_regions.items():
+        selected_key, region_config = get_baseline_selection_for_region(
+            spec.region_name, spec.label, spec_regions, split_spectrum.region_limits
+        )
+        selected = spec_regions[selected_key or region_key].intensity
+        margin = region_config.extra_margin
+        expected = linregress(
+            spec.ramanshift[[0, -1]],
+            [np.mean(selected[0:margin]), np.mean(selected[-margin:])],
+        )
+        # the edge means are now taken in float64 instead of float32
+        np.testing.assert_allclose(
+            linear_params[region_key]["slope"], expected.slope, rtol=1e-4
+        )
+        np.testing.assert_allclose(
+            linear_params[region_key]["intercept"], expected.intercept, rtol=1e-4
+        )
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.models.spectrum import SpectrumDataBatch
+from raman_fitting.processing.pipeline import ProcessingPipeline
+from raman_fitting.processing.post_processing import (
+    BatchSpectrumProcessor,
+    SpectrumProcessor,
+)
+
+
+@pytest.fixture
+def spectra(example_files):
+    files = sorted(i for i in example_files if i.stem.startswith("testDW38C"))
+    return [SpectrumReader(i).spectrum for i in files]
+
+
+def test_batch_from_spectra(spectra):
+    batch = SpectrumDataBatch.from_spectra(spectra)
+    assert len(batch) == len(spectra)
+    assert batch.intensity.shape == (len(spectra), len(spectra[0]))
+    assert batch.get_spectrum(1).source == spectra[1].source
+
+
+@pytest.mark.parametrize(
+    "pipeline",
+    [
+        None,
+        ProcessingPipeline(
+            steps=[
+                {"name": "filter", "enabled": False},
+                {"name": "despike", "kwargs": {"threshold_z_value": 3}},
+                {"name": "split"},
+                {"name": "baseline"},
+                {"name": "normalize", "kwargs": {"norm_method": "lorentzian"}},
+            ]
+        ),
+    ],
+)
+def test_batch_processor_matches_single(spectra, pipeline):
+    batch_processor = BatchSpectrumProcessor(
+        SpectrumDataBatch.from_spectra(spectra), pipeline=pipeline
+    )
+    assert [i.name for i in batch_processor.step_records] == [
+        i.name for i in batch_processor.pipeline.enabled_steps
+    ]
+    for n, spectrum in enumerate(spectra):
+        clean_spectrum = SpectrumProcessor(spectrum, pipeline=pipeline).clean_spectrum
+        batch_clean_spectrum = batch_processor.clean_spectrum.get_split_spectrum(n)
+        assert (
+            clean_spectrum.spec_regions.keys()
+            == batch_clean_spectrum.spec_regions.keys()
+        )
+        for key, spec in clean_spectrum.spec_regions.items():
+            batch_spec = batch_clean_spectrum.spec_regions[key]
+            assert spec.label == batch_spec.label
+            assert spec.region_name == batch_spec.region_name
+            np.testing.assert_array_equal(spec.ramanshift, batch_spec.ramanshift)
+            np.testing.assert_allclose(
+                spec.intensity, batch_spec.intensity, rtol=1e-5, atol=1e-5
+            )
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from raman_fitting.config import settings  # noqa: F401
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.models.splitter import (
+    SplitSpectrum,
+    get_default_spectrum_region_limits,
+)
+from raman_fitting.processing.binning import (
+    bin_spectrum,
+    bin_split_spectrum,
+    calculate_binning_weights,
+    get_axis_resolution,
+)
+
+
+@pytest.fixture
+def spectrum():
+    ramanshift = np.linspace(900, 2000, 1101)
+    intensity = 100 * np.exp(-((ramanshift - 1350) ** 2) / 800) + 150 / (
+        1 + ((ramanshift - 1590) / 20) ** 2
+    )
+    return SpectrumData(
+        ramanshift=ramanshift, intensity=intensity, label="raw", source="a"
+    )
+
+
+def test_binning_preserves_area(spectrum):
+    binned = bin_spectrum(spectrum, resolution=5)
+    assert len(binned) == 220
+    # equal bins over the 1101 cm-1 range of the cells
+    resolution = get_axis_resolution(binned.ramanshift)
+    assert resolution == pytest.approx(1101 / 220, rel=1e-4)
+    assert np.sum(binned.intensity) * resolution == pytest.approx(
+        np.sum(spectrum.intensity) * 1, rel=1e-5
+    )
+    # a peak of 30 cm-1 wide keeps its position and height
+    peak = binned.ramanshift[np.argmax(binned.intensity)]
+    assert peak == pytest.approx(1590, abs=2.5)
+    assert binned.intensity.max() == pytest.approx(spectrum.intensity.max(), rel=0.02)
+
+
+def test_binning_uneven_and_descending_axis():
+    ramanshift = np.sort(np.random.default_rng(1).uniform(0, 100, 300))[::-1]
+    weights = calculate_binning_weights(ramanshift, 10)
+    np.testing.assert_allclose(weights.apply(np.full(300, 3.0)), 3.0)
+    intensity = np.random.default_rng(2).normal(size=(3, 300))
+    binned = weights.apply(intensity)
+    np.testing.assert_allclose(binned[1], weights.apply(intensity[1]))
+    area = np.sum(intensity * weights.cell_widths[np.argsort(weights.order)], axis=1)
+    np.testing.assert_allclose(binned.sum(axis=1) * weights.resolution, area)
+
+
+def test_bin_batch_equals_single(spectrum):
+    spectra = [
+        spectrum.model_copy(
+            update={"intensity": spectrum.intensity * i, "source": str(i)}
+        )
+        for i in (1, 2)
+    ]
+    batch = bin_spectrum(SpectrumDataBatch.from_spectra(spectra), resolution=4)
+    for row, spec in zip(batch.intensity, spectra):
+        np.testing.assert_allclose(row, bin_spectrum(spec, 4).intensity, rtol=1e-6)
+
+
+def test_bin_split_spectrum(spectrum):
+    region_limits = get_default_spectrum_region_limits(
+        {
+            "first_order": {"min": 900, "max": 2000, "resolution": 4},
+            "normalization": {"min": 1500, "max": 1675},
+        }
+    )
+    split = SplitSpectrum(spectrum=spectrum, region_limits=region_limits)
+    binned = bin_split_spectrum(split)
+    first_key = [i for i in binned.spec_regions if i.endswith("first_order")][0]
+    norm_key = [i for i in binned.spec_regions if i.endswith("normalization")][0]
+    assert binned.info[first_key]["resolution"] == pytest.approx(4, rel=1e-3)
+    assert norm_key not in binned.info
+    assert binned.spec_regions[norm_key] is split.spec_regions[norm_key]
+    assert len(binned.spec_regions[first_key]) < len(split.spec_regions[first_key])
+    # a resolution finer than the measurement is left as is
+    assert bin_spectrum(spectrum, resolution=0.5) is spectrum
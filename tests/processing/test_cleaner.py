@@ -1,7 +1,14 @@
 import pytest
 
 import numpy as np
-from raman_fitting.processing.despike import SpectrumDespiker
+from raman_fitting.processing.despike import (
+    CrossSpectrumDespiker,
+    SpectrumDespiker,
+    calc_z_value_intensity,
+    despike_filter,
+    filter_z_intensity_values,
+    get_default_cross_despiker,
+)
 
 
 int_arrays = (
@@ -16,3 +23,78 @@ def test_despiker(array):
 
     desp_int = despiker.process_intensity(array)
     assert len(desp_int) == len(array)
+
+
+def despike_filter_loop(
+    intensity, filtered_z_intensity, moving_region_size, ignore_lims
+):
+    """reference implementation of despike_filter with a loop over the spikes"""
+    n = len(intensity)
+    i_despiked = intensity.copy()
+    for i in np.nonzero(np.isnan(filtered_z_intensity))[0]:
+        if i < ignore_lims[0] or i > ignore_lims[1]:
+            w = np.arange(
+                max(0, i - moving_region_size), min(n, i + moving_region_size)
+            )
+            w = w[~np.isnan(filtered_z_intensity[w])]
+            if intensity[w].any():
+                i_despiked[i] = np.mean(intensity[w])
+    return i_despiked
+
+
+@pytest.mark.parametrize("moving_region_size", (0, 1, 2, 3))
+def test_despike_filter_matches_loop(moving_region_size):
+    rng = np.random.default_rng(1)
+    intensity = rng.normal(500, 5, 300).astype(np.float32)
+    intensity[rng.integers(0, 300, 30)] += 1000
+    filtered_z = filter_z_intensity_values(calc_z_value_intensity(intensity), 4)
+    expected = despike_filter_loop(intensity, filtered_z, moving_region_size, (20, 46))
+    result = despike_filter(intensity, filtered_z, moving_region_size, (20, 46))
+    assert np.array_equal(result, expected)
+
+
+def test_despike_batch():
+    rng = np.random.default_rng(2)
+    intensity = rng.normal(500, 5, (4, 200))
+    intensity[:, 100] += 3000
+    despiker = SpectrumDespiker.model_construct()
+    batch_despiked = despiker.process_intensity_batch(intensity)
+    assert batch_despiked.shape == intensity.shape
+    for row, despiked_row in zip(intensity, batch_despiked):
+        assert np.array_equal(despiker.process_intensity(row), despiked_row)
+
+
+def test_despike_across_spectra():
+    rng = np.random.default_rng(5)
+    x = np.arange(500)
+    # a sharp peak in all positions, like Si, must be kept
+    signal = 50 * np.exp(-(((x - 250) / 10) ** 2)) + 300 * np.exp(
+        -(((x - 100) / 1) ** 2)
+    )
+    intensity = signal * np.array([[1.0], [1.05], [0.95], [1.02]]) + rng.normal(
+        0, 1, (4, 500)
+    )
+    spiked = intensity.copy()
+    spiked[1, 400] += 200
+    spiked[2, 300:304] += 80  # broad cosmic event
+
+    despiker = CrossSpectrumDespiker(threshold_z_value=6, dilate=1)
+    despiked, info = despiker.process_intensity_batch(spiked)
+    assert info["replaced_points"].tolist() == [0, 3, 6, 0]
+    assert info["spike_mask"][1, 399:402].all()
+    assert not info["spike_mask"][:, 95:105].any()
+    np.testing.assert_array_equal(despiked[[0, 3]], spiked[[0, 3]])
+    assert abs(despiked[1, 400] - intensity[1, 400]) < 10
+    assert np.abs(despiked[2, 300:304] - intensity[2, 300:304]).max() < 10
+
+    unchanged, info = despiker.process_intensity_batch(spiked[:2])
+    np.testing.assert_array_equal(unchanged, spiked[:2])
+    assert not info["spike_mask"].any()
+
+
+def test_default_cross_despiker(default_definitions):
+    cross_despiker = get_default_cross_despiker()
+    config = default_definitions["cross_despike"]
+    assert cross_despiker.enabled == config["enabled"]
+    assert cross_despiker.threshold_z_value == config["threshold_z_value"]
+    assert cross_despiker.dilate == config["dilate"]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.processing.filter import (
+    derivative_spectrum,
+    filter_spectrum,
+    filter_spectrum_batch,
+    get_savgol_kernel,
+    savgol_convolve,
+)
+
+
+@pytest.fixture
+def intensity():
+    rng = np.random.default_rng(7)
+    x = np.linspace(0, 10, 400)
+    peaks = np.exp(-((x - 4) ** 2)) + 0.5 * np.exp(-((x - 7) ** 2) / 0.1)
+    return peaks + 0.05 * rng.normal(size=(5, len(x)))
+
+
+@pytest.mark.parametrize("window_length", [13, 71])
+@pytest.mark.parametrize("deriv", [0, 1, 2])
+def test_savgol_convolve_matches_savgol_filter(intensity, window_length, deriv):
+    expected = signal.savgol_filter(
+        intensity, window_length, 3, deriv=deriv, delta=0.5, mode="nearest"
+    )
+    result = savgol_convolve(intensity, window_length, 3, deriv=deriv, delta=0.5)
+    np.testing.assert_allclose(result, expected, atol=1e-10)
+    np.testing.assert_allclose(
+        savgol_convolve(intensity[0], window_length, 3, deriv=deriv, delta=0.5),
+        expected[0],
+        atol=1e-10,
+    )
+
+
+def test_savgol_kernel_is_cached():
+    kernel = get_savgol_kernel(13, 3)
+    assert get_savgol_kernel(13, 3) is kernel
+    assert not kernel.flags.writeable
+    with pytest.raises(ValueError):
+        get_savgol_kernel(12, 3)
+
+
+def test_filter_spectrum_batch_equals_single(intensity):
+    ramanshift = np.linspace(1000, 1800, intensity.shape[1])
+    spectra = [
+        SpectrumData(ramanshift=ramanshift, intensity=row, label="raw", source=str(n))
+        for n, row in enumerate(intensity)
+    ]
+    batch = filter_spectrum_batch(SpectrumDataBatch.from_spectra(spectra))
+    for spec, row in zip(spectra, batch.intensity):
+        np.testing.assert_allclose(filter_spectrum(spec).intensity, row, rtol=1e-6)
+
+
+def test_derivative_spectrum():
+    ramanshift = np.linspace(1000, 2000, 501)
+    intensity = 1e-4 * (ramanshift - 1500) ** 2
+    spectrum = SpectrumData(
+        ramanshift=ramanshift, intensity=intensity, label="raw", source="a"
+    )
+    first = derivative_spectrum(spectrum, deriv=1)
+    assert first.label == "derivative1_raw"
+    np.testing.assert_allclose(
+        first.intensity[10:-10], 2e-4 * (ramanshift[10:-10] - 1500), atol=1e-3
+    )
+    second = derivative_spectrum(spectrum, deriv=2)
+    np.testing.assert_allclose(second.intensity[10:-10], 2e-4, atol=1e-5)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from raman_fitting.config import settings  # noqa: F401
+from raman_fitting.processing.noise import (
+    NoiseMethods,
+    NoiseSettings,
+    estimate_fit_weights,
+    estimate_noise_from_residual,
+    noise_to_weights,
+)
+
+
+@pytest.fixture
+def noisy_intensity():
+    rng = np.random.default_rng(3)
+    x = np.linspace(0, 1, 2000)
+    sigma = 0.01 + 0.09 * x
+    signal = np.exp(-((x - 0.3) ** 2) / 0.01)
+    return signal + sigma * rng.normal(size=(4, len(x))), sigma
+
+
+def test_estimate_noise_from_residual(noisy_intensity):
+    intensity, sigma = noisy_intensity
+    noise = estimate_noise_from_residual(intensity, local_window=101)
+    assert noise.shape == intensity.shape
+    ratio = np.median(noise[:, 100:-100] / sigma[100:-100])
+    assert ratio == pytest.approx(1, abs=0.1)
+    np.testing.assert_allclose(
+        estimate_noise_from_residual(intensity[1], local_window=101), noise[1]
+    )
+
+
+def test_noise_to_weights():
+    weights = noise_to_weights(np.array([[0.0, 1.0, 2.0, 4.0], [0.0, 0.0, 0.0, 0.0]]))
+    np.testing.assert_allclose(weights[0], [1 / 0.15, 1, 0.5, 0.25])
+    np.testing.assert_allclose(weights[1], 1)
+
+
+def test_estimate_fit_weights_from_spread(noisy_intensity):
+    intensity, sigma = noisy_intensity
+    spread_settings = NoiseSettings(method=NoiseMethods.POSITION_SPREAD)
+    weights = estimate_fit_weights(
+        intensity.mean(axis=0),
+        settings=spread_settings,
+        std_intensity=intensity.std(axis=0, ddof=1),
+        n_spectra=len(intensity),
+    )
+    assert np.median(weights[:200]) > 5 * np.median(weights[-200:])
+    # a single position falls back on the residual
+    single = estimate_fit_weights(
+        intensity[0], settings=spread_settings, std_intensity=None, n_spectra=1
+    )
+    np.testing.assert_allclose(single, estimate_fit_weights(intensity[0]))
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from raman_fitting.models.spectrum import SpectrumData, SpectrumDataBatch
+from raman_fitting.models.splitter import BatchSplitSpectrum, SplitSpectrum
+from raman_fitting.processing.normalization import (
+    estimate_lorentzian_height,
+    get_normalization_factor,
+    get_normalization_intensity_batch,
+    get_normalization_model_from_config,
+)
+from raman_fitting.processing.pipeline import get_default_processing_pipeline
+
+
+def lorentzian(x, height, center, sigma):
+    return height / (1 + ((x - center) / sigma) ** 2)
+
+
+@pytest.fixture
+def ramanshift():
+    return np.linspace(200, 3600, 1600)
+
+
+@pytest.fixture
+def intensity(ramanshift):
+    noise = np.random.default_rng(2).normal(0, 2, (3, len(ramanshift)))
+    heights = np.array([[100.0], [250.0], [40.0]])
+    return (
+        lorentzian(ramanshift, heights, 1582, 30)
+        + lorentzian(ramanshift, 0.6 * heights, 1350, 60)
+        + noise
+    )
+
+
+def test_estimate_lorentzian_height(ramanshift, intensity):
+    heights = estimate_lorentzian_height(ramanshift, intensity, (1500, 1600))
+    np.testing.assert_allclose(heights, [100.0, 250.0, 40.0], rtol=0.05)
+    single = estimate_lorentzian_height(ramanshift, intensity[1], (1500, 1600))
+    np.testing.assert_allclose(single, heights[1:2])
+    flat = estimate_lorentzian_height(
+        ramanshift, np.zeros_like(ramanshift), (1500, 1600)
+    )
+    assert np.isnan(flat).all()
+
+
+@pytest.fixture
+def normalization_model():
+    return get_default_processing_pipeline().normalization_model
+
+
+def test_normalization_model_from_config(default_definitions, default_models):
+    normalization_model = get_normalization_model_from_config(
+        default_definitions["normalization"]
+    )
+    assert normalization_model.name == default_models["normalization"]["norm"].name
+    assert normalization_model.peaks == default_models["normalization"]["norm"].peaks
+    with pytest.raises(ValueError):
+        get_normalization_model_from_config({"models": {}, "peaks": {}})
+
+
+def test_normalization_methods(ramanshift, intensity, normalization_model):
+    spectra = [
+        SpectrumData(
+            ramanshift=ramanshift, intensity=i, label="test", region_name="full"
+        )
+        for i in intensity
+    ]
+    split_spectrum = SplitSpectrum(spectrum=spectra[0])
+    simple = 1 / get_normalization_factor(split_spectrum, norm_method="simple")
+    fast = 1 / get_normalization_factor(
+        split_spectrum,
+        norm_method="lorentzian",
+        normalization_model=normalization_model,
+    )
+    fit = 1 / get_normalization_factor(
+        split_spectrum, norm_method="fit", normalization_model=normalization_model
+    )
+    assert fast == pytest.approx(100, rel=0.05)
+    assert fit == pytest.approx(fast, rel=0.1)
+    assert simple == pytest.approx(100, rel=0.1)
+    with pytest.raises(ValueError):
+        get_normalization_factor(split_spectrum, norm_method="unknown")
+    with pytest.raises(ValueError):
+        get_normalization_factor(split_spectrum, norm_method="lorentzian")
+
+    batch_split = BatchSplitSpectrum(spectrum=SpectrumDataBatch.from_spectra(spectra))
+    batch_fast = get_normalization_intensity_batch(
+        batch_split, norm_method="lorentzian", normalization_model=normalization_model
+    )
+    assert batch_fast[0] == pytest.approx(fast)
+    np.testing.assert_allclose(batch_fast, [100.0, 250.0, 40.0], rtol=0.05)
+
+
+def test_pipeline_normalization_model():
+    pipeline = get_default_processing_pipeline()
+    normalization_model = pipeline.normalization_model
+    assert pipeline.normalization_model is normalization_model
+    other_normalization = {
+        **pipeline.normalization,
+        "models": {"norm": "norm_G"},
+    }
+    other_pipeline = pipeline.model_copy(update={"normalization": other_normalization})
+    assert other_pipeline.normalization_model.peaks == "norm_G"
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.models.splitter import SplitSpectrum
+from raman_fitting.processing.baseline_subtraction import (
+    subtract_baseline_from_split_spectrum,
+)
+from raman_fitting.processing.binning import bin_split_spectrum
+from raman_fitting.processing.despike import SpectrumDespiker
+from raman_fitting.processing.filter import filter_spectrum
+from raman_fitting.processing.normalization import normalize_split_spectrum
+from raman_fitting.processing.pipeline import (
+    ProcessingPipeline,
+    get_default_processing_pipeline,
+)
+from raman_fitting.processing.post_processing import SpectrumProcessor
+
+
+@pytest.fixture
+def spectrum(example_files):
+    file = sorted(i for i in example_files if i.stem.startswith("testDW38C"))[0]
+    return SpectrumReader(file).spectrum
+
+
+def test_default_pipeline_matches_steps(spectrum):
+    pipeline = get_default_processing_pipeline()
+    assert [i.name for i in pipeline.enabled_steps] == [
+        "filter",
+        "despike",
+        "split",
+        "baseline",
+        "normalize",
+        "bin",
+    ]
+    processor = SpectrumProcessor(spectrum)
+    # the default steps, called one after the other
+    despiked = SpectrumDespiker(spectrum=filter_spectrum(spectrum=spectrum))
+    split_spectrum = SplitSpectrum(spectrum=despiked.processed_spectrum)
+    expected = bin_split_spectrum(
+        normalize_split_spectrum(
+            split_spectrum=subtract_baseline_from_split_spectrum(
+                split_spectrum=split_spectrum
+            )
+        )
+    )
+    assert processor.clean_spectrum.spec_regions.keys() == expected.spec_regions.keys()
+    for key, spec in expected.spec_regions.items():
+        np.testing.assert_array_equal(
+            processor.clean_spectrum.spec_regions[key].intensity, spec.intensity
+        )
+    assert [i.name for i in processor.step_records] == [
+        i.name for i in pipeline.enabled_steps
+    ]
+    assert all(i.duration >= 0 for i in processor.step_records)
+
+
+def test_pipeline_from_toml(tmp_path, spectrum):
+    toml_file = tmp_path / "processing.toml"
+    toml_file.write_text(
+        """
+[processing]
+track_memory = true
+
+[[processing.steps]]
+name = "despike"
+kwargs = {"threshold_z_value" = 5}
+
+[[processing.steps]]
+name = "filter"
+enabled = false
+
+[[processing.steps]]
+name = "split"
+
+[[processing.steps]]
+name = "baseline"
+"""
+    )
+    pipeline = ProcessingPipeline.from_toml(toml_file)
+    split_spectrum, records = pipeline.run(spectrum)
+    assert [i.name for i in records] == ["despike", "split", "baseline"]
+    assert all(i.peak_memory is not None for i in records)
+    assert all(not i.startswith("savgol") for i in split_spectrum.spec_regions)
+    assert all(
+        i.label.startswith("blcorr") for i in split_spectrum.spec_regions.values()
+    )
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [{"name": "filter"}],
+        [{"name": "split"}, {"name": "filter"}],
+        [{"name": "split"}, {"name": "unknown"}],
+    ],
+)
+def test_pipeline_invalid_steps(steps):
+    with pytest.raises(ValueError):
+        ProcessingPipeline(steps=steps)
+
+
+def test_processor_only_processes_selected_regions(spectrum, tmp_path):
+    full = SpectrumProcessor(spectrum)
+    selected = SpectrumProcessor(spectrum, region_names=["second_order"])
+    assert {i.split("region_")[-1] for i in selected.clean_spectrum.spec_regions} == {
+        "first_order",
+        "normalization",
+        "second_order",
+    }
+    for region_name in ("second_order", "full", "low"):
+        # the other regions are processed on first access
+        np.testing.assert_allclose(
+            selected.get_region(region_name).intensity,
+            full.get_region(region_name).intensity,
+            rtol=1e-6,
+        )
+    assert len(selected.clean_spectrum.spec_regions) == 5
+    with pytest.raises(ValueError):
+        SpectrumProcessor(spectrum, region_names=["no_region"])
+
+    from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
+
+    cache = ProcessedSpectrumCache(cache_dir=tmp_path)
+    assert cache.make_key(spectrum, region_names=["first_order"]) != cache.make_key(
+        spectrum
+    )
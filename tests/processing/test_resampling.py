@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from raman_fitting.imports.spectrum.spectra_collection import SpectraDataCollection
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.processing.aggregation import (
+    AggregationMethods,
+    AggregationSettings,
+)
+from raman_fitting.processing.resampling import (
+    GridRules,
+    ResampleSettings,
+    get_interpolation_weights,
+    make_common_grid,
+    resample_spectra,
+)
+
+
+def cubic(x):
+    return 2e-6 * (x - 1000) ** 3 - 1e-3 * (x - 1000) ** 2 + 0.5 * x + 3
+
+
+@pytest.fixture
+def axes():
+    rng = np.random.default_rng(3)
+    uneven = np.sort(np.linspace(900, 2000, 500) + rng.uniform(-0.5, 0.5, 500))
+    return [
+        np.linspace(900, 2000, 600),
+        np.linspace(905.3, 2010.7, 550),
+        uneven,
+    ]
+
+
+def test_make_common_grid(axes):
+    grid = make_common_grid(axes, GridRules.INTERSECTION, step=2.0)
+    assert grid[0] == pytest.approx(905.3)
+    assert grid[-1] <= 2000
+    np.testing.assert_allclose(np.diff(grid), 2.0)
+    union = make_common_grid(axes, GridRules.UNION, step=2.0)
+    assert union[0] == min(i[0] for i in axes) and union[-1] > 2008
+    assert make_common_grid(axes, GridRules.FIRST) is axes[0]
+    with pytest.raises(ValueError):
+        make_common_grid([np.arange(10.0), np.arange(20.0, 30.0)])
+
+
+@pytest.mark.parametrize("method,rtol", [("linear", 1e-3), ("cubic", 1e-9)])
+def test_resample_spectra(axes, method, rtol):
+    settings = ResampleSettings(method=method, grid_rule="union")
+    intensities = [cubic(i) for i in axes]
+    grid, resampled = resample_spectra(axes, intensities, settings=settings)
+    assert resampled.shape == (len(axes), len(grid))
+    for axis, row in zip(axes, resampled):
+        inside = (grid >= axis.min()) & (grid <= axis.max())
+        assert np.isnan(row[~inside]).all()
+        np.testing.assert_allclose(row[inside], cubic(grid[inside]), rtol=rtol)
+
+
+def test_interpolation_weights_are_cached(axes):
+    grid = make_common_grid(axes)
+    weights = get_interpolation_weights(axes[1], grid)
+    assert get_interpolation_weights(axes[1].copy(), grid.copy()) is weights
+    assert get_interpolation_weights(axes[1], grid, method="cubic") is not weights
+
+
+def test_collection_with_different_axes(axes):
+    spectra = [
+        SpectrumData(
+            ramanshift=axis,
+            intensity=cubic(axis),
+            label="test",
+            region_name="first_order",
+            source=f"pos{n}",
+        )
+        for n, axis in enumerate(axes)
+    ]
+    collection = SpectraDataCollection(spectra=spectra, region_name="first_order")
+    assert collection.resampled
+    mean_spectrum = collection.mean_spectrum
+    assert mean_spectrum.ramanshift[0] == pytest.approx(905.3)
+    np.testing.assert_allclose(
+        mean_spectrum.intensity, cubic(mean_spectrum.ramanshift), rtol=1e-3
+    )
+
+    same_axis = SpectraDataCollection(
+        spectra=spectra[:1] * 2, region_name="first_order"
+    )
+    assert not same_axis.resampled
+    np.testing.assert_array_equal(
+        same_axis.mean_spectrum.ramanshift, spectra[0].ramanshift
+    )
+
+
+@pytest.mark.parametrize("method", list(AggregationMethods))
+def test_collection_union_grid_without_overlap(method):
+    axes = [np.arange(1000.0, 1100.0, 2.0), np.arange(1200.0, 1300.0, 2.0)]
+    spectra = [
+        SpectrumData(
+            ramanshift=axis,
+            intensity=cubic(axis),
+            label="test",
+            region_name="first_order",
+            source=f"pos{n}",
+        )
+        for n, axis in enumerate(axes)
+    ]
+    collection = SpectraDataCollection(
+        spectra=spectra,
+        region_name="first_order",
+        resample=ResampleSettings(grid_rule=GridRules.UNION),
+        aggregation=AggregationSettings(method=method),
+    )
+    mean_spectrum = collection.mean_spectrum
+    # the gap between the axes is trimmed, the other points have one position each
+    np.testing.assert_array_equal(mean_spectrum.ramanshift, np.concatenate(axes))
+    np.testing.assert_allclose(
+        mean_spectrum.intensity, cubic(mean_spectrum.ramanshift), rtol=1e-6
+    )
+    assert not np.isnan(collection.std_intensity).any()
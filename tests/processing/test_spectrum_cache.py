@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from raman_fitting.imports.spectrumdata_parser import SpectrumReader
+from raman_fitting.processing.pipeline import get_default_processing_pipeline
+from raman_fitting.processing.post_processing import SpectrumProcessor
+from raman_fitting.processing.spectrum_cache import ProcessedSpectrumCache
+
+
+@pytest.fixture
+def spectrum(example_files):
+    file = sorted(i for i in example_files if i.stem.startswith("testDW38C"))[0]
+    return SpectrumReader(file).spectrum
+
+
+def test_processed_spectrum_cache(tmp_path, spectrum):
+    cache = ProcessedSpectrumCache(cache_dir=tmp_path)
+    key = cache.make_key(spectrum)
+    assert cache.load(key) is None
+
+    processed = SpectrumProcessor(spectrum, cache=cache)
+    assert cache.get_cache_file(key).exists()
+
+    cached = SpectrumProcessor(spectrum, cache=cache)
+    assert cached.clean_spectrum.spec_regions.keys() == (
+        processed.clean_spectrum.spec_regions.keys()
+    )
+    for region_key, spec in processed.clean_spectrum.spec_regions.items():
+        cached_spec = cached.clean_spectrum.spec_regions[region_key]
+        assert cached_spec.label == spec.label
+        assert cached_spec.region_name == spec.region_name
+        assert cached_spec.source == spectrum.source
+        np.testing.assert_array_equal(cached_spec.ramanshift, spec.ramanshift)
+        np.testing.assert_array_equal(cached_spec.intensity, spec.intensity)
+
+    other_config = ProcessedSpectrumCache(cache_dir=tmp_path, config_hash="0" * 64)
+    assert other_config.make_key(spectrum) != key
+    assert other_config.load(other_config.make_key(spectrum)) is None
+
+    # the norm model of the normalization config is part of the key
+    pipeline = get_default_processing_pipeline()
+    normalization = pipeline.normalization
+    other_peaks = {
+        **normalization["peaks"],
+        "norm_G": {**normalization["peaks"]["norm_G"], "peak_type": "Gaussian"},
+    }
+    other_normalization = pipeline.model_copy(
+        update={"normalization": {**normalization, "peaks": other_peaks}}
+    )
+    assert cache.make_key(spectrum, pipeline=other_normalization) != key
+
+    assert cache.clear() == 1
+    assert cache.load(key) is None
@@ -1,7 +1,10 @@
+import numpy as np
 import pytest
 
 from raman_fitting.imports.spectrumdata_parser import SpectrumReader
 from raman_fitting.models.deconvolution.spectrum_regions import RegionNames
+from raman_fitting.models.spectrum import SpectrumData
+from raman_fitting.processing.post_processing import SpectrumProcessor
 
 
 def test_spectrum_data_loader_empty():
@@ -16,3 +19,24 @@ def test_spectrum_data_loader_file(example_files):
         assert len(sprdr.spectrum.ramanshift) == 1600
         assert sprdr.spectrum.source == file
         assert sprdr.spectrum.region_name == RegionNames.full
+
+
+def test_spectrum_data_construct_trusted():
+    ramanshift = np.linspace(200, 3600, 10, dtype=np.float32)
+    with pytest.raises(ValueError):
+        SpectrumData(ramanshift=ramanshift, intensity=np.full(10, np.nan), label="nan")
+
+    spectrum = SpectrumData.construct_trusted(
+        ramanshift=ramanshift, intensity=np.arange(10.0), label="trusted"
+    )
+    assert spectrum.ramanshift is ramanshift
+    assert spectrum.intensity.dtype == np.float32
+    assert len(spectrum) == 10
+
+
+def test_processed_spectrum_regions_are_float32(example_files):
+    spectrum = SpectrumReader(example_files[0]).spectrum
+    clean_spectrum = SpectrumProcessor(spectrum).clean_spectrum
+    for spec in clean_spectrum.spec_regions.values():
+        assert spec.intensity.dtype == np.float32
+        assert len(spec.ramanshift) == len(spec.intensity)